@@ -1,9 +1,41 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, redirect, url_for, jsonify, abort
 import mysql.connector
+import base64
+import json
 import os
+from datetime import datetime
+
+import rollups
+from rollups import RollupIngester
+from snapshot import Snapshot
+from streaming import stream_merged
+from timeseries import BUCKETS, METRICS, TimeseriesCache, bucket_start, next_bucket
 
 app = Flask(__name__)
 
+# Dashboard figures are recomputed in the background this often and served from memory
+DASHBOARD_REFRESH_SECONDS = float(os.environ.get("DASHBOARD_REFRESH_SECONDS", 30))
+
+# Order rollups are folded in incrementally from changed orders rows
+ROLLUP_INTERVAL = float(os.environ.get("ROLLUP_INTERVAL", 5))
+ROLLUP_BATCH_SIZE = int(os.environ.get("ROLLUP_BATCH_SIZE", 1000))
+# Order transactions make no downstream calls, so this only has to cover commit lag
+# and the one-second granularity of orders.updated_at
+ROLLUP_SETTLE_SECONDS = float(os.environ.get("ROLLUP_SETTLE_SECONDS", 5))
+
+# /api/timeseries: closed buckets are cached, the open one is always recomputed
+TIMESERIES_CLOSED_TTL = float(os.environ.get("TIMESERIES_CLOSED_TTL", 600))
+TIMESERIES_MAX_BUCKETS = int(os.environ.get("TIMESERIES_MAX_BUCKETS", 2000))
+ORDER_STATUSES = ("pending", "completed", "cancelled")
+
+# Detail pages are keyset-paginated; exports stream up to a row cap. Both run
+# under a server-side max_execution_time so a runaway query cannot hog MySQL.
+STAT_PAGE_SIZE = int(os.environ.get("STAT_PAGE_SIZE", 100))
+STAT_MAX_PAGE_SIZE = int(os.environ.get("STAT_MAX_PAGE_SIZE", 1000))
+STAT_QUERY_TIMEOUT_MS = int(os.environ.get("STAT_QUERY_TIMEOUT_MS", 5000))
+STAT_EXPORT_TIMEOUT_MS = int(os.environ.get("STAT_EXPORT_TIMEOUT_MS", 120000))
+STAT_EXPORT_MAX_ROWS = int(os.environ.get("STAT_EXPORT_MAX_ROWS", 1000000))
+
 def get_db_connection():
     """Establishes a connection to the MySQL database."""
     return mysql.connector.connect(
@@ -14,151 +46,427 @@ def get_db_connection():
         port=int(os.environ.get("MYSQL_PORT", 3306))
     )
 
-@app.route('/')
-def dashboard():
-    """Renders the main dashboard with various statistics."""
+def init_db():
+    """Creates the rollup tables this service maintains."""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        for statement in rollups.CREATE_TABLES_SQL:
+            cursor.execute(statement)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        print("Metrics rollup tables initialized successfully")
+    except Exception as e:
+        print(f"Error initializing DB: {e}")
+
+rollup_ingester = RollupIngester(
+    get_db_connection,
+    batch_size=ROLLUP_BATCH_SIZE,
+    interval=ROLLUP_INTERVAL,
+    settle_seconds=ROLLUP_SETTLE_SECONDS
+)
+
+timeseries_cache = TimeseriesCache(
+    get_db_connection,
+    settle_seconds=ROLLUP_SETTLE_SECONDS,
+    closed_ttl=TIMESERIES_CLOSED_TTL
+)
+
+def compute_dashboard_stats():
+    """Computes every dashboard figure in four queries, none of them over raw orders."""
     stats = {}
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    # Total users
-    cursor.execute("SELECT COUNT(*) AS total_users FROM users")
-    stats['Total Users'] = cursor.fetchone()['total_users']
+    # Order counts and amounts from the per-day rollup
+    cursor.execute("""
+        SELECT SUM(orders) AS total_orders,
+               SUM(CASE WHEN status='completed' THEN orders END) AS completed_orders,
+               SUM(CASE WHEN status='pending' THEN orders END) AS pending_orders,
+               SUM(CASE WHEN status='cancelled' THEN orders END) AS cancelled_orders,
+               SUM(CASE WHEN status='completed' THEN revenue END) AS revenue,
+               SUM(CASE WHEN day >= DATE_FORMAT(NOW(), '%Y-%m-01') THEN orders END) AS this_month
+        FROM metrics_daily_orders
+    """)
+    orders = cursor.fetchone()
+    completed = int(orders['completed_orders'] or 0)
+    orders['avg_order'] = orders['revenue'] / completed if completed else 0
+
+    # One pass over products, plus the user count
+    cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM users) AS total_users,
+               COUNT(*) AS total_products,
+               SUM(stock) AS total_stock,
+               COUNT(DISTINCT category) AS categories
+        FROM products
+    """)
+    totals = cursor.fetchone()
 
-    # Total products
-    cursor.execute("SELECT COUNT(*) AS total_products FROM products")
-    stats['Total Products'] = cursor.fetchone()['total_products']
+    # The single-row leaders in one round trip
+    cursor.execute("""
+        (SELECT 'richest_user' AS leader, name, cash_balance AS value FROM users ORDER BY cash_balance DESC LIMIT 1)
+        UNION ALL
+        (SELECT 'most_expensive', name, price FROM products ORDER BY price DESC LIMIT 1)
+        UNION ALL
+        (SELECT 'low_stock', name, stock FROM products ORDER BY stock ASC LIMIT 1)
+    """)
+    leaders = {row["leader"]: row for row in cursor.fetchall()}
 
-    # Total orders
-    cursor.execute("SELECT COUNT(*) AS total_orders FROM orders")
-    stats['Total Orders'] = cursor.fetchone()['total_orders']
+    # Top product by sales
+    cursor.execute("""
+        SELECT p.name, s.total_sold
+        FROM (SELECT product_id, SUM(quantity) AS total_sold
+              FROM metrics_daily_product_sales
+              WHERE status='completed'
+              GROUP BY product_id) s
+        JOIN products p ON s.product_id = p.id
+        ORDER BY s.total_sold DESC LIMIT 1
+    """)
+    top_product = cursor.fetchone()
 
-    # Completed orders
-    cursor.execute("SELECT COUNT(*) AS completed_orders FROM orders WHERE status='completed'")
-    stats['Completed Orders'] = cursor.fetchone()['completed_orders']
+    cursor.close()
+    conn.close()
 
-    # Pending orders
-    cursor.execute("SELECT COUNT(*) AS pending_orders FROM orders WHERE status='pending'")
-    stats['Pending Orders'] = cursor.fetchone()['pending_orders']
+    richest = leaders.get("richest_user")
+    expensive = leaders.get("most_expensive")
+    low_stock = leaders.get("low_stock")
 
-    # Cancelled orders
-    cursor.execute("SELECT COUNT(*) AS cancelled_orders FROM orders WHERE status='cancelled'")
-    stats['Cancelled Orders'] = cursor.fetchone()['cancelled_orders']
+    stats['Total Users'] = totals['total_users']
+    stats['Total Products'] = totals['total_products']
+    stats['Total Orders'] = int(orders['total_orders'] or 0)
+    stats['Completed Orders'] = int(orders['completed_orders'] or 0)
+    stats['Pending Orders'] = int(orders['pending_orders'] or 0)
+    stats['Cancelled Orders'] = int(orders['cancelled_orders'] or 0)
+    stats['Total Revenue'] = f"₹{float(orders['revenue'] or 0):.2f}"
+    stats['Top Product'] = f"{top_product['name']} ({top_product['total_sold']})" if top_product else "N/A"
+    stats['Richest User'] = f"{richest['name']} (₹{richest['value']:.2f})" if richest else "N/A"
+    stats['Avg Order Value'] = f"₹{float(orders['avg_order'] or 0):.2f}"
+    stats['Total Stock'] = totals['total_stock']
+    stats['Most Expensive Product'] = f"{expensive['name']} (₹{expensive['value']:.2f})" if expensive else "N/A"
+    stats['Low Stock Product'] = f"{low_stock['name']} ({int(low_stock['value'])})" if low_stock else "N/A"
+    stats['Total Categories'] = totals['categories']
+    stats['Orders This Month'] = int(orders['this_month'] or 0)
+    return stats
 
-    # Total revenue
-    cursor.execute("SELECT SUM(total_price) AS revenue FROM orders WHERE status='completed'")
-    stats['Total Revenue'] = f"₹{float(cursor.fetchone()['revenue'] or 0):.2f}"
+dashboard_snapshot = Snapshot("dashboard", compute_dashboard_stats, interval=DASHBOARD_REFRESH_SECONDS)
 
-    # Top product by sales
-    cursor.execute("""
-        SELECT p.name, SUM(o.quantity) as total_sold
-        FROM orders o
-        JOIN products p ON o.product_id = p.id
-        WHERE o.status='completed'
-        GROUP BY p.id, p.name
-        ORDER BY total_sold DESC LIMIT 1
-    """)
-    row = cursor.fetchone()
-    stats['Top Product'] = f"{row['name']} ({row['total_sold']})" if row else "N/A"
+@app.route('/')
+def dashboard():
+    """Renders the main dashboard from the in-memory snapshot."""
+    stats, age = dashboard_snapshot.get()
+    return render_template("dashboard.html", stats=stats, snapshot_age=age)
 
-    # Richest user
-    cursor.execute("SELECT name, cash_balance FROM users ORDER BY cash_balance DESC LIMIT 1")
-    row = cursor.fetchone()
-    stats['Richest User'] = f"{row['name']} (₹{row['cash_balance']:.2f})" if row else "N/A"
+@app.route('/refresh', methods=['POST'])
+def refresh_dashboard():
+    """Recomputes the dashboard snapshot on demand."""
+    dashboard_snapshot.refresh()
+    return redirect(url_for("dashboard"))
 
-    # Avg order value
-    cursor.execute("SELECT AVG(total_price) AS avg_order FROM orders WHERE status='completed'")
-    stats['Avg Order Value'] = f"₹{float(cursor.fetchone()['avg_order'] or 0):.2f}"
+@app.route('/api/timeseries')
+def api_timeseries():
+    """Bucketed order counts or revenue: ?metric=orders|revenue&bucket=hour|day|month&from=&to=&status=
 
-    # Total stock
-    cursor.execute("SELECT SUM(stock) AS total_stock FROM products")
-    stats['Total Stock'] = cursor.fetchone()['total_stock']
+    from is inclusive and to exclusive (ISO dates or datetimes); both are widened
+    to whole buckets. Defaults to the last day, month or year up to now.
+    Buckets without orders are returned as zero.
+    """
+    metric = request.args.get("metric", "orders")
+    bucket = request.args.get("bucket", "day")
+    status = request.args.get("status") or None
+    if metric not in METRICS:
+        return jsonify({"error": f"metric must be one of {', '.join(METRICS)}"}), 400
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    if status and status not in ORDER_STATUSES:
+        return jsonify({"error": f"status must be one of {', '.join(ORDER_STATUSES)}"}), 400
+    try:
+        end = datetime.fromisoformat(request.args["to"]) if request.args.get("to") else datetime.now()
+        start = datetime.fromisoformat(request.args["from"]) if request.args.get("from") else end - BUCKETS[bucket][1]
+    except ValueError as e:
+        return jsonify({"error": f"Invalid from/to: {e}"}), 400
+    if start >= end:
+        return jsonify({"error": "from must be before to"}), 400
 
-    # Most expensive product
-    cursor.execute("SELECT name, price FROM products ORDER BY price DESC LIMIT 1")
-    row = cursor.fetchone()
-    stats['Most Expensive Product'] = f"{row['name']} (₹{row['price']:.2f})" if row else "N/A"
+    # Rough upper bound on the bucket count, checked before building the series
+    approx = (end - start).total_seconds() / {"hour": 3600, "day": 86400, "month": 28 * 86400}[bucket]
+    if approx > TIMESERIES_MAX_BUCKETS:
+        return jsonify({"error": f"At most {TIMESERIES_MAX_BUCKETS} buckets per request"}), 400
 
-    # Least stock product
-    cursor.execute("SELECT name, stock FROM products ORDER BY stock ASC LIMIT 1")
-    row = cursor.fetchone()
-    stats['Low Stock Product'] = f"{row['name']} ({row['stock']})" if row else "N/A"
+    try:
+        points = timeseries_cache.series(metric, bucket, start, end, status)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    # Total categories
-    cursor.execute("SELECT COUNT(DISTINCT category) AS categories FROM products")
-    stats['Total Categories'] = cursor.fetchone()['categories']
+    open_bucket = bucket_start(datetime.now(), bucket)
+    return jsonify({
+        "metric": metric,
+        "bucket": bucket,
+        "status": status,
+        "from": bucket_start(start, bucket).isoformat(),
+        "to": next_bucket(points[-1][0], bucket).isoformat(),
+        "open_bucket": open_bucket.isoformat() if points[0][0] <= open_bucket <= points[-1][0] else None,
+        "points": [{"start": s.isoformat(), "value": float(v) if metric == "revenue" else int(v)}
+                   for s, v in points]
+    })
 
-    # Orders this month
-    cursor.execute("SELECT COUNT(*) AS this_month FROM orders WHERE MONTH(created_at)=MONTH(NOW()) AND YEAR(created_at)=YEAR(NOW())")
-    stats['Orders This Month'] = cursor.fetchone()['this_month']
+@app.route('/health/snapshot')
+def snapshot_stats():
+    return jsonify(dashboard_snapshot.stats())
 
-    cursor.close()
-    conn.close()
+@app.route('/health/rollups')
+def rollup_stats():
+    return jsonify(rollup_ingester.stats())
 
-    return render_template("dashboard.html", stats=stats)
+@app.route('/health/timeseries')
+def timeseries_stats():
+    return jsonify(timeseries_cache.stats())
+
+# Detail views over plain or aggregated tables: (query, keyset ordering). Each
+# ordering ends in a unique column so the keyset cursor is unambiguous. Orderings
+# over a plain table use NOT NULL columns with a matching (column, id) index (see
+# mysql/init.sql): a NULL never satisfies the keyset predicate, so such rows
+# would drop out after the first page.
+STAT_VIEWS = {
+    "users": ("SELECT id, name, email, cash_balance, created_at FROM users",
+              [("created_at", "DESC"), ("id", "DESC")]),
+    "products": ("SELECT id, name, price, stock, category FROM products",
+                 [("name", "ASC"), ("id", "ASC")]),
+    "top-products": ("""
+        SELECT p.id, p.name, p.category, s.total_sold, s.total_revenue
+        FROM (SELECT product_id, SUM(quantity) AS total_sold, SUM(revenue) AS total_revenue
+              FROM metrics_daily_product_sales
+              WHERE status='completed'
+              GROUP BY product_id) s
+        JOIN products p ON s.product_id = p.id
+    """, [("total_sold", "DESC"), ("id", "ASC")]),
+    "richest-users": ("SELECT id, name, email, cash_balance FROM users",
+                      [("cash_balance", "DESC"), ("id", "DESC")]),
+    "low-stock-products": ("SELECT id, name, stock, price, category FROM products",
+                           [("stock", "ASC"), ("id", "ASC")]),
+    "most-expensive-products": ("SELECT id, name, price, stock, category FROM products",
+                                [("price", "DESC"), ("id", "DESC")]),
+    "categories": ("""
+        SELECT COALESCE(category, '') AS category, COUNT(*) as product_count, SUM(stock) as total_stock
+        FROM products
+        GROUP BY category
+    """, [("product_count", "DESC"), ("category", "ASC")]),
+}
+
+# Order detail views: a filter on all_orders, as (SQL, params factory)
+ORDER_VIEWS = {
+    "orders": ("1=1", lambda: []),
+    "completed-orders": ("status='completed'", lambda: []),
+    "pending-orders": ("status='pending'", lambda: []),
+    "cancelled-orders": ("status='cancelled'", lambda: []),
+    # Half-open range on created_at, so the created_at indexes can be used
+    "monthly-orders": ("created_at >= %s AND created_at < %s",
+                       lambda: [bucket_start(datetime.now(), "month"),
+                                next_bucket(bucket_start(datetime.now(), "month"), "month")]),
+}
+ORDER_KEYSET = [("created_at", "DESC"), ("id", "DESC")]
+
+def get_guarded_connection(timeout_ms):
+    """A connection whose SELECTs the server aborts after timeout_ms."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION max_execution_time = %s", (int(timeout_ms),))
+        cursor.close()
+    except mysql.connector.Error:
+        conn.close()
+        raise
+    return conn
+
+def encode_after(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def decode_after(token):
+    """Decodes a cursor from encode_after; raises ValueError when malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+def keyset(ordering, after):
+    """WHERE clause and params selecting rows strictly after `after` in `ordering`."""
+    (first, first_dir), (second, second_dir) = ordering
+    first_op = "<" if first_dir == "DESC" else ">"
+    second_op = "<" if second_dir == "DESC" else ">"
+    return (f"({first} {first_op} %s OR ({first} = %s AND {second} {second_op} %s))",
+            [after[0], after[0], after[1]])
+
+def order_by(ordering):
+    return ", ".join(f"{column} {direction}" for column, direction in ordering)
+
+def fetch_orders_page(cursor, where, params, after, limit):
+    """One page of orders with user and product names, in a fixed number of small queries.
+
+    The page is chosen first, from each of orders and orders_archive by index
+    (a LIMIT cannot be pushed through the all_orders view). Names are then
+    looked up for that page's ids only.
+    """
+    if after:
+        clause, keyset_params = keyset(ORDER_KEYSET, after)
+        where, params = f"{where} AND {clause}", params + keyset_params
+    part = ("SELECT id, user_id, total_price, status, created_at FROM {table} "
+            f"WHERE {where} ORDER BY {order_by(ORDER_KEYSET)} LIMIT %s")
+    cursor.execute(
+        f"({part.format(table='orders')}) UNION ALL ({part.format(table='orders_archive')}) "
+        f"ORDER BY {order_by(ORDER_KEYSET)} LIMIT %s",
+        (params + [limit]) * 2 + [limit]
+    )
+    orders = cursor.fetchall()
+    if not orders:
+        return []
+
+    ids = [o["id"] for o in orders]
+    placeholders = ", ".join(["%s"] * len(ids))
+    line_part = ("SELECT i.order_id, i.id, i.product_id, p.name, i.quantity FROM {table} i "
+                 f"LEFT JOIN products p ON p.id = i.product_id WHERE i.order_id IN ({placeholders})")
+    cursor.execute(
+        f"{line_part.format(table='order_items')} UNION ALL {line_part.format(table='order_items_archive')} "
+        "ORDER BY order_id, id",
+        ids + ids
+    )
+    lines = {}
+    for line in cursor.fetchall():
+        lines.setdefault(line["order_id"], []).append(line)
+
+    user_ids = list({o["user_id"] for o in orders})
+    cursor.execute(f"SELECT id, name FROM users WHERE id IN ({', '.join(['%s'] * len(user_ids))})", user_ids)
+    users = {u["id"]: u["name"] for u in cursor.fetchall()}
+
+    return [{
+        "id": o["id"],
+        "user": users.get(o["user_id"]),
+        "products": ", ".join(line["name"] or f"Product #{line['product_id']}"
+                              for line in lines.get(o["id"], [])) or None,
+        "quantity": sum(line["quantity"] for line in lines.get(o["id"], [])),
+        "total_price": o["total_price"],
+        "status": o["status"],
+        "created_at": o["created_at"],
+    } for o in orders]
+
+def orders_export_sql(where, table, items_table):
+    """The full order join over one of orders/orders_archive, newest first, for exports.
+
+    Lines are summarised per row by correlated subqueries rather than a
+    GROUP BY, so the rows come straight off the created_at index in order and
+    can be streamed without the server sorting the whole table first.
+    """
+    return f"""
+        SELECT o.id, u.name as user,
+               (SELECT GROUP_CONCAT(p.name ORDER BY i.id SEPARATOR ', ')
+                FROM {items_table} i LEFT JOIN products p ON i.product_id=p.id
+                WHERE i.order_id=o.id) as products,
+               (SELECT SUM(i.quantity) FROM {items_table} i WHERE i.order_id=o.id) as quantity,
+               o.total_price, o.status, o.created_at
+        FROM (SELECT * FROM {table} WHERE {where}) o
+        LEFT JOIN users u ON o.user_id=u.id
+        ORDER BY {order_by([("o.created_at", "DESC"), ("o.id", "DESC")])}
+        LIMIT %s
+    """
+
+def export_error(err):
+    """JSON error for an export that failed before its first row was sent."""
+    if err.errno == 3024:  # ER_QUERY_TIMEOUT
+        return jsonify({"error": "The query took too long and was stopped."}), 503
+    return jsonify({"error": f"The statistics database is unavailable: {err.msg}"}), 503
 
 @app.route('/stat/<string:stat_name>')
 def stat_detail(stat_name):
-    """Renders a detail page for a specific statistic."""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    rows = []
-    columns = []
-
-    # Base query for joining orders with users and products
-    orders_query = """
-        SELECT o.id, u.name as user, p.name as product, o.quantity, o.total_price, o.status, o.created_at
-        FROM orders o
-        JOIN users u ON o.user_id=u.id
-        JOIN products p ON o.product_id=p.id
+    """Renders one keyset-paginated page of a statistic: ?after=&limit=.
+
+    With ?format=csv or ?format=ndjson every row (up to STAT_EXPORT_MAX_ROWS) is
+    streamed instead. Both modes run under a server-side max_execution_time.
     """
+    if stat_name not in STAT_VIEWS and stat_name not in ORDER_VIEWS:
+        abort(404)
+    title = stat_name.replace('-', ' ').title()
 
-    if stat_name == "users":
-        cursor.execute("SELECT id, name, email, cash_balance, created_at FROM users ORDER BY created_at DESC")
-    elif stat_name == "products":
-        cursor.execute("SELECT id, name, price, stock, category FROM products ORDER BY name")
-    elif stat_name == "orders":
-        cursor.execute(f"{orders_query} ORDER BY o.created_at DESC")
-    elif stat_name == "completed-orders":
-        cursor.execute(f"{orders_query} WHERE o.status='completed' ORDER BY o.created_at DESC")
-    elif stat_name == "pending-orders":
-        cursor.execute(f"{orders_query} WHERE o.status='pending' ORDER BY o.created_at DESC")
-    elif stat_name == "cancelled-orders":
-        cursor.execute(f"{orders_query} WHERE o.status='cancelled' ORDER BY o.created_at DESC")
-    elif stat_name == "top-products":
-        cursor.execute("""
-            SELECT p.name, p.category, SUM(o.quantity) as total_sold, SUM(o.total_price) as total_revenue
-            FROM orders o
-            JOIN products p ON o.product_id = p.id
-            WHERE o.status='completed'
-            GROUP BY p.id, p.name, p.category
-            ORDER BY total_sold DESC
-        """)
-    elif stat_name == "richest-users":
-        cursor.execute("SELECT id, name, email, cash_balance FROM users ORDER BY cash_balance DESC")
-    elif stat_name == "low-stock-products":
-        cursor.execute("SELECT id, name, stock, price, category FROM products ORDER BY stock ASC")
-    elif stat_name == "most-expensive-products":
-        cursor.execute("SELECT id, name, price, stock, category FROM products ORDER BY price DESC")
-    elif stat_name == "categories":
-        cursor.execute("""
-            SELECT category, COUNT(*) as product_count, SUM(stock) as total_stock
-            FROM products
-            GROUP BY category
-            ORDER BY product_count DESC
-        """)
-    elif stat_name == "monthly-orders":
-        cursor.execute(f"{orders_query} WHERE MONTH(o.created_at)=MONTH(NOW()) AND YEAR(o.created_at)=YEAR(NOW()) ORDER BY o.created_at DESC")
-    
-    rows = cursor.fetchall()
-    if rows:
-        columns = rows[0].keys()
+    fmt = request.args.get("format")
+    if fmt in ("csv", "ndjson"):
+        if stat_name in ORDER_VIEWS:
+            # The hot and archive tables are streamed side by side and merged on the way out
+            where, params_factory = ORDER_VIEWS[stat_name]
+            params = params_factory() + [STAT_EXPORT_MAX_ROWS]
+            queries = [(orders_export_sql(where, table, items_table), params)
+                       for table, items_table in (("orders", "order_items"), ("orders_archive", "order_items_archive"))]
+            order = ("created_at", "id")
+        else:
+            base, ordering = STAT_VIEWS[stat_name]
+            queries = [(f"SELECT * FROM ({base}) t ORDER BY {order_by(ordering)} LIMIT %s", [STAT_EXPORT_MAX_ROWS])]
+            order = ()
 
-    cursor.close()
-    conn.close()
+        conns = []
+        try:
+            for _ in queries:
+                conns.append(get_guarded_connection(STAT_EXPORT_TIMEOUT_MS))
+        except mysql.connector.Error as err:
+            for conn in conns:
+                conn.close()
+            return export_error(err)
+        try:
+            # stream_merged owns the connections from here and closes them if a query fails
+            response = stream_merged([(conn, sql, params) for conn, (sql, params) in zip(conns, queries)],
+                                     order=order, descending=True, fmt=fmt,
+                                     max_rows=STAT_EXPORT_MAX_ROWS)
+        except mysql.connector.Error as err:
+            return export_error(err)
+        if fmt == "csv":
+            response.headers["Content-Disposition"] = f'attachment; filename="{stat_name}.csv"'
+        return response
+
+    try:
+        limit = min(int(request.args.get("limit", STAT_PAGE_SIZE)), STAT_MAX_PAGE_SIZE)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        after = decode_after(request.args["after"]) if request.args.get("after") else None
+    except ValueError as e:
+        return render_template("detail.html", stat_name=title, stat_slug=stat_name, columns=[], rows=[],
+                               error=str(e)), 400
+
+    conn = get_guarded_connection(STAT_QUERY_TIMEOUT_MS)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # One row beyond the page tells whether a next page exists
+        if stat_name in ORDER_VIEWS:
+            where, params_factory = ORDER_VIEWS[stat_name]
+            rows = fetch_orders_page(cursor, where, params_factory(), after, limit + 1)
+            ordering = ORDER_KEYSET
+        else:
+            base, ordering = STAT_VIEWS[stat_name]
+            where, params = ("1=1", []) if after is None else keyset(ordering, after)
+            cursor.execute(f"SELECT * FROM ({base}) t WHERE {where} ORDER BY {order_by(ordering)} LIMIT %s",
+                           params + [limit + 1])
+            rows = cursor.fetchall()
+    except mysql.connector.Error as err:
+        if err.errno != 3024:  # ER_QUERY_TIMEOUT
+            raise
+        return render_template("detail.html", stat_name=title, stat_slug=stat_name, columns=[], rows=[],
+                               error="The query took too long and was stopped."), 503
+    finally:
+        cursor.close()
+        conn.close()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = encode_after([rows[-1][column] for column, _ in ordering])
+    columns = list(rows[0].keys()) if rows else []
 
-    return render_template("detail.html", stat_name=stat_name.replace('-', ' ').title(), columns=columns, rows=rows)
+    return render_template("detail.html", stat_name=title, stat_slug=stat_name, columns=columns, rows=rows,
+                           next_after=next_after, limit=limit, paged=bool(after))
 
 if __name__ == "__main__":
+    # The debug reloader runs this file twice; only the serving child keeps the snapshot warm
+    init_db()
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        rollup_ingester.start()
+        dashboard_snapshot.start()
     # Run inside container on port 5000
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,244 @@
+"""Incrementally maintained order rollups.
+
+metrics_daily_orders holds order counts and revenue per (day, status), and
+metrics_daily_product_sales holds quantities and line revenue per
+(day, product, status). Aggregate reads therefore cost O(days x products)
+however many orders exist.
+
+A RollupIngester thread follows orders and orders_archive together by one
+(updated_at, id) watermark and applies each new or changed order as a delta.
+The archiver moves rows with their updated_at unchanged, so an order the
+watermark has not reached yet is still ahead of it in whichever table holds
+it by then. metrics_order_state remembers what was last counted for every
+order, so a status change moves the order's contribution from its old status
+to the new one. Re-ingesting an order that has not changed is a no-op, which
+makes redelivery harmless.
+
+Order lines are written once, when the order completes, and never change
+afterwards. That is what lets a previously counted order's contribution be
+subtracted using its current lines. Orders deleted outright (for example
+through a user delete cascade) stay in the rollups as history.
+"""
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+import mysql.connector
+
+CREATE_TABLES_SQL = (
+    """
+    CREATE TABLE IF NOT EXISTS metrics_daily_orders (
+        day DATE NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        orders INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, status)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS metrics_daily_product_sales (
+        day DATE NOT NULL,
+        product_id INT NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        quantity INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, status),
+        INDEX idx_product_sales_status_product (status, product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS metrics_order_state (
+        order_id INT PRIMARY KEY,
+        day DATE NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        total_price DECIMAL(10,2) NOT NULL,
+        has_items BOOLEAN NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS metrics_rollup_watermarks (
+        source VARCHAR(50) PRIMARY KEY,
+        updated_at TIMESTAMP NULL,
+        last_id INT NOT NULL DEFAULT 0
+    )
+    """,
+)
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+class RollupIngester:
+    """Background thread folding changed orders into the rollup tables.
+
+    Orders updated less than `settle_seconds` ago are left for the next pass.
+    updated_at is set when a statement runs, not when its transaction commits,
+    so a long order transaction could otherwise commit behind the watermark.
+    """
+
+    def __init__(self, get_connection, batch_size=1000, interval=5, settle_seconds=15):
+        self.get_connection = get_connection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"ingested": 0, "applied": 0, "batches": 0, "errors": 0,
+                       "last_error": None, "watermark": None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rollup-ingester", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ingested = self.ingest_once()
+            except Exception as e:
+                ingested = 0
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = str(e)[:200]
+            # Catch up back-to-back; otherwise poll
+            if ingested < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def ingest_once(self):
+        """Apply one batch of changed orders; returns rows read."""
+        conn = self.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            conn.start_transaction()
+            cursor.execute("INSERT IGNORE INTO metrics_rollup_watermarks (source) VALUES ('orders')")
+            # The row lock keeps concurrent ingesters (one per metrics process) from double counting
+            cursor.execute(
+                "SELECT updated_at, last_id FROM metrics_rollup_watermarks WHERE source='orders' FOR UPDATE"
+            )
+            rows = self._read_changes(cursor, cursor.fetchone())
+            if not rows:
+                conn.commit()
+                return 0
+            applied = self._apply(cursor, rows)
+            watermark = (rows[-1]["updated_at"], rows[-1]["id"])
+            cursor.execute(
+                "UPDATE metrics_rollup_watermarks SET updated_at=%s, last_id=%s WHERE source='orders'", watermark
+            )
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        self._record(len(rows), applied, watermark)
+        return len(rows)
+
+    def _read_changes(self, cursor, mark):
+        """The next batch after the watermark, from orders and orders_archive merged.
+
+        Both tables are read in the transaction's consistent snapshot, so an
+        order the archiver moves meanwhile shows up in exactly one of them.
+        """
+        cursor.execute("SELECT NOW() - INTERVAL %s SECOND AS settled", (self.settle_seconds,))
+        where = ["updated_at <= %s"]
+        params = [cursor.fetchone()["settled"]]
+        if mark["updated_at"] is not None:
+            where.append("(updated_at > %s OR (updated_at = %s AND id > %s))")
+            params += [mark["updated_at"], mark["updated_at"], mark["last_id"]]
+        rows = []
+        for table in ("orders", "orders_archive"):
+            cursor.execute(
+                f"""SELECT id, total_price, status, created_at, updated_at FROM {table}
+                    WHERE {" AND ".join(where)}
+                    ORDER BY updated_at, id LIMIT %s""",
+                params + [self.batch_size]
+            )
+            rows += cursor.fetchall()
+        rows.sort(key=lambda row: (row["updated_at"], row["id"]))
+        return rows[:self.batch_size]
+
+    def _apply(self, cursor, orders):
+        """Turn a batch of order rows into rollup deltas; returns how many orders changed."""
+        ids = [o["id"] for o in orders]
+        cursor.execute(
+            f"""SELECT order_id, day, status, total_price, has_items FROM metrics_order_state
+                WHERE order_id IN ({_placeholders(ids)}) FOR UPDATE""",
+            ids
+        )
+        previous = {row["order_id"]: row for row in cursor.fetchall()}
+        line_part = ("SELECT order_id, product_id, quantity, line_total FROM {table} "
+                     f"WHERE order_id IN ({_placeholders(ids)})")
+        cursor.execute(
+            f"{line_part.format(table='order_items')} UNION ALL {line_part.format(table='order_items_archive')}",
+            ids + ids
+        )
+        lines = defaultdict(list)
+        for line in cursor.fetchall():
+            lines[line["order_id"]].append(line)
+
+        order_deltas = defaultdict(lambda: [0, Decimal(0)])
+        product_deltas = defaultdict(lambda: [0, Decimal(0)])
+
+        def contribute(day, status, total_price, order_lines, sign):
+            order_deltas[(day, status)][0] += sign
+            order_deltas[(day, status)][1] += sign * total_price
+            for line in order_lines:
+                delta = product_deltas[(day, line["product_id"], status)]
+                delta[0] += sign * line["quantity"]
+                delta[1] += sign * line["line_total"]
+
+        states = []
+        for order in orders:
+            day = order["created_at"].date()
+            order_lines = lines.get(order["id"], [])
+            old = previous.get(order["id"])
+            if old and (old["status"], old["total_price"], bool(old["has_items"])) == \
+                    (order["status"], order["total_price"], bool(order_lines)):
+                continue
+            if old:
+                contribute(old["day"], old["status"], old["total_price"], order_lines if old["has_items"] else [], -1)
+            contribute(day, order["status"], order["total_price"], order_lines, 1)
+            states.append((order["id"], day, order["status"], order["total_price"], bool(order_lines)))
+
+        if order_deltas:
+            cursor.executemany(
+                """INSERT INTO metrics_daily_orders (day, status, orders, revenue) VALUES (%s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE orders = orders + VALUES(orders), revenue = revenue + VALUES(revenue)""",
+                [(day, status, n, revenue) for (day, status), (n, revenue) in order_deltas.items()]
+            )
+        if product_deltas:
+            cursor.executemany(
+                """INSERT INTO metrics_daily_product_sales (day, product_id, status, quantity, revenue)
+                   VALUES (%s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), revenue = revenue + VALUES(revenue)""",
+                [(day, pid, status, qty, revenue) for (day, pid, status), (qty, revenue) in product_deltas.items()]
+            )
+        if states:
+            cursor.executemany(
+                """INSERT INTO metrics_order_state (order_id, day, status, total_price, has_items)
+                   VALUES (%s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE day = VALUES(day), status = VALUES(status),
+                       total_price = VALUES(total_price), has_items = VALUES(has_items)""",
+                states
+            )
+        return len(states)
+
+    def _record(self, ingested, applied, watermark):
+        with self._lock:
+            self._stats["ingested"] += ingested
+            self._stats["applied"] += applied
+            self._stats["batches"] += 1
+            if watermark:
+                self._stats["watermark"] = f"{watermark[0].isoformat()},{watermark[1]}"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
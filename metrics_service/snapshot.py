@@ -0,0 +1,87 @@
+"""In-memory snapshots of expensive aggregate queries.
+
+A Snapshot holds the last result of a compute function together with the
+time it was taken. A background thread recomputes it every `interval`
+seconds, so page views read memory instead of the database; refresh() forces
+a recompute on demand. If the thread is not running (or falls behind) a read
+older than `max_age` recomputes inline, so callers never see unbounded
+staleness. Only one computation runs at a time.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class Snapshot:
+    def __init__(self, name, compute, interval=30, max_age=None):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.max_age = max_age if max_age is not None else interval * 2
+        self._value = None
+        self._taken_at = None  # monotonic, for age
+        self._taken_wall = None  # wall clock, for display
+        self._duration_ms = None
+        self._last_error = None
+        self._compute_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"snapshot-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Snapshot {self.name} refresh failed: {e}")
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        """Recompute now; a caller arriving mid-refresh waits for it instead of starting another."""
+        requested = time.monotonic()
+        with self._compute_lock:
+            if self._taken_at is not None and self._taken_at >= requested:
+                return self._value
+            started = time.monotonic()
+            try:
+                value = self.compute()
+            except Exception as e:
+                self._last_error = str(e)[:200]
+                raise
+            self._value = value
+            self._taken_at = time.monotonic()
+            self._taken_wall = datetime.now(timezone.utc)
+            self._duration_ms = (self._taken_at - started) * 1000
+            self._last_error = None
+            return value
+
+    def get(self):
+        """(value, age in seconds); recomputes inline only when missing or older than max_age.
+
+        A failed inline recompute falls back to the previous value when there is one.
+        """
+        if self._taken_at is None or time.monotonic() - self._taken_at > self.max_age:
+            try:
+                self.refresh()
+            except Exception:
+                if self._value is None:
+                    raise
+        return self._value, time.monotonic() - self._taken_at
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "taken_at": self._taken_wall.isoformat() if self._taken_wall else None,
+            "age_seconds": time.monotonic() - self._taken_at if self._taken_at is not None else None,
+            "duration_ms": self._duration_ms,
+            "interval": self.interval,
+            "last_error": self._last_error,
+        }
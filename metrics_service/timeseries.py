@@ -0,0 +1,149 @@
+"""Bucketed order time series with per-bucket caching.
+
+Buckets are half-open [start, end) ranges, and the SQL filters on
+created_at with the same half-open predicate, so the range is an index range
+scan rather than a function over every row. A bucket whose end is more than
+`settle_seconds` in the past is closed: its value is cached and not
+recomputed until `closed_ttl` expires. Later cancellations can still move a
+closed bucket's revenue, and the TTL bounds how long that stays hidden. The
+open (current) bucket is always recomputed. Only the buckets a request could
+not serve from cache are queried, one range per contiguous run of them.
+
+The hot and archive tables are aggregated separately and their buckets
+added up: through the all_orders view the UNION ALL is materialized before
+grouping, so neither table's created_at index would serve the range.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Both metrics are additive, so per-table buckets are simply summed
+ORDER_TABLES = ("orders", "orders_archive")
+
+METRICS = {
+    # metric -> SQL aggregate over an orders table
+    "orders": "COUNT(*)",
+    "revenue": "COALESCE(SUM(CASE WHEN status='completed' THEN total_price END), 0)",
+}
+
+BUCKETS = {
+    # bucket -> (DATE_FORMAT pattern of the bucket start, default lookback)
+    "hour": ("%Y-%m-%d %H:00:00", timedelta(hours=24)),
+    "day": ("%Y-%m-%d", timedelta(days=30)),
+    "month": ("%Y-%m-01", timedelta(days=365)),
+}
+
+
+def bucket_start(stamp, bucket):
+    """The start of the bucket containing stamp."""
+    if bucket == "hour":
+        return stamp.replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return stamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return stamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_bucket(start, bucket):
+    if bucket == "hour":
+        return start + timedelta(hours=1)
+    if bucket == "day":
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def contiguous_runs(starts, bucket):
+    """Split sorted bucket starts into runs of adjacent buckets."""
+    runs = []
+    for s in starts:
+        if runs and next_bucket(runs[-1][-1], bucket) == s:
+            runs[-1].append(s)
+        else:
+            runs.append([s])
+    return runs
+
+
+def bucket_range(start, end, bucket):
+    """Bucket starts covering [start, end)."""
+    current = bucket_start(start, bucket)
+    starts = []
+    while current < end:
+        starts.append(current)
+        current = next_bucket(current, bucket)
+    return starts
+
+
+class TimeseriesCache:
+    def __init__(self, get_connection, settle_seconds=15, closed_ttl=600, max_entries=50000):
+        self.get_connection = get_connection
+        self.settle_seconds = settle_seconds
+        self.closed_ttl = closed_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "queries": 0}
+
+    def series(self, metric, bucket, start, end, status=None):
+        """[(bucket start, value)] for every bucket in [start, end), zero-filled."""
+        starts = bucket_range(start, end, bucket)
+        closed_before = datetime.now() - timedelta(seconds=self.settle_seconds)
+        now = time.monotonic()
+
+        values = {}
+        with self._lock:
+            for s in starts:
+                entry = self._entries.get((metric, bucket, status, s))
+                if entry is not None and now - entry[1] < self.closed_ttl:
+                    self._entries.move_to_end((metric, bucket, status, s))
+                    values[s] = entry[0]
+            missing = [s for s in starts if s not in values]
+            self._stats["hits"] += len(values)
+            self._stats["misses"] += len(missing)
+
+        if missing:
+            fetched = {}
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                for run in contiguous_runs(missing, bucket):
+                    for table in ORDER_TABLES:
+                        for s, value in self._query(cursor, table, metric, bucket, run[0],
+                                                    next_bucket(run[-1], bucket), status):
+                            fetched[s] = fetched.get(s, 0) + value
+            finally:
+                cursor.close()
+                conn.close()
+            with self._lock:
+                for s in missing:
+                    values[s] = fetched.get(s, 0)
+                    if next_bucket(s, bucket) <= closed_before:
+                        self._entries[(metric, bucket, status, s)] = (values[s], now)
+                        self._entries.move_to_end((metric, bucket, status, s))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return [(s, values[s]) for s in starts]
+
+    def _query(self, cursor, table, metric, bucket, start, end, status):
+        """[(bucket start, value)] of one table's non-empty buckets in [start, end)."""
+        where = ["created_at >= %s", "created_at < %s"]
+        params = [start, end]
+        if status:
+            where.append("status = %s")
+            params.append(status)
+        cursor.execute(
+            f"""SELECT DATE_FORMAT(created_at, %s) AS bucket, {METRICS[metric]} AS value
+                FROM {table}
+                WHERE {" AND ".join(where)}
+                GROUP BY bucket""",
+            [BUCKETS[bucket][0]] + params
+        )
+        rows = cursor.fetchall()
+        with self._lock:
+            self._stats["queries"] += 1
+        return [(datetime.fromisoformat(label), value) for label, value in rows]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
@@ -3,7 +3,22 @@ CREATE DATABASE IF NOT EXISTS microservices;
 USE microservices;
 
 -- Drop tables if they exist to start fresh
+DROP TABLE IF EXISTS metrics_rollup_watermarks;
+DROP TABLE IF EXISTS metrics_order_state;
+DROP TABLE IF EXISTS metrics_daily_product_sales;
+DROP TABLE IF EXISTS metrics_daily_orders;
+DROP TABLE IF EXISTS outbox_offsets;
+DROP TABLE IF EXISTS order_events;
+DROP TABLE IF EXISTS order_jobs;
+DROP VIEW IF EXISTS all_order_items;
+DROP VIEW IF EXISTS all_orders;
+DROP TABLE IF EXISTS order_items_archive;
+DROP TABLE IF EXISTS orders_archive;
+DROP TABLE IF EXISTS order_items;
 DROP TABLE IF EXISTS orders;
+DROP TABLE IF EXISTS balance_adjustments;
+DROP TABLE IF EXISTS stock_adjustments;
+DROP TABLE IF EXISTS product_tombstones;
 DROP TABLE IF EXISTS products;
 DROP TABLE IF EXISTS users;
 
@@ -12,35 +27,162 @@ CREATE TABLE IF NOT EXISTS users (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
     email VARCHAR(100) UNIQUE NOT NULL,
-    cash_balance DECIMAL(10,2) DEFAULT 0.00,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    cash_balance DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    INDEX idx_users_updated_at (updated_at),
+    INDEX idx_users_created_id (created_at, id),
+    INDEX idx_users_balance_id (cash_balance, id)
+);
+
+-- Idempotency keys for balance adjustments
+CREATE TABLE IF NOT EXISTS balance_adjustments (
+    idempotency_key VARCHAR(100) PRIMARY KEY,
+    user_id INT NOT NULL,
+    delta DECIMAL(10,2) NOT NULL,
+    balance_after DECIMAL(10,2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_balance_adjustments_created (created_at)
 );
 
 -- Products table
 CREATE TABLE IF NOT EXISTS products (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    sku VARCHAR(64) UNIQUE,
     name VARCHAR(100) NOT NULL,
     description TEXT,
     price DECIMAL(10,2) NOT NULL,
-    stock INT DEFAULT 0,
+    stock INT NOT NULL DEFAULT 0,
     category VARCHAR(50),
     image_url VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    INDEX idx_products_category_id (category, id),
+    INDEX idx_products_price_id (price, id),
+    INDEX idx_products_name_id (name, id),
+    INDEX idx_products_stock_id (stock, id),
+    INDEX idx_products_updated_id (updated_at, id),
+    FULLTEXT INDEX ft_products_name_description (name, description)
+);
+
+-- Deleted product ids, kept for the change feed
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    product_id INT PRIMARY KEY,
+    deleted_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_tombstones_deleted_id (deleted_at, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS stock_adjustments (
+    idempotency_key VARCHAR(100) PRIMARY KEY,
+    adjustments TEXT NOT NULL,
+    stock_after TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_stock_adjustments_created (created_at)
 );
 
 -- Orders table
 CREATE TABLE IF NOT EXISTS orders (
     id INT AUTO_INCREMENT PRIMARY KEY,
     user_id INT NOT NULL,
-    product_id INT NOT NULL,
-    quantity INT NOT NULL,
     total_price DECIMAL(10,2) NOT NULL,
     status ENUM('pending', 'completed', 'cancelled') DEFAULT 'completed',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+    INDEX idx_orders_user_created (user_id, created_at),
+    INDEX idx_orders_status_created (status, created_at),
+    INDEX idx_orders_created (created_at),
+    INDEX idx_orders_updated (updated_at)
+);
+
+-- Order lines; unit_price is the price at the time of ordering
+CREATE TABLE IF NOT EXISTS order_items (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    unit_price DECIMAL(10,2) NOT NULL,
+    line_total DECIMAL(10,2) NOT NULL,
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+    INDEX idx_order_items_product (product_id, order_id)
+);
+
+-- Finished orders older than ORDER_ARCHIVE_AFTER_DAYS, moved here by the orders service
+CREATE TABLE IF NOT EXISTS orders_archive LIKE orders;
+CREATE TABLE IF NOT EXISTS order_items_archive LIKE order_items;
+
+-- Full order history for reporting
+CREATE OR REPLACE VIEW all_orders AS
+    SELECT * FROM orders UNION ALL SELECT * FROM orders_archive;
+CREATE OR REPLACE VIEW all_order_items AS
+    SELECT * FROM order_items UNION ALL SELECT * FROM order_items_archive;
+
+-- Durable queue of pending orders for the background order workers
+CREATE TABLE IF NOT EXISTS order_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL UNIQUE,
+    payload JSON NOT NULL,
+    status ENUM('queued', 'processing', 'done', 'failed') NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    locked_by VARCHAR(100),
+    locked_at TIMESTAMP(6) NULL,
+    last_error VARCHAR(500),
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    INDEX idx_order_jobs_status_available (status, available_at)
+);
+
+-- Transactional outbox of order events, written in the same transaction as the order change
+CREATE TABLE IF NOT EXISTS order_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL,
+    event_type ENUM('created', 'completed', 'cancelled') NOT NULL,
+    user_id INT NOT NULL,
+    total_price DECIMAL(10,2) NOT NULL,
+    payload JSON NOT NULL,
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_order_events_order (order_id)
+);
+
+-- How far each outbox sink has published
+CREATE TABLE IF NOT EXISTS outbox_offsets (
+    sink VARCHAR(100) PRIMARY KEY,
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+);
+
+-- Metrics rollups, maintained incrementally by the metrics service
+CREATE TABLE IF NOT EXISTS metrics_daily_orders (
+    day DATE NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    orders INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status)
+);
+
+CREATE TABLE IF NOT EXISTS metrics_daily_product_sales (
+    day DATE NOT NULL,
+    product_id INT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id, status),
+    INDEX idx_product_sales_status_product (status, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS metrics_order_state (
+    order_id INT PRIMARY KEY,
+    day DATE NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    total_price DECIMAL(10,2) NOT NULL,
+    has_items BOOLEAN NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS metrics_rollup_watermarks (
+    source VARCHAR(50) PRIMARY KEY,
+    updated_at TIMESTAMP NULL,
+    last_id INT NOT NULL DEFAULT 0
 );
 
 -- --------------------------------------------------------
@@ -86,28 +228,54 @@ INSERT INTO `products` (`id`, `name`, `description`, `price`, `stock`, `category
 -- --------------------------------------------------------
 -- Insert orders
 -- --------------------------------------------------------
-INSERT INTO `orders` (`id`, `user_id`, `product_id`, `quantity`, `total_price`, `status`, `created_at`) VALUES
-(1, 1, 3, 2, 2598.00, 'completed', '2024-05-10 08:30:00'),
-(2, 2, 1, 1, 24999.00, 'completed', '2024-05-11 12:00:00'),
-(3, 3, 2, 1, 15999.00, 'pending', '2024-05-12 15:45:00'),
-(4, 4, 5, 1, 499.00, 'completed', '2024-06-01 10:00:00'),
-(5, 5, 10, 5, 1250.00, 'completed', '2024-06-03 11:30:00'),
-(6, 6, 13, 1, 42999.00, 'completed', '2024-06-05 09:00:00'),
-(7, 7, 6, 3, 1797.00, 'cancelled', '2024-06-10 14:00:00'),
-(8, 8, 8, 1, 1800.00, 'completed', '2024-06-15 18:00:00'),
-(9, 9, 11, 10, 250.00, 'pending', '2024-06-22 12:00:00'),
-(10, 10, 4, 2, 700.00, 'completed', '2024-07-01 16:45:00'),
-(11, 1, 12, 1, 55000.00, 'completed', '2024-07-05 20:00:00'),
-(12, 2, 7, 1, 1499.00, 'completed', '2024-07-10 08:30:00'),
-(13, 11, 9, 4, 3000.00, 'pending', '2024-07-18 13:00:00'),
-(14, 12, 14, 1, 2999.00, 'cancelled', '2024-07-25 10:00:00'),
-(15, 13, 4, 1, 350.00, 'completed', '2024-08-01 11:00:00'),
-(16, 14, 6, 2, 1198.00, 'completed', '2024-08-05 15:30:00'),
-(17, 3, 11, 20, 500.00, 'completed', '2024-08-10 09:15:00'),
-(18, 5, 3, 1, 1299.00, 'pending', '2024-08-12 14:00:00'),
-(19, 8, 1, 1, 24999.00, 'completed', '2024-08-18 19:00:00'),
-(20, 1, 5, 1, 499.00, 'completed', '2024-08-20 12:00:00'),
-(21, 6, 14, 1, 2999.00, 'cancelled', '2024-08-25 16:00:00'),
-(22, 10, 8, 1, 1800.00, 'completed', '2024-09-01 10:30:00'),
-(23, 12, 10, 3, 750.00, 'pending', '2024-09-03 11:45:00'),
-(24, 4, 2, 1, 15999.00, 'completed', '2024-09-05 17:00:00');
\ No newline at end of file
+INSERT INTO `orders` (`id`, `user_id`, `total_price`, `status`, `created_at`) VALUES
+(1, 1, 2598.00, 'completed', '2024-05-10 08:30:00'),
+(2, 2, 24999.00, 'completed', '2024-05-11 12:00:00'),
+(3, 3, 15999.00, 'pending', '2024-05-12 15:45:00'),
+(4, 4, 499.00, 'completed', '2024-06-01 10:00:00'),
+(5, 5, 1250.00, 'completed', '2024-06-03 11:30:00'),
+(6, 6, 42999.00, 'completed', '2024-06-05 09:00:00'),
+(7, 7, 1797.00, 'cancelled', '2024-06-10 14:00:00'),
+(8, 8, 1800.00, 'completed', '2024-06-15 18:00:00'),
+(9, 9, 250.00, 'pending', '2024-06-22 12:00:00'),
+(10, 10, 700.00, 'completed', '2024-07-01 16:45:00'),
+(11, 1, 55000.00, 'completed', '2024-07-05 20:00:00'),
+(12, 2, 1499.00, 'completed', '2024-07-10 08:30:00'),
+(13, 11, 3000.00, 'pending', '2024-07-18 13:00:00'),
+(14, 12, 2999.00, 'cancelled', '2024-07-25 10:00:00'),
+(15, 13, 350.00, 'completed', '2024-08-01 11:00:00'),
+(16, 14, 1198.00, 'completed', '2024-08-05 15:30:00'),
+(17, 3, 500.00, 'completed', '2024-08-10 09:15:00'),
+(18, 5, 1299.00, 'pending', '2024-08-12 14:00:00'),
+(19, 8, 24999.00, 'completed', '2024-08-18 19:00:00'),
+(20, 1, 499.00, 'completed', '2024-08-20 12:00:00'),
+(21, 6, 2999.00, 'cancelled', '2024-08-25 16:00:00'),
+(22, 10, 1800.00, 'completed', '2024-09-01 10:30:00'),
+(23, 12, 750.00, 'pending', '2024-09-03 11:45:00'),
+(24, 4, 15999.00, 'completed', '2024-09-05 17:00:00');
+
+INSERT INTO `order_items` (`order_id`, `product_id`, `quantity`, `unit_price`, `line_total`) VALUES
+(1, 3, 2, 1299.00, 2598.00),
+(2, 1, 1, 24999.00, 24999.00),
+(3, 2, 1, 15999.00, 15999.00),
+(4, 5, 1, 499.00, 499.00),
+(5, 10, 5, 250.00, 1250.00),
+(6, 13, 1, 42999.00, 42999.00),
+(7, 6, 3, 599.00, 1797.00),
+(8, 8, 1, 1800.00, 1800.00),
+(9, 11, 10, 25.00, 250.00),
+(10, 4, 2, 350.00, 700.00),
+(11, 12, 1, 55000.00, 55000.00),
+(12, 7, 1, 1499.00, 1499.00),
+(13, 9, 4, 750.00, 3000.00),
+(14, 14, 1, 2999.00, 2999.00),
+(15, 4, 1, 350.00, 350.00),
+(16, 6, 2, 599.00, 1198.00),
+(17, 11, 20, 25.00, 500.00),
+(18, 3, 1, 1299.00, 1299.00),
+(19, 1, 1, 24999.00, 24999.00),
+(20, 5, 1, 499.00, 499.00),
+(21, 14, 1, 2999.00, 2999.00),
+(22, 8, 1, 1800.00, 1800.00),
+(23, 10, 3, 250.00, 750.00),
+(24, 2, 1, 15999.00, 15999.00);
\ No newline at end of file
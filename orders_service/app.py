@@ -3,6 +3,21 @@ import mysql.connector
 import requests
 import os
 import time
+import uuid
+import contextvars
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import archive
+import order_queue
+import outbox
+import service_client
+from order_queue import OrderJobQueue, PermanentJobError
+from archive import OrderArchiver
+from lookup_cache import LookupCache
+from outbox import OutboxRelay
+from streaming import wants_stream, stream_merged
+from service_client import ServiceClient
 
 app = Flask(__name__)
 app.secret_key = 'orders-service-secret-key'
@@ -19,6 +34,47 @@ db_config = {
 USERS_SERVICE_URL = os.getenv('USERS_SERVICE_URL', 'http://users-service:5000')
 PRODUCTS_SERVICE_URL = os.getenv('PRODUCTS_SERVICE_URL', 'http://products-service:5000')
 
+# Downstream fan-out: bounded worker pool plus an overall deadline per request
+DOWNSTREAM_WORKERS = int(os.getenv('DOWNSTREAM_WORKERS', 16))
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 8))
+
+downstream_pool = ThreadPoolExecutor(max_workers=DOWNSTREAM_WORKERS, thread_name_prefix='downstream')
+
+# Pooled keep-alive clients, one per upstream
+users_client = ServiceClient('users', USERS_SERVICE_URL, pool_size=DOWNSTREAM_WORKERS)
+products_client = ServiceClient('products', PRODUCTS_SERVICE_URL, pool_size=DOWNSTREAM_WORKERS)
+
+# Asynchronous order pipeline (pending orders drained from the order_jobs table)
+ORDER_WORKERS = int(os.getenv('ORDER_WORKERS', 2))
+ORDER_JOB_MAX_ATTEMPTS = int(os.getenv('ORDER_JOB_MAX_ATTEMPTS', 5))
+ORDER_JOB_BACKOFF = float(os.getenv('ORDER_JOB_BACKOFF', 1))
+ORDER_JOB_VISIBILITY_TIMEOUT = float(os.getenv('ORDER_JOB_VISIBILITY_TIMEOUT', 60))
+
+# Order event outbox relay; OUTBOX_SINK is 'file:/path', an http(s) URL, 'in-process' or empty (off)
+OUTBOX_SINK = os.getenv('OUTBOX_SINK', '')
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_INTERVAL = float(os.getenv('OUTBOX_INTERVAL', 1))
+
+# Finished orders older than this move to orders_archive; 0 disables the archiver
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 180))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 500))
+ORDER_ARCHIVE_INTERVAL = float(os.getenv('ORDER_ARCHIVE_INTERVAL', 300))
+
+# Display-name lookups for order pages; one batched upstream call per cache per page
+LOOKUP_CACHE_TTL = float(os.getenv('LOOKUP_CACHE_TTL', 30))
+# Per-request caps of the users/products batch endpoints, read from the same settings
+# those services enforce so a lowered cap never turns lookups into 400s
+USERS_BATCH_SIZE = int(os.getenv('USERS_MAX_BATCH_SIZE', 500))
+PRODUCTS_BATCH_SIZE = int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', 500))
+
+user_lookup = LookupCache(ttl=LOOKUP_CACHE_TTL)
+product_lookup = LookupCache(ttl=LOOKUP_CACHE_TTL)
+
+# Order listings are keyset-paginated, newest first
+ORDER_STATUSES = ("pending", "completed", "cancelled")
+DEFAULT_PAGE_SIZE = int(os.getenv('ORDERS_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.getenv('ORDERS_MAX_PAGE_SIZE', 500))
+
 
 def get_db_connection():
     """Create and return a database connection with retry logic"""
@@ -36,6 +92,46 @@ def get_db_connection():
                 raise
 
 
+def ensure_index(cursor, table, name, columns):
+    """Create an index unless it already exists"""
+    try:
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    except mysql.connector.Error as err:
+        if err.errno != 1061:  # ER_DUP_KEYNAME
+            raise
+
+
+def migrate_single_line_orders(cursor):
+    """Move product_id/quantity from legacy one-line orders rows into order_items
+
+    Safe to re-run: lines already copied are skipped, and the legacy columns
+    are only dropped once every order has its line.
+    """
+    cursor.execute(
+        """SELECT 1 FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'orders' AND COLUMN_NAME = 'product_id'"""
+    )
+    if cursor.fetchone() is None:
+        return
+
+    cursor.execute("""
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price, line_total)
+        SELECT o.id, o.product_id, o.quantity, ROUND(o.total_price / o.quantity, 2), o.total_price
+        FROM orders o
+        LEFT JOIN order_items i ON i.order_id = o.id
+        WHERE i.id IS NULL
+    """)
+    cursor.execute(
+        """SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'orders'
+             AND COLUMN_NAME = 'product_id' AND REFERENCED_TABLE_NAME IS NOT NULL"""
+    )
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE orders DROP FOREIGN KEY {constraint}")
+    cursor.execute("ALTER TABLE orders DROP COLUMN product_id, DROP COLUMN quantity")
+    print("Migrated single-line orders to order_items")
+
+
 def init_db():
     """Initialize database tables"""
     try:
@@ -45,114 +141,684 @@ def init_db():
             CREATE TABLE IF NOT EXISTS orders (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 user_id INT NOT NULL,
-                product_id INT NOT NULL,
-                quantity INT NOT NULL,
                 total_price DECIMAL(10,2) NOT NULL,
                 status ENUM('pending','completed','cancelled') DEFAULT 'completed',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_items (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                order_id INT NOT NULL,
+                product_id INT NOT NULL,
+                quantity INT NOT NULL,
+                unit_price DECIMAL(10,2) NOT NULL,
+                line_total DECIMAL(10,2) NOT NULL,
+                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+                INDEX idx_order_items_product (product_id, order_id)
+            )
+        ''')
+        cursor.execute(order_queue.CREATE_TABLE_SQL)
+        for statement in outbox.CREATE_TABLES_SQL:
+            cursor.execute(statement)
+        migrate_single_line_orders(cursor)
+        ensure_index(cursor, "orders", "idx_orders_user_created", "user_id, created_at")
+        ensure_index(cursor, "orders", "idx_orders_status_created", "status, created_at")
+        ensure_index(cursor, "orders", "idx_orders_created", "created_at")
+        # Watermark scans by the metrics rollup ingester
+        ensure_index(cursor, "orders", "idx_orders_updated", "updated_at")
+        # After the orders migrations, so the archive copies the current layout
+        for statement in archive.CREATE_TABLES_SQL:
+            cursor.execute(statement)
+        # An archive created before idx_orders_updated existed lacks it; the ingester scans both tables
+        ensure_index(cursor, "orders_archive", "idx_orders_updated", "updated_at")
         conn.commit()
         cursor.close()
         conn.close()
-        print("Orders table initialized successfully")
+        print("Orders tables initialized successfully")
     except Exception as e:
         print(f"Error initializing DB: {e}")
 
 
+# ------------------ DOWNSTREAM FAN-OUT ------------------
+
+class DownstreamError(Exception):
+    """A concurrent downstream leg failed or the request deadline passed"""
+
+
+@app.before_request
+def start_request_deadline():
+    """Bound all downstream work for this request, tightened by the caller's own deadline"""
+    service_client.set_deadline(service_client.deadline_from_headers(request.headers, REQUEST_DEADLINE))
+
+
+def fan_out(*calls, fail_fast=True):
+    """Run independent downstream calls concurrently; returns results in call order
+
+    A leg fails when it raises or returns a falsy value. With fail_fast the
+    first failure cancels legs that have not started and raises
+    DownstreamError, chained to the exception the leg raised; otherwise failed legs come back as None. Either way the
+    wait is bounded by the request deadline.
+    """
+    deadline = service_client.get_deadline() or time.monotonic() + REQUEST_DEADLINE
+    futures = [downstream_pool.submit(contextvars.copy_context().run, call) for call in calls]
+    pending = set(futures)
+    failed = None
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DownstreamError("Request deadline exceeded")
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if failed is None and (future.exception() is not None or not future.result()):
+                    failed = future
+            if failed is not None and fail_fast:
+                # Chained to the leg's exception, if it raised, so callers can tell failures apart
+                raise DownstreamError("Downstream call failed") from failed.exception()
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return [f.result() if f.done() and f.exception() is None and f.result() else None for f in futures]
+
+
 # ------------------ USERS + PRODUCTS SERVICE HELPERS ------------------
 
 def get_users():
     try:
-        r = requests.get(f"{USERS_SERVICE_URL}/api/users", timeout=5)
+        r = users_client.get("/api/users")
         if r.status_code == 200:
             users = r.json()
             for u in users:
                 u['cash_balance'] = float(u.get('cash_balance', 0.0))
             return users
-    except:
-        pass
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"get_users failed: {e}")
     return []
 
 
 def get_products():
+    """Every product, following the listing's X-Next-After-Id cursor page by page"""
+    products = []
+    # products_service clamps limit to its own maximum page size
+    params = {"fields": "id,name,price,stock", "limit": 500}
     try:
-        r = requests.get(f"{PRODUCTS_SERVICE_URL}/api/products", timeout=5)
-        if r.status_code == 200:
-            products = r.json()
-            for p in products:
+        while True:
+            r = products_client.get("/api/products", params=params)
+            if r.status_code != 200:
+                return []
+            for p in r.json():
                 p['price'] = float(p.get('price', 0.0))
-            return products
-    except:
-        pass
+                products.append(p)
+            next_after_id = r.headers.get("X-Next-After-Id")
+            if not next_after_id:
+                return products
+            params = dict(params, after_id=next_after_id)
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"get_products failed: {e}")
     return []
 
 
+class NotFound(Exception):
+    """The upstream answered, and the requested record does not exist"""
+
+
+def fetch_user(user_id):
+    """The user; raises NotFound on a 404 and RequestException when users_service cannot answer"""
+    r = users_client.get(f"/api/users/{user_id}")
+    if r.status_code == 404:
+        raise NotFound(f"User {user_id} not found")
+    r.raise_for_status()
+    u = r.json()
+    u['cash_balance'] = float(u.get('cash_balance', 0.0))
+    return u
+
+
 def get_user(user_id):
     try:
-        r = requests.get(f"{USERS_SERVICE_URL}/api/users/{user_id}", timeout=5)
-        if r.status_code == 200:
-            u = r.json()
-            u['cash_balance'] = float(u.get('cash_balance', 0.0))
-            return u
-    except:
+        return fetch_user(user_id)
+    except NotFound:
         pass
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"get_user({user_id}) failed: {e}")
     return None
 
 
 def get_product(product_id):
     try:
-        r = requests.get(f"{PRODUCTS_SERVICE_URL}/api/products/{product_id}", timeout=5)
+        r = products_client.get(f"/api/products/{product_id}")
         if r.status_code == 200:
             p = r.json()
             p['price'] = float(p.get('price', 0.0))
             p['stock'] = int(p.get('stock', 0))
             return p
-    except:
-        pass
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"get_product({product_id}) failed: {e}")
+    return None
+
+
+def get_products_by_ids(product_ids):
+    """Resolve many products with one batch call; returns {id: product}"""
+    try:
+        r = products_client.get(
+            "/api/products/batch",
+            params={"ids": ",".join(str(pid) for pid in product_ids), "fields": "id,name,price,stock"}
+        )
+        if r.status_code == 200:
+            products = {}
+            for p in r.json().get("products", []):
+                p['price'] = float(p.get('price', 0.0))
+                p['stock'] = int(p.get('stock', 0))
+                products[p['id']] = p
+            return products
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"get_products_by_ids failed: {e}")
+    return None
+
+
+def get_users_by_ids(user_ids):
+    """Resolve many users with one batch call; returns {id: user}"""
+    try:
+        r = users_client.get("/api/users/batch", params={"ids": ",".join(str(uid) for uid in user_ids)})
+        if r.status_code == 200:
+            users = {}
+            for u in r.json().get("users", []):
+                u['cash_balance'] = float(u.get('cash_balance', 0.0))
+                users[u['id']] = u
+            return users
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"get_users_by_ids failed: {e}")
     return None
 
 
-def update_user_balance(user_id, new_balance):
-    user = get_user(user_id)
-    if not user:
-        return False
+def batched(loader, size):
+    """Wrap a batch loader so any number of ids is split into requests of at most size ids"""
+    def load(ids):
+        found = {}
+        for start in range(0, len(ids), size):
+            chunk = loader(ids[start:start + size])
+            if chunk is None:
+                return None
+            found.update(chunk)
+        return found
+    return load
+
+
+def lookup_names(user_ids, product_ids):
+    """Cached {id: record} maps for display; both upstreams are asked concurrently, misses only"""
+    results = fan_out(
+        lambda: user_lookup.get_many(user_ids, batched(get_users_by_ids, USERS_BATCH_SIZE)) if user_ids else {},
+        lambda: product_lookup.get_many(product_ids, batched(get_products_by_ids, PRODUCTS_BATCH_SIZE)) if product_ids else {},
+        fail_fast=False
+    )
+    return [r or {} for r in results]
+
+
+# Outcomes of a downstream write. REJECTED means the upstream refused it (e.g. insufficient
+# stock or balance) and nothing changed; UNREACHABLE covers transport errors, timeouts, open
+# circuits, deadline expiry and server errors, after which it may or may not have applied
+APPLIED, REJECTED, UNREACHABLE = "applied", "rejected", "unreachable"
+
+
+def write_outcome(r):
+    if r.status_code == 200:
+        return APPLIED
+    if 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+        return REJECTED
+    return UNREACHABLE
+
+
+def adjust_user_balance(user_id, delta, idempotency_key):
+    """Atomically change balance by delta; the key makes retries safe. Returns an outcome"""
+    try:
+        r = users_client.post(
+            f"/api/users/{user_id}/balance/adjust",
+            json={"delta": round(float(delta), 2)},
+            headers={"Idempotency-Key": idempotency_key}
+        )
+        return write_outcome(r)
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"adjust_user_balance({user_id}) failed: {e}")
+        return UNREACHABLE
+
+
+def adjust_stock_batch(deltas, idempotency_key):
+    """Apply {product_id: delta} all-or-nothing in one products_service call; the key makes
+    retries safe. Returns an outcome"""
+    try:
+        r = products_client.post(
+            "/api/products/stock/adjust",
+            json={"adjustments": [{"product_id": pid, "delta": int(d)} for pid, d in deltas.items()]},
+            headers={"Idempotency-Key": idempotency_key}
+        )
+        return write_outcome(r)
+    except requests.exceptions.RequestException as e:
+        app.logger.warning(f"adjust_stock_batch failed: {e}")
+        return UNREACHABLE
+
+
+# ------------------ ORDER PLACEMENT ------------------
+
+class OrderError(Exception):
+    """Order could not be placed; status_code is used by the JSON API"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_order_lines(lines):
+    """Merge [{'product_id', 'quantity'}, ...] into {product_id: quantity}"""
+    if not isinstance(lines, list) or not lines:
+        raise OrderError("items must be a non-empty list")
+    quantities = {}
+    try:
+        for line in lines:
+            product_id = int(line['product_id'])
+            qty = int(line['quantity'])
+            if qty <= 0:
+                raise OrderError("Quantity must be > 0")
+            quantities[product_id] = quantities.get(product_id, 0) + qty
+    except (KeyError, TypeError, ValueError):
+        raise OrderError("Each item needs an integer product_id and quantity")
+    return quantities
+
+
+def price_order(user_id, quantities):
+    """Look up the user and products concurrently and validate the order
+
+    Returns (items, total_price); raises OrderError if the user or a product
+    is missing (404), stock or balance is short (409), or either service
+    could not answer (503).
+    """
+    def load_products():
+        products = get_products_by_ids(list(quantities))
+        if products is None:
+            raise DownstreamError("Products service unavailable")
+        if [pid for pid in quantities if pid not in products]:
+            raise NotFound("Product not found")
+        return products
+
+    try:
+        user, products = fan_out(lambda: fetch_user(user_id), load_products)
+    except DownstreamError as e:
+        if isinstance(e.__cause__, NotFound):
+            raise OrderError("Invalid user or product", 404)
+        raise OrderError("Users or products service unavailable", 503)
+
+    items = []
+    for product_id, qty in quantities.items():
+        product = products[product_id]
+        if product["stock"] < qty:
+            raise OrderError(f"Insufficient stock for {product['name']}", 409)
+        items.append({
+            "product_id": product_id,
+            "product_name": product["name"],
+            "quantity": qty,
+            "unit_price": product["price"],
+            "line_total": round(product["price"] * qty, 2)
+        })
+
+    total_price = round(sum(item["line_total"] for item in items), 2)
+    if user["cash_balance"] < total_price:
+        raise OrderError("Insufficient balance", 409)
+    return items, total_price
+
+
+def reverse_debit(user_id, amount, debit_key, refund_key, debit):
+    """Refund a debit whose order did not commit, given the debit's outcome
+
+    A rejected debit took nothing. An unreachable one may still have been
+    applied, so it is first re-sent under the same key: the users service then
+    either replays the original outcome or applies it now, and only a debit
+    known to have applied is refunded.
+    """
+    if debit == UNREACHABLE:
+        debit = adjust_user_balance(user_id, -amount, debit_key)
+    if debit == REJECTED:
+        return
+    if debit != APPLIED or adjust_user_balance(user_id, amount, refund_key) != APPLIED:
+        app.logger.error(f"Refund of {debit_key} ({amount}) to user {user_id} failed; reconcile manually")
+
+
+def release_stock(quantities, reserve_key, release_key, reserved):
+    """Put back a reservation whose order did not commit, given the reservation's outcome
+
+    Mirrors reverse_debit: an unreachable reservation is re-sent under its key
+    to learn whether it applied, and only an applied one is released. The
+    release is keyed as well, so an unreachable release is retried once.
+    """
+    if reserved == UNREACHABLE:
+        reserved = adjust_stock_batch({pid: -qty for pid, qty in quantities.items()}, reserve_key)
+    if reserved == REJECTED:
+        return
+    released = UNREACHABLE
+    if reserved == APPLIED:
+        released = adjust_stock_batch(quantities, release_key)
+        if released == UNREACHABLE:
+            released = adjust_stock_batch(quantities, release_key)
+    if released != APPLIED:
+        app.logger.error(f"Release of {reserve_key} ({quantities}) failed; reconcile manually")
+
+
+def commit_order(user_id, quantities, items, total_price, order_id=None):
+    """Reserve stock, debit the balance, then write the order; returns the order id
+
+    Inserts a new completed order, or with order_id completes an existing
+    pending one. Both downstream writes happen before the order transaction
+    opens, so it never holds row or gap locks across an HTTP call. Any failure
+    releases the stock and, once the debit was attempted, refunds it.
+    """
+    # Keys are per attempt: a retried job has to reserve and charge afresh once an
+    # earlier attempt was reversed, rather than replay it. A new order has no id yet.
+    ref = f"{order_id if order_id is not None else 'new'}-{uuid.uuid4().hex[:12]}"
+    reserve_key, release_key = f"order-{ref}-reserve", f"order-{ref}-release"
+    debit_key = f"order-{ref}-debit"
+
+    # Reserve stock first: the conditional decrement is what guards against overselling
+    reserved = adjust_stock_batch({pid: -qty for pid, qty in quantities.items()}, reserve_key)
+    if reserved == REJECTED:
+        raise OrderError("Insufficient stock", 409)
+    if reserved != APPLIED:
+        release_stock(quantities, reserve_key, release_key, reserved)
+        raise OrderError("Products service unavailable", 503)
+
+    conn = cursor = debit = None
     try:
-        r = requests.put(
-            f"{USERS_SERVICE_URL}/api/users/{user_id}",
-            json={
-                "name": user["name"],
-                "email": user["email"],
-                "cash_balance": float(new_balance)
-            },
-            timeout=5
+        debit = adjust_user_balance(user_id, -total_price, debit_key)
+        if debit == REJECTED:
+            raise OrderError("Insufficient balance", 409)
+        if debit != APPLIED:
+            raise OrderError("Users service unavailable", 503)
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        created = order_id is None
+        if created:
+            cursor.execute(
+                "INSERT INTO orders (user_id, total_price, status) VALUES (%s,%s,%s)",
+                (user_id, total_price, "completed")
+            )
+            order_id = cursor.lastrowid
+        else:
+            # A cancel that got in while the debit was in flight wins; the debit is refunded below
+            cursor.execute(
+                "UPDATE orders SET total_price=%s, status='completed' WHERE id=%s AND status='pending'",
+                (total_price, order_id)
+            )
+            if cursor.rowcount != 1:
+                raise OrderError("Order is no longer pending", 409)
+        cursor.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, unit_price, line_total) VALUES (%s,%s,%s,%s,%s)",
+            [(order_id, i["product_id"], i["quantity"], i["unit_price"], i["line_total"]) for i in items]
         )
-        return r.status_code == 200
-    except:
-        return False
+        if created:
+            outbox.record_event(cursor, "created", order_id, user_id, total_price, "completed", items)
+        outbox.record_event(cursor, "completed", order_id, user_id, total_price, "completed", items)
+        conn.commit()
+        return order_id
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        if debit is not None:
+            reverse_debit(user_id, total_price, debit_key, f"order-{ref}-reversal", debit)
+        release_stock(quantities, reserve_key, release_key, reserved)
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 
-def update_product_stock(product_id, new_stock):
-    product = get_product(product_id)
-    if not product:
-        return False
+def place_order(user_id, quantities):
+    """Validate and place a multi-line order in one batched pass
+
+    Costs one user lookup and one batch product lookup (issued concurrently),
+    one batch stock reservation and one balance debit regardless of the
+    number of lines. The order header and its lines are written in a single
+    transaction. Returns the order with its items.
+    """
+    items, total_price = price_order(user_id, quantities)
+    order_id = commit_order(user_id, quantities, items, total_price)
+    return {
+        "id": order_id,
+        "user_id": user_id,
+        "status": "completed",
+        "total_price": total_price,
+        "items": items
+    }
+
+
+def submit_order(user_id, quantities):
+    """Persist the order as pending and queue it; no downstream calls are made here"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     try:
-        r = requests.put(
-            f"{PRODUCTS_SERVICE_URL}/api/products/{product_id}",
-            json={
-                "name": product["name"],
-                "description": product.get("description", ""),
-                "price": float(product["price"]),
-                "stock": int(new_stock),
-                "category": product.get("category", ""),
-                "image_url": product.get("image_url", "")
-            },
-            timeout=5
+        cursor.execute(
+            "INSERT INTO orders (user_id, total_price, status) VALUES (%s,%s,%s)",
+            (user_id, 0, "pending")
         )
-        return r.status_code == 200
-    except:
-        return False
+        order_id = cursor.lastrowid
+        outbox.record_event(cursor, "created", order_id, user_id, 0, "pending",
+                            [{"product_id": pid, "quantity": qty} for pid, qty in quantities.items()])
+        order_queue.enqueue(cursor, order_id, {
+            "user_id": user_id,
+            "items": [[pid, qty] for pid, qty in quantities.items()]
+        })
+        conn.commit()
+        return {"id": order_id, "user_id": user_id, "status": "pending"}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def process_order_job(order_id, payload):
+    """Worker handler: complete a pending order, or raise to retry / give up"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT status FROM orders WHERE id=%s", (order_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    # A redelivered job whose order was already settled has nothing left to do
+    if row is None or row[0] != "pending":
+        return
+
+    user_id = payload["user_id"]
+    quantities = {int(pid): int(qty) for pid, qty in payload["items"]}
+    service_client.set_deadline(time.monotonic() + REQUEST_DEADLINE)
+    try:
+        items, total_price = price_order(user_id, quantities)
+        commit_order(user_id, quantities, items, total_price, order_id=order_id)
+    except OrderError as e:
+        # A missing user or product and a shortfall are final; an outage (503) is retried
+        if e.status_code in (404, 409):
+            raise PermanentJobError(str(e))
+        raise
+
+
+def fail_order_job(order_id, payload, error):
+    """Worker callback for a job that will not be retried: cancel the pending order"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE orders SET status='cancelled' WHERE id=%s AND status='pending'", (order_id,))
+    if cursor.rowcount == 1:
+        outbox.record_event(cursor, "cancelled", order_id, payload["user_id"], 0, "cancelled")
+    conn.commit()
+    cursor.close()
+    conn.close()
+    app.logger.warning(f"Order #{order_id} cancelled by the order pipeline: {error}")
+
+
+outbox_sink = outbox.sink_from_spec(OUTBOX_SINK)
+outbox_relay = OutboxRelay(get_db_connection, outbox_sink, batch_size=OUTBOX_BATCH_SIZE,
+                           interval=OUTBOX_INTERVAL) if outbox_sink else None
+
+
+order_jobs = OrderJobQueue(
+    get_db_connection, process_order_job, fail_order_job,
+    workers=ORDER_WORKERS,
+    max_attempts=ORDER_JOB_MAX_ATTEMPTS,
+    backoff=ORDER_JOB_BACKOFF,
+    visibility_timeout=ORDER_JOB_VISIBILITY_TIMEOUT
+)
+
+
+order_archiver = OrderArchiver(
+    get_db_connection,
+    after_days=ORDER_ARCHIVE_AFTER_DAYS,
+    batch_size=ORDER_ARCHIVE_BATCH_SIZE,
+    interval=ORDER_ARCHIVE_INTERVAL
+) if ORDER_ARCHIVE_AFTER_DAYS > 0 else None
+
+
+def get_order(cursor, order_id, for_update=False):
+    """Order header plus its lines (via the order_items foreign-key index), or None
+
+    Falls back to the archive by primary key, flagging the order archived=1.
+    With for_update only live orders are returned, and the header row stays
+    locked until the caller's transaction ends.
+    """
+    cursor.execute(f"SELECT *, 0 AS archived FROM orders WHERE id=%s{' FOR UPDATE' if for_update else ''}",
+                   (order_id,))
+    order = cursor.fetchone()
+    items_table = "order_items"
+    if order is None and not for_update:
+        cursor.execute("SELECT *, 1 AS archived FROM orders_archive WHERE id=%s", (order_id,))
+        order = cursor.fetchone()
+        items_table = "order_items_archive"
+    if order:
+        cursor.execute(
+            f"SELECT product_id, quantity, unit_price, line_total FROM {items_table} WHERE order_id=%s ORDER BY id",
+            (order_id,)
+        )
+        order["items"] = cursor.fetchall()
+    return order
+
+
+def enrich_orders(cursor, orders):
+    """Attach user and product names to a page of orders in place
+
+    Lines for the whole page come from one order_items query, and names from
+    at most one batched call per upstream, so the cost does not grow with the
+    number of rows. Names are display-only: on lookup failure they stay None.
+    """
+    if not orders:
+        return orders
+    by_id = {o["id"]: o for o in orders}
+    for o in orders:
+        o["items"] = []
+    for items_table, archived in (("order_items", 0), ("order_items_archive", 1)):
+        ids = [o["id"] for o in orders if o["archived"] == archived]
+        if not ids:
+            continue
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT order_id, product_id, quantity FROM {items_table} WHERE order_id IN ({placeholders}) ORDER BY id",
+            ids
+        )
+        for item in cursor.fetchall():
+            by_id[item.pop("order_id")]["items"].append(item)
+
+    try:
+        users, products = lookup_names(
+            list(dict.fromkeys(o["user_id"] for o in orders)),
+            list(dict.fromkeys(i["product_id"] for o in orders for i in o["items"]))
+        )
+    except DownstreamError:
+        users, products = {}, {}
+
+    for o in orders:
+        user = users.get(o["user_id"])
+        o["user_name"] = user["name"] if user else None
+        o["user_email"] = user["email"] if user else None
+        for item in o["items"]:
+            product = products.get(item["product_id"])
+            item["product_name"] = product["name"] if product else None
+        o["product_name"] = ", ".join(
+            i["product_name"] or f"Product #{i['product_id']}" for i in o["items"]
+        ) or None
+    return orders
+
+
+def parse_order_time(value, end=False):
+    """ISO date or datetime; a bare date as an upper bound covers that whole day"""
+    stamp = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        stamp += timedelta(days=1)
+    return stamp
+
+
+def parse_order_filters(args):
+    """WHERE clauses, params and page size for the order listing params; raises ValueError
+
+    ?user_id=&status=&from=&to= filter, ?after= is the '<created_at ISO-8601>,<id>'
+    cursor from the previous page and ?limit= caps the page. from is inclusive,
+    to exclusive. Every combination is served by one of the (user_id, created_at),
+    (status, created_at) or (created_at) indexes, read backwards from the cursor.
+    """
+    limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    where = []
+    params = []
+    if args.get("user_id"):
+        where.append("user_id = %s")
+        params.append(int(args["user_id"]))
+    if args.get("status"):
+        if args["status"] not in ORDER_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(ORDER_STATUSES)}")
+        where.append("status = %s")
+        params.append(args["status"])
+    if args.get("from"):
+        where.append("created_at >= %s")
+        params.append(parse_order_time(args["from"]))
+    if args.get("to"):
+        where.append("created_at < %s")
+        params.append(parse_order_time(args["to"], end=True))
+    if args.get("after"):
+        stamp, _, last_id = args["after"].rpartition(",")
+        stamp = datetime.fromisoformat(stamp)
+        where.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend([stamp, stamp, int(last_id)])
+    return where or ["1=1"], params, limit
+
+
+def orders_page_sql(table, where):
+    archived = 1 if table == "orders_archive" else 0
+    return (f"SELECT *, {archived} AS archived FROM {table} WHERE {' AND '.join(where)} "
+            f"ORDER BY created_at DESC, id DESC")
+
+
+def fetch_orders_page(cursor, where, params, limit):
+    """One page of order headers, newest first, plus the cursor for the next page (or None)
+
+    Pages come from the hot table alone unless they reach back to the newest
+    archived order, in which case the archive's matching rows are merged in.
+    Every archived order is older than that point, so recent pages never
+    touch the archive beyond one MAX(created_at) index lookup.
+    """
+    cursor.execute(orders_page_sql("orders", where) + " LIMIT %s", params + [limit + 1])
+    orders = cursor.fetchall()
+
+    cursor.execute("SELECT MAX(created_at) AS newest FROM orders_archive")
+    newest_archived = cursor.fetchone()["newest"]
+    if newest_archived is not None and (len(orders) <= limit or newest_archived >= orders[limit - 1]["created_at"]):
+        cursor.execute(orders_page_sql("orders_archive", where) + " LIMIT %s", params + [limit + 1])
+        orders = sorted(orders + cursor.fetchall(), key=lambda o: (o["created_at"], o["id"]), reverse=True)
+
+    if len(orders) <= limit:
+        return orders[:limit], None
+    orders = orders[:limit]
+    return orders, f"{orders[-1]['created_at'].isoformat()},{orders[-1]['id']}"
 
 
 # ------------------ ROUTES ------------------
@@ -164,21 +830,28 @@ def index():
 
 @app.route('/orders')
 def list_orders():
+    filters = {k: v for k, v in request.args.items() if k in ("user_id", "status", "from", "to") and v}
+    try:
+        where, params, limit = parse_order_filters(request.args)
+    except ValueError as e:
+        flash(f"Invalid filter: {e}", "danger")
+        return render_template("list_orders.html", orders=[], filters=filters, next_after=None)
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM orders ORDER BY created_at DESC")
-        orders = cursor.fetchall()
+        orders, next_after = fetch_orders_page(cursor, where, params, limit)
+        enrich_orders(cursor, orders)
         cursor.close()
         conn.close()
 
         for o in orders:
             o["total_price"] = float(o["total_price"])
 
-        return render_template("list_orders.html", orders=orders)
+        return render_template("list_orders.html", orders=orders, filters=filters, next_after=next_after)
     except Exception as e:
         flash(f"Error loading orders: {e}", "danger")
-        return render_template("list_orders.html", orders=[])
+        return render_template("list_orders.html", orders=[], filters=filters, next_after=None)
 
 
 @app.route('/orders/create', methods=['GET', 'POST'])
@@ -193,48 +866,14 @@ def create_order():
                 flash("Quantity must be > 0", "danger")
                 return redirect(url_for("create_order"))
 
-            user = get_user(user_id)
-            product = get_product(product_id)
-
-            if not user or not product:
-                flash("Invalid user or product", "danger")
-                return redirect(url_for("create_order"))
-
-            total_price = product["price"] * qty
-
-            if user["cash_balance"] < total_price:
-                flash("Insufficient balance", "danger")
-                return redirect(url_for("create_order"))
-
-            if product["stock"] < qty:
-                flash("Insufficient stock", "danger")
-                return redirect(url_for("create_order"))
-
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO orders (user_id, product_id, quantity, total_price, status) VALUES (%s,%s,%s,%s,%s)",
-                (user_id, product_id, qty, total_price, "completed")
-            )
-            order_id = cursor.lastrowid
-
-            if not update_user_balance(user_id, user["cash_balance"] - total_price):
-                conn.rollback()
-                flash("Error updating user balance", "danger")
-                return redirect(url_for("create_order"))
-
-            if not update_product_stock(product_id, product["stock"] - qty):
-                conn.rollback()
-                flash("Error updating product stock", "danger")
-                return redirect(url_for("create_order"))
-
-            conn.commit()
-            cursor.close()
-            conn.close()
+            order_id = place_order(user_id, {product_id: qty})["id"]
 
             flash(f"Order #{order_id} created!", "success")
             return redirect(url_for("order_details", order_id=order_id))
 
+        except OrderError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("create_order"))
         except Exception as e:
             flash(f"Error creating order: {e}", "danger")
             return redirect(url_for("create_order"))
@@ -247,8 +886,7 @@ def order_details(order_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM orders WHERE id=%s", (order_id,))
-        order = cursor.fetchone()
+        order = get_order(cursor, order_id)
         cursor.close()
         conn.close()
 
@@ -256,6 +894,25 @@ def order_details(order_id):
             flash("Order not found", "danger")
             return redirect(url_for("list_orders"))
 
+        # Names are display-only, so a slow or failed lookup degrades to 'N/A';
+        # the user is read fresh because the page shows the live balance
+        try:
+            user, products = fan_out(
+                lambda: get_user(order["user_id"]),
+                lambda: product_lookup.get_many(list(dict.fromkeys(i["product_id"] for i in order["items"])),
+                                                batched(get_products_by_ids, PRODUCTS_BATCH_SIZE)),
+                fail_fast=False
+            )
+        except DownstreamError:
+            user, products = None, None
+        if user:
+            order.update(user_name=user["name"], user_email=user["email"], user_balance=user["cash_balance"])
+        for item in order["items"]:
+            product = (products or {}).get(item["product_id"])
+            item["product_name"] = product["name"] if product else None
+            item["unit_price"] = float(item["unit_price"])
+            item["line_total"] = float(item["line_total"])
+
         order["total_price"] = float(order["total_price"])
         return render_template("order_details.html", order=order)
 
@@ -266,55 +923,149 @@ def order_details(order_id):
 
 @app.route('/orders/cancel/<int:order_id>')
 def cancel_order(order_id):
+    conn = cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM orders WHERE id=%s", (order_id,))
-        order = cursor.fetchone()
+        # Lock first so an in-flight pipeline job either finished (and its lines are
+        # visible here) or will see the cancellation and back out
+        order = get_order(cursor, order_id, for_update=True)
 
         if not order:
+            conn.rollback()
+            if get_order(cursor, order_id):
+                flash("Archived orders cannot be cancelled", "warning")
+                return redirect(url_for("order_details", order_id=order_id))
             flash("Order not found", "danger")
             return redirect(url_for("list_orders"))
 
         if order["status"] == "cancelled":
+            conn.rollback()
             flash("Already cancelled", "warning")
             return redirect(url_for("order_details", order_id=order_id))
 
-        # Refund user
-        user = get_user(order["user_id"])
-        if user:
-            update_user_balance(order["user_id"], user["cash_balance"] + float(order["total_price"]))
-
-        # Restock product
-        product = get_product(order["product_id"])
-        if product:
-            update_product_stock(order["product_id"], product["stock"] + order["quantity"])
+        # Claim the cancellation first; the row lock makes a concurrent cancel wait and then skip
+        cursor.execute("UPDATE orders SET status='cancelled' WHERE id=%s AND status<>'cancelled'", (order_id,))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            flash("Already cancelled", "warning")
+            return redirect(url_for("order_details", order_id=order_id))
 
-        cursor.execute("UPDATE orders SET status='cancelled' WHERE id=%s", (order_id,))
+        # Committed before the refund and restock: whatever happens to them, a repeated
+        # cancel finds the order cancelled and cannot refund or restock a second time
+        outbox.record_event(cursor, "cancelled", order_id, order["user_id"], order["total_price"],
+                            "cancelled", order["items"])
         conn.commit()
-        cursor.close()
-        conn.close()
 
-        flash(f"Order #{order_id} cancelled", "success")
+        if not order["items"]:
+            # A queued order that was never processed: nothing was debited or reserved
+            flash(f"Order #{order_id} cancelled", "success")
+            return redirect(url_for("order_details", order_id=order_id))
+
+        # Refund and restock (both keyed so they cannot apply twice) are independent
+        # writes and run concurrently; neither is cancelled when the other fails
+        try:
+            refunded, restocked = fan_out(
+                lambda: adjust_user_balance(order["user_id"], float(order["total_price"]),
+                                            f"order-{order_id}-refund") == APPLIED,
+                lambda: adjust_stock_batch({i["product_id"]: i["quantity"] for i in order["items"]},
+                                           f"order-{order_id}-restock") == APPLIED,
+                fail_fast=False
+            )
+        except DownstreamError:
+            # The deadline passed with a leg still running; it may yet apply
+            refunded = restocked = None
+
+        incomplete = [step for step, ok in (("refund", refunded), ("restock", restocked)) if not ok]
+        if incomplete:
+            app.logger.warning(f"Order #{order_id} cancelled, but the {' and '.join(incomplete)} did not complete")
+            flash(f"Order #{order_id} cancelled, but the {' and '.join(incomplete)} did not complete", "warning")
+        else:
+            flash(f"Order #{order_id} cancelled", "success")
         return redirect(url_for("order_details", order_id=order_id))
 
     except Exception as e:
+        if conn is not None:
+            conn.rollback()
         flash(f"Error cancelling: {e}", "danger")
         return redirect(url_for("list_orders"))
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 
 # ------------------ API + HEALTH ------------------
 
 @app.route('/api/orders')
 def api_orders():
+    """Order headers, newest first: ?user_id=&status=&from=&to=&after=&limit=
+
+    The body stays a JSON array; when more rows exist the next cursor is sent
+    in the X-Next-After header. With ?stream=1 or Accept: application/x-ndjson
+    every matching row after the cursor is streamed and limit is ignored.
+    """
+    try:
+        where, params, limit = parse_order_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid listing parameters: {e}"}), 400
+
+    if wants_stream():
+        try:
+            # Each table is read backwards along its own index and the two ordered streams are
+            # merged here; sorting their UNION would make MySQL materialise the whole history
+            return stream_merged(
+                [(get_db_connection(), orders_page_sql(table, where), params)
+                 for table in ("orders", "orders_archive")],
+                order=("created_at", "id"), descending=True
+            )
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM orders ORDER BY created_at DESC")
-        data = cursor.fetchall()
+        data, next_after = fetch_orders_page(cursor, where, params, limit)
         cursor.close()
         conn.close()
-        return jsonify(data)
+        response = jsonify(data)
+        if next_after:
+            response.headers["X-Next-After"] = next_after
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/orders', methods=['POST'])
+def api_create_order():
+    """Place a whole cart: {"user_id": 1, "items": [{"product_id": 2, "quantity": 3}, ...]}
+
+    A single-line body ({"user_id", "product_id", "quantity"}) is also accepted.
+    With "async": true (or Prefer: respond-async) the order is stored as pending,
+    queued for the background workers and acknowledged with 202.
+    """
+    try:
+        data = request.get_json()
+        if not data or 'user_id' not in data:
+            return jsonify({"error": "Missing required field: user_id"}), 400
+        try:
+            user_id = int(data['user_id'])
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid user_id"}), 400
+
+        lines = data.get('items')
+        if lines is None and 'product_id' in data:
+            lines = [{"product_id": data['product_id'], "quantity": data.get('quantity')}]
+
+        quantities = parse_order_lines(lines)
+        if data.get('async') or 'respond-async' in request.headers.get('Prefer', ''):
+            order = submit_order(user_id, quantities)
+            return jsonify(order), 202, {"Location": url_for("api_order", order_id=order["id"])}
+        return jsonify(place_order(user_id, quantities)), 201
+
+    except OrderError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -324,8 +1075,7 @@ def api_order(order_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM orders WHERE id=%s", (order_id,))
-        order = cursor.fetchone()
+        order = get_order(cursor, order_id)
         cursor.close()
         conn.close()
         if order:
@@ -348,6 +1098,74 @@ def health():
         return jsonify({"status": "unhealthy", "error": str(e)}), 500
 
 
+@app.route('/health/upstreams')
+def upstream_stats():
+    return jsonify(service_client.all_stats())
+
+
+@app.route('/health/lookups')
+def lookup_stats():
+    return jsonify({"users": user_lookup.stats(), "products": product_lookup.stats()})
+
+
+@app.route('/health/outbox')
+def outbox_stats():
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT MAX(id) AS last_event_id FROM order_events")
+        last_event_id = cursor.fetchone()["last_event_id"] or 0
+        cursor.execute("SELECT sink, last_event_id FROM outbox_offsets")
+        sinks = {row["sink"]: {"last_event_id": row["last_event_id"],
+                               "backlog": max(last_event_id - row["last_event_id"], 0)}
+                 for row in cursor.fetchall()}
+        cursor.close()
+        conn.close()
+        return jsonify({
+            "last_event_id": last_event_id,
+            "sinks": sinks,
+            "relay": outbox_relay.stats() if outbox_relay else None
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/health/archive')
+def archive_stats():
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            """SELECT TABLE_NAME AS name, TABLE_ROWS AS approx_rows FROM information_schema.TABLES
+               WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('orders', 'orders_archive')"""
+        )
+        tables = {row["name"]: row["approx_rows"] for row in cursor.fetchall()}
+        cursor.close()
+        conn.close()
+        return jsonify({
+            "hot_rows": tables.get("orders"),
+            "archived_rows": tables.get("orders_archive"),
+            "archiver": order_archiver.stats() if order_archiver else None
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/health/queue')
+def queue_stats():
+    try:
+        return jsonify(order_jobs.stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == "__main__":
     init_db()
+    # The debug reloader runs this file twice; only the serving child should consume jobs
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        order_jobs.start()
+        if outbox_relay:
+            outbox_relay.start()
+        if order_archiver:
+            order_archiver.start()
     app.run(host="0.0.0.0", port=5000, debug=True)
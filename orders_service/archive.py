@@ -0,0 +1,108 @@
+"""Hot/archive split for order history.
+
+Finished (completed or cancelled) orders older than `after_days` are moved,
+lines included, from orders/order_items into orders_archive and
+order_items_archive by an OrderArchiver thread. The hot tables then hold
+recent orders plus anything still pending, so their indexes stay small no
+matter how much history accumulates. Archived orders are read-only; the
+all_orders and all_order_items views give reporting queries the full history.
+"""
+import threading
+
+import mysql.connector
+
+# LIKE keeps the column order identical, so rows can be moved with SELECT *
+CREATE_TABLES_SQL = (
+    "CREATE TABLE IF NOT EXISTS orders_archive LIKE orders",
+    "CREATE TABLE IF NOT EXISTS order_items_archive LIKE order_items",
+    '''
+    CREATE OR REPLACE VIEW all_orders AS
+        SELECT * FROM orders UNION ALL SELECT * FROM orders_archive
+    ''',
+    '''
+    CREATE OR REPLACE VIEW all_order_items AS
+        SELECT * FROM order_items UNION ALL SELECT * FROM order_items_archive
+    ''',
+)
+
+
+class OrderArchiver:
+    """Background thread moving old finished orders to the archive tables in batches"""
+
+    def __init__(self, get_connection, after_days=180, batch_size=500, interval=300):
+        self.get_connection = get_connection
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"archived": 0, "batches": 0, "errors": 0, "last_error": None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="order-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                moved = self.archive_once()
+            except Exception as e:
+                moved = 0
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = str(e)[:200]
+            # Work through a backlog back-to-back; otherwise check again later
+            if moved < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def archive_once(self):
+        """Move one batch in a single transaction; returns how many orders moved"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            conn.start_transaction()
+            # Oldest first along idx_orders_created; SKIP LOCKED leaves orders that are
+            # being cancelled right now for the next round instead of waiting on them
+            cursor.execute(
+                """SELECT id FROM orders
+                   WHERE created_at < NOW() - INTERVAL %s DAY AND status <> 'pending'
+                   ORDER BY created_at, id LIMIT %s
+                   FOR UPDATE SKIP LOCKED""",
+                (self.after_days, self.batch_size)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                conn.rollback()
+                return 0
+
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"INSERT INTO orders_archive SELECT * FROM orders WHERE id IN ({placeholders})", ids)
+            cursor.execute(
+                f"INSERT INTO order_items_archive SELECT * FROM order_items WHERE order_id IN ({placeholders})", ids
+            )
+            # order_items rows go with their orders through ON DELETE CASCADE
+            cursor.execute(f"DELETE FROM orders WHERE id IN ({placeholders})", ids)
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            self._stats["archived"] += len(ids)
+            self._stats["batches"] += 1
+        return len(ids)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["after_days"] = self.after_days
+        return stats
@@ -0,0 +1,72 @@
+"""Short-lived id -> record cache for display lookups (user and product names).
+
+get_many() serves the ids it holds and resolves every miss with a single
+call to the batch loader, so enriching a page costs at most one upstream
+request per cache regardless of how many rows reference the same ids. Ids
+the upstream reported missing are cached too, so a deleted user does not
+trigger a lookup on every page view. Only use it where slightly stale data
+is acceptable; pricing and balances must keep reading the source of truth.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LookupCache:
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'batches': 0, 'load_errors': 0, 'evictions': 0}
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or now - entry[1] >= self.ttl:
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get_many(self, ids, loader):
+        """{id: record or None} for ids; loader(missing_ids) returns {id: record} or None on failure
+
+        When the loader fails the misses are simply left out of the result, so
+        callers should treat an absent id as unknown rather than nonexistent.
+        """
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in ids:
+                value = self._get(key, now)
+                if value is not _MISSING:
+                    found[key] = value
+            missing = [key for key in dict.fromkeys(ids) if key not in found]
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(missing)
+        if not missing:
+            return found
+
+        loaded = loader(missing)
+        with self._lock:
+            self._stats['batches'] += 1
+            if loaded is None:
+                self._stats['load_errors'] += 1
+                return found
+            now = time.monotonic()
+            for key in missing:
+                value = loaded.get(key)
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+                found[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
@@ -0,0 +1,238 @@
+"""Durable job queue for asynchronous order processing.
+
+Jobs live in the order_jobs table, so a restart loses nothing. Workers
+claim one job at a time with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of workers (in any number of processes) can drain the same table
+without handing a job out twice. Failed jobs are retried with exponential
+backoff; jobs whose worker died mid-flight are re-queued once their claim
+is older than the visibility timeout.
+"""
+import json
+import socket
+import threading
+import time
+
+import mysql.connector
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS order_jobs (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL UNIQUE,
+        payload JSON NOT NULL,
+        status ENUM('queued','processing','done','failed') NOT NULL DEFAULT 'queued',
+        attempts INT NOT NULL DEFAULT 0,
+        available_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        locked_by VARCHAR(100),
+        locked_at TIMESTAMP(6) NULL,
+        last_error VARCHAR(500),
+        created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+        INDEX idx_order_jobs_status_available (status, available_at)
+    )
+'''
+
+
+class PermanentJobError(Exception):
+    """The job can never succeed (e.g. insufficient stock); do not retry it"""
+
+
+def enqueue(cursor, order_id, payload):
+    """Add a job using the caller's cursor, so it commits atomically with the order"""
+    cursor.execute(
+        "INSERT INTO order_jobs (order_id, payload) VALUES (%s, %s)",
+        (order_id, json.dumps(payload))
+    )
+
+
+class OrderJobQueue:
+    """Pool of worker threads draining order_jobs
+
+    `handler(order_id, payload)` processes a job; raising PermanentJobError
+    (or exhausting `max_attempts`) hands the job to `on_failed(order_id,
+    payload, error)` and marks it failed. Any other exception is retried.
+    """
+
+    def __init__(self, get_connection, handler, on_failed, workers=2, poll_interval=0.5,
+                 max_attempts=5, backoff=1.0, visibility_timeout=60, retention_days=7):
+        self.get_connection = get_connection
+        self.handler = handler
+        self.on_failed = on_failed
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.visibility_timeout = visibility_timeout
+        self.retention_days = retention_days
+        self.worker_id_prefix = f'{socket.gethostname()}-{id(self):x}'
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._stats = {'processed': 0, 'succeeded': 0, 'retried': 0, 'failed': 0,
+                       'processing_ms_total': 0.0, 'requeued_stale': 0}
+
+    def start(self):
+        self._started_at = time.monotonic()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f'{self.worker_id_prefix}-{i}',),
+                                      name=f'order-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id):
+        last_maintenance = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_maintenance >= self.visibility_timeout / 2:
+                    self._maintain()
+                    last_maintenance = time.monotonic()
+                if not self._process_one(worker_id):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                # A database outage must not kill the worker; back off and try again
+                print(f"Order worker {worker_id} error: {e}")
+                self._stop.wait(self.poll_interval * 4)
+
+    def _claim(self, worker_id):
+        conn = self.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            conn.start_transaction()
+            cursor.execute(
+                """SELECT id, order_id, payload, attempts FROM order_jobs
+                   WHERE status = 'queued' AND available_at <= NOW(6)
+                   ORDER BY available_at, id LIMIT 1
+                   FOR UPDATE SKIP LOCKED"""
+            )
+            job = cursor.fetchone()
+            if job is None:
+                conn.rollback()
+                return None
+            cursor.execute(
+                """UPDATE order_jobs SET status = 'processing', attempts = attempts + 1,
+                          locked_by = %s, locked_at = NOW(6)
+                   WHERE id = %s""",
+                (worker_id, job['id'])
+            )
+            conn.commit()
+            job['attempts'] += 1
+            job['payload'] = json.loads(job['payload'])
+            return job
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _finish(self, job_id, worker_id, status, error=None, retry_in=None):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if retry_in is None:
+                cursor.execute(
+                    """UPDATE order_jobs SET status = %s, last_error = %s, locked_by = NULL, locked_at = NULL
+                       WHERE id = %s AND locked_by = %s""",
+                    (status, error, job_id, worker_id)
+                )
+            else:
+                cursor.execute(
+                    """UPDATE order_jobs SET status = 'queued', last_error = %s, locked_by = NULL, locked_at = NULL,
+                              available_at = NOW(6) + INTERVAL %s MICROSECOND
+                       WHERE id = %s AND locked_by = %s""",
+                    (error, int(retry_in * 1000000), job_id, worker_id)
+                )
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _process_one(self, worker_id):
+        """Claim and run one job; returns False when the queue had nothing ready"""
+        job = self._claim(worker_id)
+        if job is None:
+            return False
+
+        started = time.monotonic()
+        outcome = 'succeeded'
+        try:
+            self.handler(job['order_id'], job['payload'])
+            self._finish(job['id'], worker_id, 'done')
+        except Exception as e:
+            error = str(e)[:500]
+            if isinstance(e, PermanentJobError) or job['attempts'] >= self.max_attempts:
+                outcome = 'failed'
+                self.on_failed(job['order_id'], job['payload'], error)
+                self._finish(job['id'], worker_id, 'failed', error)
+            else:
+                outcome = 'retried'
+                self._finish(job['id'], worker_id, 'queued', error,
+                             retry_in=self.backoff * (2 ** (job['attempts'] - 1)))
+
+        with self._lock:
+            self._stats['processed'] += 1
+            self._stats[outcome] += 1
+            self._stats['processing_ms_total'] += (time.monotonic() - started) * 1000
+        return True
+
+    def _maintain(self):
+        """Re-queue jobs whose worker vanished and prune old finished jobs"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """UPDATE order_jobs SET status = 'queued', locked_by = NULL, locked_at = NULL
+                   WHERE status = 'processing' AND locked_at < NOW(6) - INTERVAL %s SECOND""",
+                (self.visibility_timeout,)
+            )
+            requeued = cursor.rowcount
+            cursor.execute(
+                """DELETE FROM order_jobs
+                   WHERE status = 'done' AND updated_at < NOW(6) - INTERVAL %s DAY LIMIT 1000""",
+                (self.retention_days,)
+            )
+            conn.commit()
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        if requeued:
+            with self._lock:
+                self._stats['requeued_stale'] += requeued
+
+    def stats(self):
+        """Queue depth and lag from the table plus this process's worker throughput"""
+        conn = self.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                """SELECT status, COUNT(*) AS jobs,
+                          TIMESTAMPDIFF(MICROSECOND, MIN(available_at), NOW(6)) / 1000 AS oldest_ms
+                   FROM order_jobs WHERE status IN ('queued', 'processing', 'failed')
+                   GROUP BY status"""
+            )
+            by_status = {row['status']: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+        queued = by_status.get('queued', {})
+        with self._lock:
+            stats = dict(self._stats)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        stats.update({
+            'workers': len(self._threads),
+            'depth': queued.get('jobs', 0),
+            'processing': by_status.get('processing', {}).get('jobs', 0),
+            'failed_jobs': by_status.get('failed', {}).get('jobs', 0),
+            # Age of the oldest job that is ready to run; jobs still in retry backoff count as 0
+            'lag_ms': max(float(queued.get('oldest_ms') or 0), 0.0),
+            'avg_processing_ms': stats['processing_ms_total'] / stats['processed'] if stats['processed'] else 0.0,
+            'throughput_per_sec': stats['processed'] / uptime if uptime else 0.0,
+        })
+        return stats
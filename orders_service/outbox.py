@@ -0,0 +1,239 @@
+"""Transactional outbox for order events.
+
+Order changes call record_event() with the cursor of the transaction that
+changes the order, so an event exists if and only if the change committed.
+An OutboxRelay thread then reads events in id order and hands them to a
+sink in batches, remembering per sink how far it got in outbox_offsets.
+Delivery is at-least-once: a batch is re-sent if the relay dies before
+saving its offset, so consumers should de-duplicate on the event id.
+"""
+import json
+import threading
+
+import requests
+
+CREATE_TABLES_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS order_events (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        event_type ENUM('created','completed','cancelled') NOT NULL,
+        user_id INT NOT NULL,
+        total_price DECIMAL(10,2) NOT NULL,
+        payload JSON NOT NULL,
+        created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        INDEX idx_order_events_order (order_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS outbox_offsets (
+        sink VARCHAR(100) PRIMARY KEY,
+        last_event_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+    )
+    ''',
+)
+
+
+def record_event(cursor, event_type, order_id, user_id, total_price, status, items=()):
+    """Write an order event inside the caller's transaction"""
+    payload = {
+        "status": status,
+        # Lines of a still-pending order are not priced yet, so line_total may be None
+        "items": [{"product_id": i["product_id"], "quantity": i["quantity"],
+                   "line_total": float(i["line_total"]) if i.get("line_total") is not None else None}
+                  for i in items],
+    }
+    cursor.execute(
+        "INSERT INTO order_events (order_id, event_type, user_id, total_price, payload) VALUES (%s,%s,%s,%s,%s)",
+        (order_id, event_type, user_id, total_price, json.dumps(payload))
+    )
+
+
+# ------------------ SINKS ------------------
+
+class FileSink:
+    """Appends events as NDJSON to a local file"""
+
+    ready = True
+
+    def __init__(self, path):
+        self.name = f"file:{path}"
+        self.path = path
+
+    def publish(self, events):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(e, default=str) + "\n" for e in events))
+
+
+class HttpSink:
+    """POSTs {"events": [...]} to a URL; any non-2xx response fails the batch"""
+
+    ready = True
+
+    def __init__(self, url, timeout=5):
+        self.name = url
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def publish(self, events):
+        resp = self.session.post(self.url, data=json.dumps({"events": events}, default=str),
+                                 headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        resp.raise_for_status()
+
+
+class InProcessSink:
+    """Calls each subscriber with every batch, e.g. to keep in-memory state current
+
+    Not ready until something subscribes, so events wait in the outbox rather
+    than being published to nobody and skipped.
+    """
+
+    def __init__(self, name="in-process"):
+        self.name = name
+        self.subscribers = []
+
+    @property
+    def ready(self):
+        return bool(self.subscribers)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def publish(self, events):
+        for callback in self.subscribers:
+            callback(events)
+
+
+def sink_from_spec(spec):
+    """Build a sink from OUTBOX_SINK: 'file:/path', 'http(s)://...' or 'in-process'; '' means none"""
+    if not spec:
+        return None
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    if spec.startswith(("http://", "https://")):
+        return HttpSink(spec)
+    if spec == "in-process":
+        return InProcessSink()
+    raise ValueError(f"Unknown OUTBOX_SINK: {spec}")
+
+
+# ------------------ RELAY ------------------
+
+class OutboxRelay:
+    """Background thread publishing order_events to one sink in id order
+
+    Events younger than `settle_seconds` are held back: ids are assigned at
+    insert but become visible at commit, so a slower transaction could
+    otherwise commit a lower id after the relay has moved past it.
+    """
+
+    def __init__(self, get_connection, sink, batch_size=500, interval=1.0, settle_seconds=2,
+                 retention_days=7):
+        self.get_connection = get_connection
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.retention_days = retention_days
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "batches": 0, "errors": 0, "last_event_id": None, "last_error": None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                published = self.relay_once()
+            except Exception as e:
+                published = 0
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = str(e)[:200]
+            # Drain a backlog back-to-back; otherwise poll
+            if published < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def relay_once(self):
+        """Publish one batch; returns how many events were sent"""
+        # The offset only moves past events a sink actually took
+        if not self.sink.ready:
+            return 0
+        conn = self.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            conn.start_transaction()
+            cursor.execute("INSERT IGNORE INTO outbox_offsets (sink) VALUES (%s)", (self.sink.name,))
+            # The offset row lock keeps two relays for the same sink from double-sending
+            cursor.execute("SELECT last_event_id FROM outbox_offsets WHERE sink=%s FOR UPDATE", (self.sink.name,))
+            offset = cursor.fetchone()["last_event_id"]
+            cursor.execute(
+                """SELECT id, order_id, event_type, user_id, total_price, payload, created_at
+                   FROM order_events
+                   WHERE id > %s AND created_at <= NOW(6) - INTERVAL %s MICROSECOND
+                   ORDER BY id LIMIT %s""",
+                (offset, int(self.settle_seconds * 1000000), self.batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                conn.rollback()
+                return 0
+
+            events = []
+            for row in rows:
+                event = dict(json.loads(row.pop("payload")), **row)
+                event["total_price"] = float(event["total_price"])
+                event["created_at"] = row["created_at"].isoformat()
+                events.append(event)
+            self.sink.publish(events)
+
+            last_id = rows[-1]["id"]
+            cursor.execute("UPDATE outbox_offsets SET last_event_id=%s WHERE sink=%s", (last_id, self.sink.name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            self._stats["published"] += len(events)
+            self._stats["batches"] += 1
+            self._stats["last_event_id"] = last_id
+        self._prune()
+        return len(events)
+
+    def _prune(self):
+        """Drop old events every sink has already published"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT MIN(last_event_id) FROM outbox_offsets")
+            (floor,) = cursor.fetchone()
+            if floor:
+                cursor.execute(
+                    "DELETE FROM order_events WHERE id <= %s AND created_at < NOW(6) - INTERVAL %s DAY LIMIT 1000",
+                    (floor, self.retention_days)
+                )
+                conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["sink"] = self.sink.name
+        stats["sink_ready"] = self.sink.ready
+        return stats
@@ -0,0 +1,319 @@
+"""Inter-service HTTP client shared by the services that call other services.
+
+Each upstream gets one pooled keep-alive Session. Calls carry the caller's
+remaining time budget in the X-Request-Deadline-Ms header, idempotent calls
+are retried with jittered backoff, and per-upstream latency is recorded in
+histograms. Clients can optionally fail fast behind a circuit breaker and
+hedge slow idempotent reads. Keep the copies of this file in each service
+identical.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+_clients = {}
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+
+def set_deadline(deadline):
+    """Set the monotonic deadline for outbound calls made in this context"""
+    _deadline.set(deadline)
+
+
+def get_deadline():
+    return _deadline.get()
+
+
+def deadline_from_headers(headers, default_budget):
+    """Monotonic deadline for an incoming request, honouring the caller's budget"""
+    budget = default_budget
+    try:
+        if headers.get(DEADLINE_HEADER):
+            budget = min(budget, int(headers[DEADLINE_HEADER]) / 1000.0)
+    except ValueError:
+        pass
+    return time.monotonic() + budget
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """No time left in the request budget to make (or retry) a call"""
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The upstream's circuit is open, so the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a rolling window of call outcomes
+
+    Opens once at least `min_calls` of the last `window` calls have been seen
+    and the failure ratio reaches `failure_ratio`. After `reset_timeout`
+    seconds a single trial call is let through (half-open); its outcome
+    closes or re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_ratio=0.5, window=20, min_calls=10, reset_timeout=10):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.rejected = 0
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if success:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self._state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_ratio):
+                self._trip()
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self._outcomes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'rejected': self.rejected,
+                'window_calls': len(self._outcomes),
+                'window_failures': self._outcomes.count(False),
+            }
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+
+    def record(self, elapsed_ms, error=False):
+        index = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum_ms += elapsed_ms
+            if error:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_hedge(self):
+        with self._lock:
+            self.hedges += 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, or None if empty"""
+        with self._lock:
+            counts, total = list(self.counts), self.total
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {f'le_{b}': c for b, c in zip(LATENCY_BUCKETS_MS, self.counts)}
+            buckets['le_inf'] = self.counts[-1]
+            return {
+                'count': self.total,
+                'errors': self.errors,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'avg_ms': self.sum_ms / self.total if self.total else 0.0,
+                'buckets': buckets,
+            }
+
+
+class ServiceClient:
+    """Pooled, deadline-aware client for a single upstream service"""
+
+    def __init__(self, name, base_url, timeout=5, retries=2, backoff=0.05, pool_size=20,
+                 breaker=None, hedge_min_samples=20):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyHistogram()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        _clients[name] = self
+
+    def _timeout(self, deadline, timeout):
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f'Deadline exceeded before calling {self.name}')
+        return min(timeout, remaining)
+
+    def _hedge_delay(self):
+        """Observed p95 in seconds, or None until there are enough samples to trust it"""
+        if self.latency.total < self.hedge_min_samples:
+            return None
+        p95 = self.latency.percentile(0.95)
+        return None if p95 == float('inf') else p95 / 1000.0
+
+    def _send(self, method, url, hedge, **kwargs):
+        """One attempt; with hedge, a second copy is fired if the first outlives the p95"""
+        delay = self._hedge_delay() if hedge else None
+        if delay is None or delay >= kwargs['timeout']:
+            return self.session.request(method, url, **kwargs)
+
+        first = _hedge_pool.submit(self.session.request, method, url, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self.latency.record_hedge()
+        pending = {first, _hedge_pool.submit(self.session.request, method, url, **kwargs)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower copy finishes in the background and is discarded
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def request(self, method, path, retries=None, hedge=False, **kwargs):
+        """Send a request; raises requests exceptions like requests.request does
+
+        `timeout` overrides the client default for this call; either way it is
+        capped by the time left before the context deadline. Only idempotent
+        methods, or calls carrying an Idempotency-Key header, are retried on
+        connection errors, timeouts and 502/503/504. `hedge` (idempotent
+        methods only) fires a second copy once an attempt outlives the
+        observed p95. Raises CircuitOpenError while the breaker is open.
+        """
+        method = method.upper()
+        headers = dict(kwargs.pop('headers', None) or {})
+        hedge = hedge and method in IDEMPOTENT_METHODS
+        if retries is None:
+            retryable = method in IDEMPOTENT_METHODS or 'Idempotency-Key' in headers
+            retries = self.retries if retryable else 0
+        per_call_timeout = kwargs.pop('timeout', None) or self.timeout
+        deadline = get_deadline()
+        url = f'{self.base_url}{path}'
+
+        attempt = 0
+        while True:
+            timeout = self._timeout(deadline, per_call_timeout)
+            if deadline is not None:
+                headers[DEADLINE_HEADER] = str(int((deadline - time.monotonic()) * 1000))
+            if self.breaker is not None and not self.breaker.allow():
+                raise CircuitOpenError(f'Circuit open for {self.name}')
+
+            started = time.monotonic()
+            try:
+                resp = self._send(method, url, hedge, headers=headers, timeout=timeout, **kwargs)
+                failed = resp.status_code >= 500
+                self.latency.record((time.monotonic() - started) * 1000, error=failed)
+                if self.breaker is not None:
+                    self.breaker.record(not failed)
+                if resp.status_code not in RETRYABLE_STATUSES or attempt >= retries:
+                    return resp
+            except requests.exceptions.RequestException as e:
+                self.latency.record((time.monotonic() - started) * 1000, error=True)
+                if self.breaker is not None:
+                    self.breaker.record(False)
+                transient = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                if not transient or attempt >= retries:
+                    raise
+
+            attempt += 1
+            self.latency.record_retry()
+            # Full jitter keeps retries from concurrent callers from arriving in lockstep
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded(f'Deadline exceeded while retrying {self.name}')
+            time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def stats(self):
+        stats = self.latency.snapshot()
+        stats['base_url'] = self.base_url
+        if self.breaker is not None:
+            stats['circuit'] = self.breaker.snapshot()
+        for label, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            value = self.latency.percentile(q)
+            # Beyond the last bucket there is no finite bound to report
+            stats[label] = None if value == float('inf') else value
+        return stats
+
+
+def all_stats():
+    """Latency stats for every client created in this process"""
+    return {name: client.stats() for name, client in _clients.items()}
@@ -1,7 +1,16 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, g
 import mysql.connector
+import csv
+import hashlib
+import io
+import json
 import os
-import time
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from db_pool import ConnectionPool
+from streaming import wants_stream, stream_query
 
 app = Flask(__name__)
 app.secret_key = 'products-service-secret-key'
@@ -14,22 +23,141 @@ db_config = {
     'database': os.getenv('MYSQL_DB', 'microservices')
 }
 
+# Connection pool configuration
+db_pool = ConnectionPool(
+    size=int(os.getenv('DB_POOL_SIZE', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    validate_after=float(os.getenv('DB_POOL_VALIDATE_AFTER', 30)),
+    **db_config
+)
+
+# API listing configuration
+PRODUCT_FIELDS = ('id', 'sku', 'name', 'description', 'price', 'stock', 'category', 'image_url')
+DEFAULT_PAGE_SIZE = int(os.getenv('PRODUCTS_PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', 500))
+
+# Change feed configuration
+# Rows younger than the settle window are held back so a transaction that commits late
+# with an earlier updated_at cannot slip behind a cursor that has already moved past it
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv('CHANGE_FEED_SETTLE_SECONDS', 2))
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('TOMBSTONE_RETENTION_DAYS', 7))
+
+# Idempotency records only need to outlive the callers' retry window (minutes);
+# a key replayed after its record was pruned would be applied again
+STOCK_ADJUSTMENT_RETENTION_DAYS = int(os.getenv('STOCK_ADJUSTMENT_RETENTION_DAYS', 7))
+
+# Search configuration
+SEARCH_MAX_OFFSET = int(os.getenv('SEARCH_MAX_OFFSET', 1000))
+# Shorter words are not in the FULLTEXT index (innodb_ft_min_token_size)
+SEARCH_MIN_WORD_LENGTH = int(os.getenv('SEARCH_MIN_WORD_LENGTH', 3))
+
+# Bulk import configuration
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+
 def get_db_connection():
-    """Create and return a database connection with retry logic"""
-    max_retries = 5
-    retry_delay = 2
-    
-    for attempt in range(max_retries):
-        try:
-            conn = mysql.connector.connect(**db_config)
-            return conn
-        except mysql.connector.Error as err:
-            print(f"Database connection attempt {attempt + 1} failed: {err}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                raise
+    """Borrow a database connection from the pool; close() returns it"""
+    conn = db_pool.get_connection()
+    g.setdefault('db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    """Return any connection a request left open (e.g. on an error path) to the pool"""
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+def ensure_index(cursor, table, name, columns, kind=''):
+    """Create an index (kind may be e.g. 'FULLTEXT') unless it already exists"""
+    try:
+        cursor.execute(f'CREATE {kind} INDEX {name} ON {table} ({columns})')
+    except mysql.connector.Error as err:
+        if err.errno != 1061:  # ER_DUP_KEYNAME
+            raise
+
+def ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table unless it is already there"""
+    cursor.execute(
+        '''SELECT 1 FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s''',
+        (table, column)
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def ensure_not_null(cursor, table, column, definition, fill):
+    """Backfill NULLs with fill and redefine the column NOT NULL; keyset cursors skip NULL rows"""
+    cursor.execute(
+        '''SELECT IS_NULLABLE FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s''',
+        (table, column)
+    )
+    row = cursor.fetchone()
+    if row is not None and row[0] == 'YES':
+        cursor.execute(f'UPDATE {table} SET {column} = {fill} WHERE {column} IS NULL')
+        cursor.execute(f'ALTER TABLE {table} MODIFY {column} {definition}')
+
+def ensure_version_column(cursor, table):
+    """Make updated_at microsecond-precise so it can back strong ETags"""
+    cursor.execute(
+        '''SELECT DATETIME_PRECISION FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s''',
+        (table, 'updated_at')
+    )
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute(f'''ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP(6)
+                           DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)''')
+    elif row[0] != 6:
+        cursor.execute(f'''ALTER TABLE {table} MODIFY updated_at TIMESTAMP(6)
+                           DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)''')
+
+def rows_etag(scope, rows):
+    """Strong ETag over (id, updated_at) pairs; returns (etag, last_modified)"""
+    digest = hashlib.sha1(scope.encode())
+    last_modified = None
+    for row in rows:
+        digest.update(f"|{row['id']}:{row['updated_at'].isoformat()}".encode())
+        if last_modified is None or row['updated_at'] > last_modified:
+            last_modified = row['updated_at']
+    return digest.hexdigest(), last_modified
+
+def is_not_modified(etag, last_modified):
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against a version"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        since = request.if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def conditional_request():
+    return bool(request.if_none_match) or request.if_modified_since is not None
+
+def with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+def not_modified_response(etag, last_modified):
+    return with_validators(app.response_class(status=304), etag, last_modified)
+
+def delete_product_row(cursor, product_id):
+    """Delete a product and leave a tombstone for the change feed; caller commits"""
+    cursor.execute('DELETE FROM products WHERE id = %s', (product_id,))
+    if cursor.rowcount:
+        cursor.execute(
+            '''INSERT INTO product_tombstones (product_id, deleted_at) VALUES (%s, CURRENT_TIMESTAMP(6))
+               ON DUPLICATE KEY UPDATE deleted_at = CURRENT_TIMESTAMP(6)''',
+            (product_id,)
+        )
+        # Opportunistic, bounded pruning keeps the tombstone table from growing forever
+        cursor.execute(
+            'DELETE FROM product_tombstones WHERE deleted_at < NOW(6) - INTERVAL %s DAY LIMIT 1000',
+            (TOMBSTONE_RETENTION_DAYS,)
+        )
+    return cursor.rowcount
 
 def init_db():
     """Initialize database tables"""
@@ -40,17 +168,47 @@ def init_db():
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS products (
                 id INT AUTO_INCREMENT PRIMARY KEY,
+                sku VARCHAR(64) UNIQUE,
                 name VARCHAR(100) NOT NULL,
                 description TEXT,
                 price DECIMAL(10,2) NOT NULL,
-                stock INT DEFAULT 0,
+                stock INT NOT NULL DEFAULT 0,
                 category VARCHAR(50),
                 image_url VARCHAR(255),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_tombstones (
+                product_id INT PRIMARY KEY,
+                deleted_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+                INDEX idx_tombstones_deleted_id (deleted_at, product_id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_adjustments (
+                idempotency_key VARCHAR(100) PRIMARY KEY,
+                adjustments TEXT NOT NULL,
+                stock_after TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_stock_adjustments_created (created_at)
             )
         ''')
         
+        ensure_version_column(cursor, 'products')
+        ensure_column(cursor, 'products', 'sku', 'VARCHAR(64) UNIQUE AFTER id')
+        ensure_index(cursor, 'products', 'idx_products_category_id', 'category, id')
+        ensure_index(cursor, 'products', 'idx_products_price_id', 'price, id')
+        ensure_index(cursor, 'products', 'idx_products_updated_id', 'updated_at, id')
+        # Keyset orderings of the metrics detail views
+        ensure_not_null(cursor, 'products', 'stock', 'INT NOT NULL DEFAULT 0', '0')
+        ensure_index(cursor, 'products', 'idx_products_name_id', 'name, id')
+        ensure_index(cursor, 'products', 'idx_products_stock_id', 'stock, id')
+        ensure_index(cursor, 'products', 'ft_products_name_description', 'name, description', kind='FULLTEXT')
+
         conn.commit()
         cursor.close()
         conn.close()
@@ -162,7 +320,7 @@ def delete_product(product_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM products WHERE id = %s', (product_id,))
+        delete_product_row(cursor, product_id)
         conn.commit()
         cursor.close()
         conn.close()
@@ -174,16 +332,299 @@ def delete_product(product_id):
     return redirect(url_for('list_products'))
 
 # API Endpoints
+def parse_listing_args(args):
+    """Validate listing query params; raises ValueError on bad input"""
+    after_id = int(args.get('after_id', 0))
+    limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    if limit <= 0:
+        raise ValueError('limit must be positive')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    fields = list(PRODUCT_FIELDS)
+    if args.get('fields'):
+        requested = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in requested if f not in PRODUCT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        # id is always returned so callers can build the next cursor
+        fields = ['id'] + [f for f in requested if f != 'id']
+
+    where, params = parse_filters(args)
+    return fields, ['id > %s'] + where, [after_id] + params, limit
+
+def parse_filters(args, category=True):
+    """WHERE clauses for the category/min_price/max_price params; raises ValueError"""
+    where = []
+    params = []
+    if category and args.get('category'):
+        where.append('category = %s')
+        params.append(args['category'])
+    if args.get('min_price'):
+        where.append('price >= %s')
+        params.append(float(args['min_price']))
+    if args.get('max_price'):
+        where.append('price <= %s')
+        params.append(float(args['max_price']))
+    return where, params
+
 @app.route('/api/products', methods=['GET'])
 def api_get_products():
+    """Keyset-paginated listing: ?after_id=&limit=&fields=&category=&min_price=&max_price=
+
+    The body stays a JSON array; when more rows exist the next cursor is sent
+    in the X-Next-After-Id header. With ?stream=1 or Accept: application/x-ndjson
+    every matching row after after_id is streamed as NDJSON and limit is ignored.
+    """
+    try:
+        fields, where, params, limit = parse_listing_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid listing parameters: {e}'}), 400
+
+    if wants_stream():
+        try:
+            return stream_query(
+                get_db_connection(),
+                f'SELECT {", ".join(fields)} FROM products WHERE {" AND ".join(where)} ORDER BY id',
+                params
+            )
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    # The page's version covers the lookahead row too, since it drives X-Next-After-Id
+    scope = 'products?' + '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    page_sql = f'FROM products WHERE {" AND ".join(where)} ORDER BY id LIMIT %s'
+    page_params = params + [limit + 1]
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT id, name, description, price, stock, category, image_url FROM products')
+
+        if conditional_request():
+            # Revalidation reads only (id, updated_at) for the page, never the wide columns
+            cursor.execute(f'SELECT id, updated_at {page_sql}', page_params)
+            etag, last_modified = rows_etag(scope, cursor.fetchall())
+            if is_not_modified(etag, last_modified):
+                cursor.close()
+                conn.close()
+                return not_modified_response(etag, last_modified)
+
+        cursor.execute(f'SELECT {", ".join(fields)}, updated_at {page_sql}', page_params)
         products = cursor.fetchall()
         cursor.close()
         conn.close()
-        return jsonify(products)
+
+        etag, last_modified = rows_etag(scope, products)
+        for product in products:
+            del product['updated_at']
+
+        has_more = len(products) > limit
+        products = products[:limit]
+        response = with_validators(jsonify(products), etag, last_modified)
+        if has_more:
+            response.headers['X-Next-After-Id'] = str(products[-1]['id'])
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def parse_change_cursor(since):
+    """Decode a change-feed cursor of the form '<updated_at ISO-8601>,<id>'"""
+    if not since:
+        return None
+    stamp, _, last_id = since.rpartition(',')
+    return datetime.fromisoformat(stamp), int(last_id)
+
+def format_change_cursor(stamp, last_id):
+    return f'{stamp.isoformat()},{last_id}'
+
+@app.route('/api/products/changes', methods=['GET'])
+def api_get_product_changes():
+    """Rows changed or deleted after a cursor: ?since=&limit=&fields=
+
+    Returns {changes, next_since, has_more}. Each change is an upsert carrying
+    the product or a delete tombstone, ordered by (timestamp, id). Omit since
+    to start from the beginning; pass next_since back to continue (it advances
+    even when there are no changes). A cursor older than the tombstone
+    retention window gets 410 and must resync.
+    """
+    try:
+        cursor_pos = parse_change_cursor(request.args.get('since'))
+        fields, _, _, limit = parse_listing_args({
+            'fields': request.args.get('fields'),
+            'limit': request.args.get('limit', DEFAULT_PAGE_SIZE)
+        })
+    except ValueError as e:
+        return jsonify({'error': f'Invalid change feed parameters: {e}'}), 400
+
+    # (ts, id) > cursor, spelled out so MySQL can range-scan the (ts, id) index
+    def after_cursor(ts_col, id_col):
+        if cursor_pos is None:
+            return '', []
+        stamp, last_id = cursor_pos
+        return (f'AND ({ts_col} > %s OR ({ts_col} = %s AND {id_col} > %s))',
+                [stamp, stamp, last_id])
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        if cursor_pos is not None:
+            cursor.execute('SELECT NOW(6) - INTERVAL %s DAY AS horizon', (TOMBSTONE_RETENTION_DAYS,))
+            if cursor_pos[0] < cursor.fetchone()['horizon']:
+                cursor.close()
+                conn.close()
+                return jsonify({'error': 'Cursor is older than tombstone retention; resync from the full listing'}), 410
+
+        # Both streams read up to limit+1 rows from their own index and are merged here
+        cursor.execute('SELECT NOW(6) - INTERVAL %s MICROSECOND AS settled', (int(CHANGE_FEED_SETTLE_SECONDS * 1000000),))
+        settled = cursor.fetchone()['settled']
+
+        clause, params = after_cursor('updated_at', 'id')
+        cursor.execute(
+            f'''SELECT {", ".join(fields)}, updated_at FROM products
+                WHERE updated_at <= %s {clause}
+                ORDER BY updated_at, id LIMIT %s''',
+            [settled] + params + [limit + 1]
+        )
+        changes = [{'op': 'upsert', 'id': row['id'], 'at': row.pop('updated_at'), 'product': row}
+                   for row in cursor.fetchall()]
+
+        clause, params = after_cursor('deleted_at', 'product_id')
+        cursor.execute(
+            f'''SELECT product_id, deleted_at FROM product_tombstones
+                WHERE deleted_at <= %s {clause}
+                ORDER BY deleted_at, product_id LIMIT %s''',
+            [settled] + params + [limit + 1]
+        )
+        changes += [{'op': 'delete', 'id': row['product_id'], 'at': row['deleted_at']}
+                    for row in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+
+        changes.sort(key=lambda c: (c['at'], c['id']))
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if changes:
+            next_since = format_change_cursor(changes[-1]['at'], changes[-1]['id'])
+        elif cursor_pos is None or cursor_pos[0] < settled:
+            # Nothing new up to the settle horizon, so the cursor can move there; an idle,
+            # caught-up client then never ages past the tombstone retention window
+            next_since = format_change_cursor(settled, 0)
+        else:
+            next_since = request.args.get('since')
+        for change in changes:
+            change['at'] = change['at'].isoformat()
+
+        return jsonify({'changes': changes, 'next_since': next_since, 'has_more': has_more})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def boolean_search_terms(q):
+    """Free text to a BOOLEAN MODE query that requires every word, prefix-matched"""
+    words = [w for w in re.findall(r'\w+', q) if len(w) >= SEARCH_MIN_WORD_LENGTH]
+    return ' '.join(f'+{word}*' for word in words)
+
+@app.route('/api/products/search', methods=['GET'])
+def api_search_products():
+    """Ranked full-text search: ?q=&category=&min_price=&max_price=&limit=&offset=&fields=
+
+    Returns {hits, total, facets, offset, next_offset}. Facets count matches
+    per category under the price filters but ignoring the category filter,
+    so the UI can offer the other categories alongside the selected one.
+    """
+    terms = boolean_search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': f'q must contain a word of at least {SEARCH_MIN_WORD_LENGTH} characters'}), 400
+    try:
+        fields, _, _, limit = parse_listing_args(request.args)
+        offset = int(request.args.get('offset', 0))
+        if not 0 <= offset <= SEARCH_MAX_OFFSET:
+            raise ValueError(f'offset must be between 0 and {SEARCH_MAX_OFFSET}')
+        filters, filter_params = parse_filters(request.args, category=False)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid search parameters: {e}'}), 400
+
+    match = 'MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)'
+    where = [match] + filters
+    params = [terms] + filter_params
+    category = request.args.get('category')
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        hit_where, hit_params = list(where), list(params)
+        if category:
+            hit_where.append('category = %s')
+            hit_params.append(category)
+        cursor.execute(
+            f'''SELECT {", ".join(fields)}, {match} AS score FROM products
+                WHERE {" AND ".join(hit_where)}
+                ORDER BY score DESC, id LIMIT %s OFFSET %s''',
+            [terms] + hit_params + [limit + 1, offset]
+        )
+        hits = cursor.fetchall()
+
+        cursor.execute(
+            f'''SELECT category, COUNT(*) AS count FROM products
+                WHERE {" AND ".join(where)}
+                GROUP BY category ORDER BY count DESC''',
+            params
+        )
+        facets = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+        if category:
+            total = next((f['count'] for f in facets if f['category'] == category), 0)
+        else:
+            total = sum(f['count'] for f in facets)
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+        for hit in hits:
+            hit['score'] = round(hit['score'], 4)
+        next_offset = offset + limit if has_more and offset + limit <= SEARCH_MAX_OFFSET else None
+
+        return jsonify({
+            'hits': hits,
+            'total': total,
+            'facets': facets,
+            'offset': offset,
+            'next_offset': next_offset
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/batch', methods=['GET'])
+def api_get_products_batch():
+    """Fetch many products in one query: ?ids=1,2,3[&fields=...]"""
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+    if not ids:
+        return jsonify({'error': 'No ids provided'}), 400
+    if len(ids) > MAX_PAGE_SIZE:
+        return jsonify({'error': f'At most {MAX_PAGE_SIZE} ids per request'}), 400
+
+    try:
+        fields, _, _, _ = parse_listing_args({'fields': request.args.get('fields')})
+    except ValueError as e:
+        return jsonify({'error': f'Invalid listing parameters: {e}'}), 400
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f'SELECT {", ".join(fields)} FROM products WHERE id IN ({placeholders})', ids)
+        products = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+        found = {p['id'] for p in products}
+        return jsonify({
+            'products': products,
+            'not_found': [i for i in ids if i not in found]
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -192,13 +633,26 @@ def api_get_product(product_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT id, name, description, price, stock, category, image_url FROM products WHERE id = %s', (product_id,))
+
+        if conditional_request():
+            cursor.execute('SELECT id, updated_at FROM products WHERE id = %s', (product_id,))
+            version = cursor.fetchone()
+            if version:
+                etag, last_modified = rows_etag('product', [version])
+                if is_not_modified(etag, last_modified):
+                    cursor.close()
+                    conn.close()
+                    return not_modified_response(etag, last_modified)
+
+        cursor.execute('SELECT id, name, description, price, stock, category, image_url, updated_at FROM products WHERE id = %s', (product_id,))
         product = cursor.fetchone()
         cursor.close()
         conn.close()
         
         if product:
-            return jsonify(product)
+            etag, last_modified = rows_etag('product', [product])
+            del product['updated_at']
+            return with_validators(jsonify(product), etag, last_modified)
         return jsonify({'error': 'Product not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -214,8 +668,8 @@ def api_create_product():
         cursor = conn.cursor()
         
         cursor.execute(
-            'INSERT INTO products (name, description, price, stock, category, image_url) VALUES (%s, %s, %s, %s, %s, %s)',
-            (data['name'], data.get('description', ''), float(data['price']), 
+            'INSERT INTO products (sku, name, description, price, stock, category, image_url) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            (data.get('sku') or None, data['name'], data.get('description', ''), float(data['price']), 
              int(data['stock']), data.get('category', ''), data.get('image_url', ''))
         )
         conn.commit()
@@ -230,6 +684,10 @@ def api_create_product():
         
     except ValueError:
         return jsonify({'error': 'Invalid price or stock format'}), 400
+    except mysql.connector.IntegrityError as err:
+        if err.errno == 1062:  # ER_DUP_ENTRY
+            return jsonify({'error': 'A product with this sku already exists'}), 409
+        return jsonify({'error': str(err)}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -252,6 +710,9 @@ def api_update_product(product_id):
         update_fields = []
         update_values = []
         
+        if 'sku' in data:
+            update_fields.append('sku = %s')
+            update_values.append(data['sku'] or None)
         if 'name' in data:
             update_fields.append('name = %s')
             update_values.append(data['name'])
@@ -288,6 +749,10 @@ def api_update_product(product_id):
         
     except ValueError:
         return jsonify({'error': 'Invalid price or stock format'}), 400
+    except mysql.connector.IntegrityError as err:
+        if err.errno == 1062:  # ER_DUP_ENTRY
+            return jsonify({'error': 'A product with this sku already exists'}), 409
+        return jsonify({'error': str(err)}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -303,7 +768,7 @@ def api_delete_product(product_id):
             conn.close()
             return jsonify({'error': 'Product not found'}), 404
         
-        cursor.execute('DELETE FROM products WHERE id = %s', (product_id,))
+        delete_product_row(cursor, product_id)
         conn.commit()
         cursor.close()
         conn.close()
@@ -313,6 +778,323 @@ def api_delete_product(product_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+class StockConflict(Exception):
+    """Raised when an adjustment would take stock below zero or the product is missing"""
+
+    def __init__(self, product_id, delta, stock):
+        super().__init__(f'Cannot adjust stock of product {product_id} by {delta}')
+        self.product_id = product_id
+        self.delta = delta
+        self.stock = stock
+
+def parse_stock_adjustments(items):
+    """Normalize [{'product_id', 'delta'}, ...]; raises ValueError on bad input"""
+    if not isinstance(items, list) or not items:
+        raise ValueError('adjustments must be a non-empty list')
+    adjustments = []
+    for item in items:
+        delta = int(item['delta'])
+        # A zero delta leaves the row unchanged, which MySQL reports as 0 affected rows
+        if delta == 0:
+            raise ValueError('delta must be non-zero')
+        adjustments.append((int(item['product_id']), delta))
+    return adjustments
+
+class IdempotencyKeyReused(Exception):
+    """Raised when an idempotency key comes back with different adjustments"""
+
+def apply_stock_adjustments(conn, adjustments, key=None):
+    """Apply (product_id, delta) pairs in one transaction; returns ({product_id: new_stock}, replayed)
+
+    Each row is changed by a single conditional UPDATE so concurrent orders
+    cannot overwrite each other or oversell. LAST_INSERT_ID(expr) hands the
+    new stock back without a second query. A batch retried under the same
+    idempotency key replays the recorded result instead of applying twice.
+    """
+    cursor = conn.cursor()
+    new_stock = {}
+    adjustments = sorted(adjustments)
+    try:
+        conn.start_transaction()
+        if key:
+            try:
+                cursor.execute(
+                    'INSERT INTO stock_adjustments (idempotency_key, adjustments) VALUES (%s, %s)',
+                    (key, json.dumps(adjustments))
+                )
+            except mysql.connector.Error as err:
+                if err.errno != 1062:
+                    raise
+                conn.rollback()
+                return replay_stock_adjustments(cursor, key, adjustments), True
+        # Lock rows in id order so concurrent batches cannot deadlock
+        for product_id, delta in adjustments:
+            cursor.execute(
+                'UPDATE products SET stock = LAST_INSERT_ID(stock + %s) WHERE id = %s AND stock + %s >= 0',
+                (delta, product_id, delta)
+            )
+            if cursor.rowcount != 1:
+                cursor.execute('SELECT stock FROM products WHERE id = %s', (product_id,))
+                row = cursor.fetchone()
+                raise StockConflict(product_id, delta, row[0] if row else None)
+            new_stock[product_id] = cursor.lastrowid
+        if key:
+            cursor.execute(
+                'UPDATE stock_adjustments SET stock_after = %s WHERE idempotency_key = %s',
+                (json.dumps(sorted(new_stock.items())), key)
+            )
+        conn.commit()
+        if key:
+            prune_stock_adjustments(conn, cursor)
+        return new_stock, False
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def replay_stock_adjustments(cursor, key, adjustments):
+    """The recorded result of an already applied batch; raises IdempotencyKeyReused on a mismatch"""
+    cursor.execute(
+        'SELECT adjustments, stock_after FROM stock_adjustments WHERE idempotency_key = %s',
+        (key,)
+    )
+    recorded, stock_after = cursor.fetchone()
+    if [tuple(pair) for pair in json.loads(recorded)] != adjustments:
+        raise IdempotencyKeyReused(key)
+    return {product_id: stock for product_id, stock in json.loads(stock_after)}
+
+def prune_stock_adjustments(conn, cursor):
+    """Opportunistic, bounded pruning of idempotency records past the retention window"""
+    try:
+        cursor.execute(
+            'DELETE FROM stock_adjustments WHERE created_at < NOW() - INTERVAL %s DAY LIMIT 1000',
+            (STOCK_ADJUSTMENT_RETENTION_DAYS,)
+        )
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Pruning stock adjustments failed: {err}")
+
+def stock_conflict_response(conflict):
+    if conflict.stock is None:
+        return jsonify({'error': 'Product not found', 'product_id': conflict.product_id}), 404
+    return jsonify({
+        'error': 'Insufficient stock',
+        'product_id': conflict.product_id,
+        'delta': conflict.delta,
+        'stock': conflict.stock
+    }), 409
+
+@app.route('/api/products/<int:product_id>/stock/adjust', methods=['POST'])
+def api_adjust_product_stock(product_id):
+    """Atomically add `delta` (negative to decrement) to a product's stock"""
+    try:
+        data = request.get_json()
+        if not data or 'delta' not in data:
+            return jsonify({'error': 'Missing required field: delta'}), 400
+        adjustments = parse_stock_adjustments([{'product_id': product_id, 'delta': data['delta']}])
+
+        conn = get_db_connection()
+        new_stock, _replayed = apply_stock_adjustments(conn, adjustments)
+        conn.close()
+
+        return jsonify({'id': product_id, 'stock': new_stock[product_id]})
+    except StockConflict as conflict:
+        return stock_conflict_response(conflict)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid delta format'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/stock/adjust', methods=['POST'])
+def api_adjust_stock_batch():
+    """Apply {'adjustments': [{'product_id', 'delta'}, ...]} all-or-nothing
+
+    Retries carrying the same Idempotency-Key header (or `idempotency_key`
+    field) replay the original result instead of applying the batch again.
+    """
+    try:
+        data = request.get_json()
+        if not data or 'adjustments' not in data:
+            return jsonify({'error': 'Missing required field: adjustments'}), 400
+        adjustments = parse_stock_adjustments(data['adjustments'])
+        key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+
+        conn = get_db_connection()
+        try:
+            new_stock, replayed = apply_stock_adjustments(conn, adjustments, key)
+        finally:
+            conn.close()
+
+        return jsonify({
+            'products': [{'id': pid, 'stock': stock} for pid, stock in new_stock.items()],
+            'replayed': replayed
+        })
+    except IdempotencyKeyReused:
+        return jsonify({'error': 'Idempotency key reused with different parameters'}), 422
+    except StockConflict as conflict:
+        return stock_conflict_response(conflict)
+    except (ValueError, TypeError, KeyError):
+        return jsonify({'error': 'Invalid adjustments format'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Bulk import / export
+IMPORT_COLUMNS = ('sku', 'name', 'description', 'price', 'stock', 'category', 'image_url')
+IMPORT_SQL = f'''INSERT INTO products ({", ".join(IMPORT_COLUMNS)})
+                 VALUES ({", ".join(["%s"] * len(IMPORT_COLUMNS))})
+                 ON DUPLICATE KEY UPDATE {", ".join(f"{c} = VALUES({c})" for c in IMPORT_COLUMNS[1:])}'''
+
+def validate_import_row(record):
+    """Turn one CSV/NDJSON record into an IMPORT_COLUMNS tuple; raises ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError('record must be an object')
+
+    def text(field, max_length, required=False):
+        value = record.get(field)
+        value = '' if value is None else str(value).strip()
+        if required and not value:
+            raise ValueError(f'{field} is required')
+        if len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        return value
+
+    sku = text('sku', 64, required=True)
+    name = text('name', 100, required=True)
+    try:
+        price = Decimal(str(record.get('price', '')).strip())
+    except InvalidOperation:
+        raise ValueError('price must be a number')
+    if not price.is_finite() or price < 0:
+        raise ValueError('price must be a non-negative number')
+    stock_value = record.get('stock')
+    try:
+        stock = int(stock_value) if stock_value not in (None, '') else 0
+    except (TypeError, ValueError):
+        raise ValueError('stock must be an integer')
+    if stock < 0:
+        raise ValueError('stock must not be negative')
+    description = record.get('description') or ''
+    return (sku, name, str(description), price, stock,
+            text('category', 50), text('image_url', 255))
+
+def read_import_records(stream, fmt):
+    """Yield (line_number, record) from a CSV or NDJSON byte stream without buffering it"""
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text_stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+def write_import_batch(conn, batch, report):
+    """Upsert one batch with a single multi-row INSERT; on failure retry row by row to pinpoint errors"""
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(IMPORT_SQL, [row for _, row in batch])
+        conn.commit()
+        report['upserted'] += len(batch)
+        return
+    except mysql.connector.Error:
+        conn.rollback()
+    finally:
+        cursor.close()
+
+    cursor = conn.cursor()
+    try:
+        for line_number, row in batch:
+            try:
+                cursor.execute(IMPORT_SQL, row)
+                report['upserted'] += 1
+            except mysql.connector.Error as err:
+                add_import_error(report, line_number, row[0], err.msg)
+        conn.commit()
+    finally:
+        cursor.close()
+
+def add_import_error(report, line_number, sku, message):
+    report['rejected'] += 1
+    if len(report['errors']) < IMPORT_MAX_ERRORS:
+        report['errors'].append({'line': line_number, 'sku': sku, 'error': message})
+
+@app.route('/api/products/import', methods=['POST'])
+def api_import_products():
+    """Bulk upsert keyed on sku from a CSV (text/csv) or NDJSON request body
+
+    Rows are validated individually and written in executemany batches of
+    ?batch_size= (default IMPORT_BATCH_SIZE), each committed on its own.
+    Invalid rows are skipped and reported by line number; the body is read
+    as a stream, so the upload size does not bound memory.
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        batch_size = min(int(request.args.get('batch_size', IMPORT_BATCH_SIZE)), 10000)
+        if batch_size <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+
+    report = {'upserted': 0, 'rejected': 0, 'errors': []}
+    try:
+        conn = get_db_connection()
+        batch = []
+        seen_skus = {}
+        for line_number, record in read_import_records(request.stream, fmt):
+            if isinstance(record, Exception):
+                add_import_error(report, line_number, None, f'Invalid JSON: {record}')
+                continue
+            try:
+                row = validate_import_row(record)
+            except ValueError as e:
+                add_import_error(report, line_number, record.get('sku') if isinstance(record, dict) else None, str(e))
+                continue
+            # A repeated sku inside one batch would make the batch's outcome order-dependent
+            if row[0] in seen_skus:
+                write_import_batch(conn, batch, report)
+                batch, seen_skus = [], {}
+            batch.append((line_number, row))
+            seen_skus[row[0]] = line_number
+            if len(batch) >= batch_size:
+                write_import_batch(conn, batch, report)
+                batch, seen_skus = [], {}
+        if batch:
+            write_import_batch(conn, batch, report)
+        conn.close()
+    except UnicodeDecodeError:
+        return jsonify(dict(report, error='Request body must be UTF-8')), 400
+    except csv.Error as e:
+        return jsonify(dict(report, error=f'Malformed CSV: {e}')), 400
+    except Exception as e:
+        return jsonify(dict(report, error=str(e))), 500
+
+    report['errors_truncated'] = report['rejected'] > len(report['errors'])
+    return jsonify(report)
+
+@app.route('/api/products/export', methods=['GET'])
+def api_export_products():
+    """Stream the whole catalog as ?format=ndjson (default) or csv, in the import column layout"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        return stream_query(
+            get_db_connection(),
+            f'SELECT id, {", ".join(IMPORT_COLUMNS)} FROM products ORDER BY id',
+            fmt=fmt
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health')
 def health_check():
     try:
@@ -325,6 +1107,10 @@ def health_check():
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
+@app.route('/health/pool')
+def pool_stats():
+    return jsonify(db_pool.stats())
+
 # Initialize database when app starts
 with app.app_context():
     init_db()
@@ -0,0 +1,168 @@
+import threading
+import time
+
+import mysql.connector
+
+
+class PoolTimeout(mysql.connector.errors.PoolError):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class PooledConnection:
+    """Wraps a raw connection so that close() hands it back to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError('Connection already returned to pool')
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn)
+
+    def discard(self):
+        """Close the connection instead of recycling it (e.g. a result set was left half-read)"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._discard(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded MySQL connection pool with validation on checkout"""
+
+    def __init__(self, size, timeout, validate_after=30, max_retries=5, retry_delay=2, **db_config):
+        self.size = size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.db_config = db_config
+
+        self._lock = threading.Condition()
+        self._idle = []  # (conn, last_used)
+        self._in_use = 0
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms_total': 0.0,
+            'wait_time_ms_max': 0.0,
+            'timeouts': 0,
+            'validation_failures': 0,
+        }
+
+    def _connect(self):
+        """Open a new raw connection with retry logic"""
+        for attempt in range(self.max_retries):
+            try:
+                conn = mysql.connector.connect(**self.db_config)
+                with self._lock:
+                    self._stats['created'] += 1
+                return conn
+            except mysql.connector.Error as err:
+                print(f"Database connection attempt {attempt + 1} failed: {err}")
+                if attempt < self.max_retries - 1:
+                    print(f"Retrying in {self.retry_delay} seconds...")
+                    time.sleep(self.retry_delay)
+                else:
+                    raise
+
+    def _is_usable(self, conn, last_used):
+        if time.monotonic() - last_used < self.validate_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def get_connection(self):
+        """Borrow a connection, waiting up to `timeout` seconds for one to free up"""
+        started = time.monotonic()
+        waited = False
+        with self._lock:
+            while not self._idle and self._in_use >= self.size:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                waited = True
+                self._lock.wait(remaining)
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_ms = (time.monotonic() - started) * 1000
+                self._stats['waits'] += 1
+                self._stats['wait_time_ms_total'] += wait_ms
+                self._stats['wait_time_ms_max'] = max(self._stats['wait_time_ms_max'], wait_ms)
+            idle = self._idle.pop() if self._idle else None
+
+        try:
+            if idle is not None:
+                conn, last_used = idle
+                if self._is_usable(conn, last_used):
+                    return PooledConnection(self, conn)
+                with self._lock:
+                    self._stats['validation_failures'] += 1
+                self._close_quietly(conn)
+            return PooledConnection(self, self._connect())
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = True
+        except mysql.connector.Error:
+            healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+        if not healthy:
+            self._close_quietly(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._in_use -= 1
+            self._lock.notify()
+        self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'timeout_seconds': self.timeout,
+            })
+        waits = stats['waits']
+        stats['wait_time_ms_avg'] = stats['wait_time_ms_total'] / waits if waits else 0.0
+        return stats
@@ -4,6 +4,10 @@ import os
 from datetime import datetime
 import logging
 
+import service_client
+from service_client import CircuitBreaker, ServiceClient
+from catalog_cache import CacheValue, CatalogCache, NOT_MODIFIED
+
 app = Flask(__name__)
 app.secret_key = os.getenv("STOREFRONT_SECRET_KEY", "dev-secret-key")
 
@@ -20,6 +24,44 @@ logging.basicConfig(level=logging.INFO)
 app.config["PRODUCTS_SERVICE_URL"] = os.getenv("PRODUCTS_SERVICE_URL", "http://products-service:5000")
 app.config["ORDERS_SERVICE_URL"] = os.getenv("ORDERS_SERVICE_URL", "http://orders-service:5000")
 app.config["USERS_SERVICE_URL"] = os.getenv("USERS_SERVICE_URL", "http://users-service:5000")
+app.config["PRODUCTS_PAGE_SIZE"] = int(os.getenv("PRODUCTS_PAGE_SIZE", 48))
+app.config["REQUEST_DEADLINE"] = float(os.getenv("REQUEST_DEADLINE", 10))
+
+app.config["CIRCUIT_FAILURE_RATIO"] = float(os.getenv("CIRCUIT_FAILURE_RATIO", 0.5))
+app.config["CIRCUIT_WINDOW"] = int(os.getenv("CIRCUIT_WINDOW", 20))
+app.config["CIRCUIT_MIN_CALLS"] = int(os.getenv("CIRCUIT_MIN_CALLS", 10))
+app.config["CIRCUIT_RESET_TIMEOUT"] = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 10))
+app.config["HEDGE_REQUESTS"] = os.getenv("HEDGE_REQUESTS", "true").lower() == "true"
+app.config["CATALOG_CACHE_MAX_ENTRIES"] = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", 5000))
+app.config["CATALOG_CACHE_MAX_BYTES"] = int(os.getenv("CATALOG_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+app.config["CATALOG_CACHE_TTL"] = float(os.getenv("CATALOG_CACHE_TTL", 30))
+app.config["CATALOG_CACHE_STALE_TTL"] = float(os.getenv("CATALOG_CACHE_STALE_TTL", 300))
+
+
+def _breaker():
+    return CircuitBreaker(
+        failure_ratio=app.config["CIRCUIT_FAILURE_RATIO"],
+        window=app.config["CIRCUIT_WINDOW"],
+        min_calls=app.config["CIRCUIT_MIN_CALLS"],
+        reset_timeout=app.config["CIRCUIT_RESET_TIMEOUT"],
+    )
+
+
+# Product pages and single products, served stale-while-revalidate
+catalog_cache = CatalogCache(
+    max_entries=app.config["CATALOG_CACHE_MAX_ENTRIES"],
+    max_bytes=app.config["CATALOG_CACHE_MAX_BYTES"],
+    ttl=app.config["CATALOG_CACHE_TTL"],
+    stale_ttl=app.config["CATALOG_CACHE_STALE_TTL"],
+)
+
+# Pooled keep-alive clients, one per upstream, each behind its own circuit breaker
+products_client = ServiceClient("products", app.config["PRODUCTS_SERVICE_URL"], breaker=_breaker())
+orders_client = ServiceClient("orders", app.config["ORDERS_SERVICE_URL"], breaker=_breaker())
+users_client = ServiceClient("users", app.config["USERS_SERVICE_URL"], breaker=_breaker())
+
+# Catalog columns the storefront renders (skips anything the templates never show)
+STOREFRONT_PRODUCT_FIELDS = "id,name,description,price,stock,image_url"
 
 
 # --- Context Processor ---
@@ -30,14 +72,27 @@ def inject_global_variables():
 
 
 # --- Helper: Safe Service Requests ---
-def _safe_request(method, url, **kwargs):
-    """Wrapper around requests with logging & error handling."""
+@app.before_request
+def start_request_deadline():
+    """Bound all upstream calls made while serving this request."""
+    service_client.set_deadline(service_client.deadline_from_headers(request.headers, app.config["REQUEST_DEADLINE"]))
+
+
+def _safe_request(client, method, path, return_errors=False, **kwargs):
+    """Wrapper around the pooled service clients with logging & error handling.
+
+    With return_errors=True, 4xx/5xx responses are returned so callers can
+    surface the service's error message; only transport failures yield None.
+    """
     try:
-        resp = requests.request(method, url, timeout=kwargs.pop("timeout", 5), **kwargs)
+        resp = client.request(method, path, **kwargs)
         resp.raise_for_status()
         return resp
+    except requests.exceptions.HTTPError as e:
+        app.logger.error(f"[Service Request Failed] {method} {client.name}{path} | Error: {e}")
+        return e.response if return_errors else None
     except requests.exceptions.RequestException as e:
-        app.logger.error(f"[Service Request Failed] {method} {url} | Error: {e}")
+        app.logger.error(f"[Service Request Failed] {method} {client.name}{path} | Error: {e}")
         return None
 
 
@@ -46,9 +101,10 @@ def _get_cart_details():
     """Compute cart items, total, and item count."""
     cart_items, total, item_count = [], 0, 0
     cart = session.get("cart", {})
+    products = get_products_by_ids([int(pid) for pid in cart])
 
     for product_id, quantity in cart.items():
-        product = get_product(int(product_id))
+        product = products.get(int(product_id))
         if not product:
             continue
         item_total = product["price"] * quantity
@@ -65,40 +121,109 @@ def _get_cart_details():
 
 
 # --- Microservice Calls ---
-def get_products():
-    resp = _safe_request("GET", f"{app.config['PRODUCTS_SERVICE_URL']}/api/products")
-    if not resp:
-        return []
-    products = resp.json()
-    for p in products:
-        p["price"] = float(p.get("price", 0))
-    return products
+def _fetch_catalog(path, parse, etag=None, **kwargs):
+    """Loader for catalog_cache: conditional GET against the products service."""
+    headers = {"If-None-Match": etag} if etag else None
+    resp = _safe_request(products_client, "GET", path, headers=headers,
+                         hedge=app.config["HEDGE_REQUESTS"], **kwargs)
+    if resp is None:
+        return None
+    if resp.status_code == 304:
+        return NOT_MODIFIED
+    return CacheValue(parse(resp), etag=resp.headers.get("ETag"), size=len(resp.content))
 
 
-def get_product(product_id):
-    resp = _safe_request("GET", f"{app.config['PRODUCTS_SERVICE_URL']}/api/products/{product_id}")
-    if not resp:
-        return None
-    product = resp.json()
+def _parse_product(product):
     product["price"] = float(product.get("price", 0))
     return product
 
 
+def get_products(after_id=None):
+    """Fetch one catalog page; returns (products, next_after_id)."""
+    params = {"fields": STOREFRONT_PRODUCT_FIELDS, "limit": app.config["PRODUCTS_PAGE_SIZE"]}
+    if after_id:
+        params["after_id"] = after_id
+
+    def parse(resp):
+        return [_parse_product(p) for p in resp.json()], resp.headers.get("X-Next-After-Id")
+
+    page = catalog_cache.get(("products", after_id or 0),
+                             lambda etag: _fetch_catalog("/api/products", parse, etag, params=params))
+    return page if page is not None else ([], None)
+
+
+def search_products(q, category=None, offset=0):
+    """Ranked search with category facets; returns the products service's search payload."""
+    params = {"q": q, "fields": STOREFRONT_PRODUCT_FIELDS, "limit": app.config["PRODUCTS_PAGE_SIZE"],
+              "offset": offset}
+    if category:
+        params["category"] = category
+
+    def parse(resp):
+        if resp.status_code != 200:
+            return {"hits": [], "total": 0, "facets": [], "next_offset": None}
+        results = resp.json()
+        results["hits"] = [_parse_product(p) for p in results["hits"]]
+        return results
+
+    # Normalised so trivially different spellings of a query share one cache entry
+    key = ("search", " ".join(q.lower().split()), category or "", offset)
+    results = catalog_cache.get(key, lambda etag: _fetch_catalog("/api/products/search", parse, etag, params=params))
+    return results if results is not None else {"hits": [], "total": 0, "facets": [], "next_offset": None}
+
+
+def get_product(product_id):
+    return catalog_cache.get(("product", product_id),
+                             lambda etag: _fetch_catalog(f"/api/products/{product_id}",
+                                                         lambda resp: _parse_product(resp.json()), etag))
+
+
+def get_products_by_ids(product_ids):
+    """Resolve many products, batch-fetching only cache misses; returns {id: product}."""
+    products = {}
+    for product_id in product_ids:
+        product = catalog_cache.peek(("product", product_id))
+        if product is not None:
+            products[product_id] = product
+
+    missing = [pid for pid in product_ids if pid not in products]
+    if not missing:
+        return products
+
+    ids = ",".join(str(pid) for pid in missing)
+    resp = _safe_request(products_client, "GET", "/api/products/batch", params={"ids": ids},
+                         hedge=app.config["HEDGE_REQUESTS"])
+    if not resp:
+        return products
+    for product in resp.json().get("products", []):
+        products[product["id"]] = _parse_product(product)
+        catalog_cache.put(("product", product["id"]), CacheValue(product, size=len(repr(product))))
+    return products
+
+
 def get_users():
-    resp = _safe_request("GET", f"{app.config['USERS_SERVICE_URL']}/api/users")
+    resp = _safe_request(users_client, "GET", "/api/users")
     return resp.json() if resp else []
 
 
 def get_user(user_id):
-    resp = _safe_request("GET", f"{app.config['USERS_SERVICE_URL']}/api/users/{user_id}")
+    resp = _safe_request(users_client, "GET", f"/api/users/{user_id}")
     return resp.json() if resp else None
 
 
 # --- Routes ---
 @app.route("/")
 def index():
-    products = get_products()
-    return render_template("index.html", products=products)
+    q = request.args.get("q", "").strip()
+    if q:
+        category = request.args.get("category") or None
+        results = search_products(q, category, request.args.get("offset", 0, type=int))
+        return render_template("index.html", products=results["hits"], q=q, category=category,
+                               facets=results["facets"], total=results["total"],
+                               next_offset=results["next_offset"])
+
+    products, next_after_id = get_products(request.args.get("after_id", type=int))
+    return render_template("index.html", products=products, next_after_id=next_after_id)
 
 
 # --- Cart ---
@@ -204,26 +329,33 @@ def checkout():
         return redirect(url_for("checkout"))
 
     successful_orders, failed_orders = [], []
-    for product_id, quantity in cart.items():
-        product = get_product(int(product_id))
-        if not product:
-            failed_orders.append(f"Product {product_id} not found.")
-            continue
-
-        order_data = {"user_id": user_id, "product_id": int(product_id), "quantity": quantity}
-        resp = _safe_request("POST", f"{app.config['ORDERS_SERVICE_URL']}/api/orders", json=order_data, timeout=10)
-
-        if resp and resp.status_code == 201:
-            successful_orders.append({
-                "product_name": product["name"],
-                "quantity": quantity,
-                "total": product["price"] * quantity,
-            })
+    lines = [{"product_id": int(item["id"]), "quantity": item["quantity"]} for item in cart_items]
+    found = {item["id"] for item in cart_items}
+    failed_orders.extend(f"Product {pid} not found." for pid in cart if pid not in found)
+
+    # One call places every line; the orders service validates and commits them together
+    if lines:
+        resp = _safe_request(orders_client, "POST", "/api/orders",
+                             json={"user_id": user_id, "items": lines}, timeout=10, return_errors=True)
+
+        if resp is not None and resp.status_code == 201:
+            for item in resp.json().get("items", []):
+                successful_orders.append({
+                    "product_name": item["product_name"],
+                    "quantity": item["quantity"],
+                    "total": float(item["line_total"]),
+                })
         else:
-            error_msg = (resp.json().get("error") if resp else "Service unavailable")
-            failed_orders.append(f"{product['name']}: {error_msg}")
+            error_msg = "Service unavailable"
+            if resp is not None:
+                try:
+                    error_msg = resp.json().get("error", error_msg)
+                except ValueError:
+                    pass
+            failed_orders.append(f"Order not placed: {error_msg}")
 
-    session.pop("cart", None)  # Clear cart after checkout
+    if successful_orders:
+        session.pop("cart", None)  # Clear cart after checkout
 
     return render_template("order_confirmation.html",
                            successful_orders=successful_orders,
@@ -237,6 +369,16 @@ def health_check():
     return jsonify({"status": "healthy", "service": "storefront"})
 
 
+@app.route("/health/upstreams")
+def upstream_stats():
+    return jsonify(service_client.all_stats())
+
+
+@app.route("/health/cache")
+def cache_stats():
+    return jsonify(catalog_cache.stats())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template("404.html"), 404
@@ -0,0 +1,138 @@
+"""Bounded in-process cache for catalog reads.
+
+Entries are evicted least-recently-used once either the entry count or the
+byte budget is exceeded. Within `ttl` an entry is served as-is; for a further
+`stale_ttl` it is served stale while a background refresh revalidates it; after
+that callers wait for a (conditional) refetch. Loaders receive the cached ETag
+and may return NOT_MODIFIED to keep the existing value.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+NOT_MODIFIED = object()
+
+
+class CacheValue:
+    """What a loader returns: the value plus its validator and approximate size"""
+
+    def __init__(self, value, etag=None, size=0):
+        self.value = value
+        self.etag = etag
+        self.size = size
+
+
+class _Entry:
+    __slots__ = ('value', 'etag', 'size', 'fetched_at')
+
+    def __init__(self, loaded):
+        self.value = loaded.value
+        self.etag = loaded.etag
+        self.size = loaded.size
+        self.fetched_at = time.monotonic()
+
+
+class CatalogCache:
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024, ttl=30, stale_ttl=300, refresh_workers=4):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._refreshing = set()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'revalidated': 0,
+                       'refreshed': 0, 'evictions': 0, 'load_errors': 0}
+
+    def peek(self, key):
+        """Return a fresh cached value without loading, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.fetched_at >= self.ttl:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry.value
+
+    def put(self, key, loaded):
+        with self._lock:
+            self._store(key, _Entry(loaded))
+
+    def _store(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats['evictions'] += 1
+
+    def _load(self, key, loader, entry):
+        """Run the loader, honouring NOT_MODIFIED; returns the value to serve or None"""
+        try:
+            loaded = loader(entry.etag if entry else None)
+        except Exception:
+            loaded = None
+        with self._lock:
+            if loaded is NOT_MODIFIED and entry is not None:
+                entry.fetched_at = time.monotonic()
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                else:
+                    self._store(key, entry)
+                self._stats['revalidated'] += 1
+                return entry.value
+            if loaded is None or loaded is NOT_MODIFIED:
+                self._stats['load_errors'] += 1
+                # Serve whatever we still have rather than failing the page
+                return entry.value if entry is not None else None
+            self._store(key, _Entry(loaded))
+            self._stats['refreshed'] += 1
+            return loaded.value
+
+    def _refresh_in_background(self, key, loader, entry):
+        try:
+            self._load(key, loader, entry)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key, loader):
+        """Return the cached value for key, loading or revalidating it as needed
+
+        `loader(etag)` returns a CacheValue, NOT_MODIFIED, or None on failure.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    self._stats['hits'] += 1
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    self._stats['stale_hits'] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._refresh_pool.submit(self._refresh_in_background, key, loader, entry)
+                    return entry.value
+            self._stats['misses'] += 1
+
+        return self._load(key, loader, entry)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'entries': len(self._entries), 'bytes': self._bytes,
+                          'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                          'ttl_seconds': self.ttl, 'stale_ttl_seconds': self.stale_ttl})
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,212 @@
+"""Shared fixtures for the service tests.
+
+Every service is a directory of top-level modules (app, streaming, ...) that
+import each other by bare name, so `load_service` imports one service at a
+time with its directory first on sys.path and caches the resulting modules.
+
+FakeDatabase stands in for MySQL. It answers statements from rules matched
+on a SQL fragment, records everything executed (COMMIT and ROLLBACK
+included) in order, and can be told to fail a statement or a commit, which is
+what the failure-path tests need.
+"""
+import importlib
+import re
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import mysql.connector
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ('products_service', 'users_service', 'orders_service', 'metrics_service', 'storefront_service')
+
+_loaded = {}
+
+
+def _service_modules():
+    """Names in sys.modules that were imported from one of the service directories"""
+    dirs = {str(ROOT / name) for name in SERVICES}
+    return [
+        name for name, module in sys.modules.items()
+        if str(Path(getattr(module, '__file__', None) or '/').parent) in dirs
+    ]
+
+
+def load_service(name):
+    """The service's modules as a namespace (app, streaming, ...), imported once per session
+
+    Some services run init_db() at import time; that runs against a scratch
+    FakeDatabase so it never touches the one a test asserts on.
+    """
+    if name not in _loaded:
+        for module in _service_modules():
+            del sys.modules[module]
+        service_dir = str(ROOT / name)
+        sys.path.insert(0, service_dir)
+        connect = mysql.connector.connect
+        mysql.connector.connect = FakeDatabase().connect
+        try:
+            importlib.import_module('app')
+            modules = {
+                mod: sys.modules[mod] for mod in _service_modules()
+            }
+        finally:
+            mysql.connector.connect = connect
+            sys.path.remove(service_dir)
+            for module in _service_modules():
+                del sys.modules[module]
+        _loaded[name] = SimpleNamespace(**modules)
+    return _loaded[name]
+
+
+def normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class Rule:
+    def __init__(self, fragment, rows, rowcount, lastrowid, error, times):
+        self.fragment = fragment
+        self.rows = rows
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+        self.error = error
+        self.times = times
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rules = []
+        self.statements = []
+        self.connections = []
+        self.commit_error = None
+
+    def on(self, fragment, rows=(), rowcount=None, lastrowid=None, error=None, times=None):
+        """Answer statements containing fragment; the first matching rule wins, `times` limits its uses"""
+        self.rules.append(Rule(normalize(fragment), list(rows), rowcount, lastrowid, error, times))
+        return self
+
+    def fail_commit(self, error=None):
+        self.commit_error = error or mysql.connector.errors.OperationalError(msg='Lost connection during commit')
+
+    def connect(self, **_config):
+        conn = FakeConnection(self)
+        self.connections.append(conn)
+        return conn
+
+    def executed(self, fragment):
+        """The (sql, params) pairs of statements containing fragment"""
+        fragment = normalize(fragment)
+        return [(sql, params) for sql, params in self.statements if fragment in sql]
+
+    def log(self):
+        return [sql for sql, _params in self.statements]
+
+    def _answer(self, sql):
+        for rule in self.rules:
+            if rule.fragment in sql and rule.times != 0:
+                if rule.times is not None:
+                    rule.times -= 1
+                return rule
+        return None
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.in_transaction = False
+        self.closed = False
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, dictionary=False, buffered=None):
+        return FakeCursor(self, dictionary)
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        if self.db.commit_error is not None:
+            error, self.db.commit_error = self.db.commit_error, None
+            raise error
+        self.db.statements.append(('COMMIT', None))
+        self.commits += 1
+        self.in_transaction = False
+
+    def rollback(self):
+        self.db.statements.append(('ROLLBACK', None))
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        pass
+
+    def is_connected(self):
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn, dictionary):
+        self.conn = conn
+        self.dictionary = dictionary
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+        self.column_names = ()
+        self.closed = False
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        sql = normalize(sql)
+        self.conn.db.statements.append((sql, params))
+        if not sql.startswith('SELECT'):
+            self.conn.in_transaction = True
+        rule = self.conn.db._answer(sql)
+        if rule is not None and rule.error is not None:
+            raise rule.error
+        rows = list(rule.rows) if rule is not None else []
+        if rows and isinstance(rows[0], dict):
+            self.column_names = tuple(rows[0])
+            self.description = [(name,) for name in self.column_names]
+            if not self.dictionary:
+                rows = [tuple(row.values()) for row in rows]
+        self._rows = rows
+        if rule is not None and rule.rowcount is not None:
+            self.rowcount = rule.rowcount
+        else:
+            self.rowcount = len(rows) if sql.startswith('SELECT') else 1
+        self.lastrowid = rule.lastrowid if rule is not None else None
+
+    def executemany(self, sql, seq_params):
+        seq_params = list(seq_params)
+        self.execute(sql, seq_params)
+        self.rowcount = len(seq_params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def __iter__(self):
+        while self._rows:
+            yield self._rows.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A FakeDatabase that every mysql.connector.connect() call in the services connects to"""
+    fake = FakeDatabase()
+    monkeypatch.setattr(mysql.connector, 'connect', fake.connect)
+    return fake
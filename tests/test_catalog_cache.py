@@ -0,0 +1,138 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import load_service
+
+
+@pytest.fixture
+def catalog_cache():
+    return load_service('storefront_service').catalog_cache
+
+
+@pytest.fixture
+def clock(catalog_cache, monkeypatch):
+    """A settable monotonic clock, seen only by the catalog_cache module"""
+    now = [1000.0]
+    monkeypatch.setattr(catalog_cache, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+class Loader:
+    """Hands out versioned values; `result` overrides what the next calls return"""
+
+    def __init__(self, catalog_cache):
+        self.catalog_cache = catalog_cache
+        self.etags = []
+        self.result = None
+
+    def __call__(self, etag):
+        self.etags.append(etag)
+        if self.result is not None:
+            return self.result
+        version = len(self.etags)
+        return self.catalog_cache.CacheValue(f'v{version}', etag=f'"{version}"', size=10)
+
+
+def make_cache(catalog_cache, **kwargs):
+    cache = catalog_cache.CatalogCache(**kwargs)
+    # Background refreshes are queued here and run by the test, never concurrently
+    refreshes = []
+    cache._refresh_pool = SimpleNamespace(submit=lambda fn, *args: refreshes.append((fn, args)))
+    return cache, refreshes
+
+
+def run(refreshes):
+    while refreshes:
+        fn, args = refreshes.pop(0)
+        fn(*args)
+
+
+def test_fresh_entry_is_served_until_ttl(catalog_cache, clock):
+    cache, _ = make_cache(catalog_cache, ttl=30, stale_ttl=0)
+    loader = Loader(catalog_cache)
+
+    assert cache.get('k', loader) == 'v1'
+    clock[0] += 29.9
+    assert cache.get('k', loader) == 'v1'
+    clock[0] += 0.1
+    assert cache.get('k', loader) == 'v2'
+    assert loader.etags == [None, '"1"']
+    assert cache.peek('k') == 'v2'
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(catalog_cache, clock):
+    cache, refreshes = make_cache(catalog_cache, ttl=30, stale_ttl=60)
+    loader = Loader(catalog_cache)
+    cache.get('k', loader)
+    clock[0] += 45
+
+    assert cache.get('k', loader) == 'v1'
+    assert cache.get('k', loader) == 'v1'
+    assert len(refreshes) == 1
+
+    run(refreshes)
+    assert cache.get('k', loader) == 'v2'
+    assert cache.stats()['stale_hits'] == 2
+
+
+def test_not_modified_keeps_the_value_and_restarts_ttl(catalog_cache, clock):
+    cache, refreshes = make_cache(catalog_cache, ttl=30, stale_ttl=60)
+    loader = Loader(catalog_cache)
+    cache.get('k', loader)
+    clock[0] += 45
+    loader.result = catalog_cache.NOT_MODIFIED
+
+    cache.get('k', loader)
+    run(refreshes)
+
+    assert loader.etags == [None, '"1"']
+    assert cache.peek('k') == 'v1'
+    assert cache.stats()['revalidated'] == 1
+
+
+def test_entry_past_stale_ttl_is_refetched_inline(catalog_cache, clock):
+    cache, refreshes = make_cache(catalog_cache, ttl=30, stale_ttl=60)
+    loader = Loader(catalog_cache)
+    cache.get('k', loader)
+    clock[0] += 90
+
+    assert cache.get('k', loader) == 'v2'
+    assert refreshes == []
+
+
+def test_failed_load_serves_what_is_cached(catalog_cache, clock):
+    cache, _ = make_cache(catalog_cache, ttl=30, stale_ttl=0)
+    loader = Loader(catalog_cache)
+    cache.get('k', loader)
+    clock[0] += 30
+
+    def broken(etag):
+        raise ConnectionError('products down')
+
+    assert cache.get('k', broken) == 'v1'
+    assert cache.get('other', broken) is None
+    assert cache.stats()['load_errors'] == 2
+
+
+def test_least_recently_used_entry_is_evicted(catalog_cache, clock):
+    cache, _ = make_cache(catalog_cache, max_entries=2)
+    loader = Loader(catalog_cache)
+    cache.get('a', loader)
+    cache.get('b', loader)
+    cache.get('a', loader)
+
+    cache.get('c', loader)
+
+    assert cache.peek('a') is not None and cache.peek('c') is not None
+    assert cache.peek('b') is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_budget_evicts_oldest_first(catalog_cache, clock):
+    cache, _ = make_cache(catalog_cache, max_bytes=25)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, catalog_cache.CacheValue(key, size=10))
+
+    assert cache.peek('a') is None
+    assert cache.stats()['bytes'] == 20
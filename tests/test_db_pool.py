@@ -0,0 +1,71 @@
+import mysql.connector
+import pytest
+
+from conftest import load_service
+
+
+@pytest.fixture
+def db_pool():
+    return load_service('products_service').db_pool
+
+
+def make_pool(db_pool, **kwargs):
+    kwargs.setdefault('size', 2)
+    kwargs.setdefault('timeout', 0.05)
+    return db_pool.ConnectionPool(max_retries=1, retry_delay=0, **kwargs)
+
+
+def test_closed_connections_are_reused(db, db_pool):
+    pool = make_pool(db_pool)
+    first = pool.get_connection()
+    first.close()
+    second = pool.get_connection()
+    second.close()
+
+    assert len(db.connections) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_checkout_times_out_when_exhausted(db, db_pool):
+    pool = make_pool(db_pool, size=1)
+    held = pool.get_connection()
+
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.get_connection()
+    assert pool.stats()['timeouts'] == 1
+
+    held.close()
+    pool.get_connection().close()
+
+
+def test_release_rolls_back_open_transaction(db, db_pool):
+    pool = make_pool(db_pool)
+    conn = pool.get_connection()
+    conn.start_transaction()
+    conn.close()
+
+    assert db.connections[0].rollbacks == 1
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        conn.cursor()
+
+
+def test_discard_frees_the_slot_without_recycling(db, db_pool):
+    pool = make_pool(db_pool, size=1)
+    pool.get_connection().discard()
+
+    assert db.connections[0].closed
+    pool.get_connection().close()
+    assert len(db.connections) == 2
+
+
+def test_stale_connection_failing_ping_is_replaced(db, db_pool):
+    pool = make_pool(db_pool, validate_after=0)
+    pool.get_connection().close()
+
+    def broken_ping(reconnect=False):
+        raise mysql.connector.errors.InterfaceError(msg='gone away')
+    db.connections[0].ping = broken_ping
+
+    pool.get_connection().close()
+    assert len(db.connections) == 2
+    assert pool.stats()['validation_failures'] == 1
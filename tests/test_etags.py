@@ -0,0 +1,125 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from conftest import load_service
+
+UPDATED = datetime(2026, 10, 17, 9, 30, 15, 250000)
+LATER = datetime(2026, 10, 17, 9, 45, 0)
+
+
+@pytest.fixture
+def products(db, monkeypatch):
+    app = load_service('products_service').app
+    monkeypatch.setattr(app, 'db_pool', app.ConnectionPool(size=2, timeout=1))
+    return app
+
+
+@pytest.fixture
+def users():
+    return load_service('users_service').app
+
+
+def product(updated_at=UPDATED):
+    return {'id': 3, 'name': 'Lamp', 'description': '', 'price': Decimal('5.00'), 'stock': 4,
+            'category': 'home', 'image_url': '', 'updated_at': updated_at}
+
+
+def test_rows_etag_tracks_scope_ids_and_versions(products):
+    rows = [{'id': 1, 'updated_at': UPDATED}, {'id': 2, 'updated_at': LATER}]
+
+    etag, last_modified = products.rows_etag('products?limit=2', rows)
+
+    assert last_modified == LATER
+    assert products.rows_etag('products?limit=2', rows) == (etag, LATER)
+    assert products.rows_etag('products?limit=3', rows)[0] != etag
+    assert products.rows_etag('products?limit=2', rows[:1])[0] != etag
+    assert products.rows_etag('products?limit=2', [rows[0], dict(rows[1], updated_at=UPDATED)])[0] != etag
+
+
+def test_product_etag_round_trip(db, products):
+    client = products.app.test_client()
+    db.on('SELECT id, name, description', rows=[product()], times=1)
+    first = client.get('/api/products/3')
+    etag = first.headers['ETag']
+
+    db.on('SELECT id, updated_at FROM products', rows=[{'id': 3, 'updated_at': UPDATED}], times=1)
+    db.statements.clear()
+    revalidated = client.get('/api/products/3', headers={'If-None-Match': etag})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == etag
+    # Revalidation reads only the version, never the product's columns
+    assert db.executed('SELECT id, name, description') == []
+
+
+def test_changed_product_is_sent_again(db, products):
+    client = products.app.test_client()
+    db.on('SELECT id, name, description', rows=[product()], times=1)
+    etag = client.get('/api/products/3').headers['ETag']
+
+    db.on('SELECT id, updated_at FROM products', rows=[{'id': 3, 'updated_at': LATER}], times=1)
+    db.on('SELECT id, name, description', rows=[product(LATER)], times=1)
+    changed = client.get('/api/products/3', headers={'If-None-Match': etag})
+
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['name'] == 'Lamp'
+
+
+def test_listing_page_revalidates_with_if_none_match(db, products):
+    client = products.app.test_client()
+
+    def page():
+        return [{'id': 1, 'name': 'Desk', 'updated_at': UPDATED}, {'id': 2, 'name': 'Lamp', 'updated_at': LATER}]
+    db.on('FROM products WHERE id >', rows=page(), times=1)
+    first = client.get('/api/products?fields=name&limit=5')
+
+    db.on('FROM products WHERE id >', rows=page(), times=1)
+    revalidated = client.get('/api/products?fields=name&limit=5', headers={'If-None-Match': first.headers['ETag']})
+    db.on('FROM products WHERE id >', rows=page(), times=1)
+    other_page = client.get('/api/products?fields=name&limit=5&after_id=0',
+                            headers={'If-None-Match': first.headers['ETag']})
+
+    assert first.get_json() == [{'id': 1, 'name': 'Desk'}, {'id': 2, 'name': 'Lamp'}]
+    assert revalidated.status_code == 304
+    # The ETag is scoped to the query, so another page never matches it
+    assert other_page.status_code == 200
+
+
+def script_user(db):
+    db.on('SELECT id, name, email, cash_balance, updated_at', times=1, rows=[
+        {'id': 1, 'name': 'Ann', 'email': 'ann@example.com', 'cash_balance': Decimal('40.00'), 'updated_at': UPDATED}
+    ])
+
+
+def test_user_etag_round_trip(db, users):
+    client = users.app.test_client()
+    script_user(db)
+    first = client.get('/api/users/1')
+    assert 'updated_at' not in first.get_json()
+
+    db.on('SELECT updated_at FROM users', rows=[{'updated_at': UPDATED}])
+    revalidated = client.get('/api/users/1', headers={'If-None-Match': first.headers['ETag']})
+    script_user(db)
+    mismatched = client.get('/api/users/1', headers={'If-None-Match': '"other"'})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == first.headers['ETag']
+    assert mismatched.status_code == 200
+    assert mismatched.headers['ETag'] == first.headers['ETag']
+
+
+def test_user_listing_honours_if_modified_since(db, users):
+    client = users.app.test_client()
+    db.on('SELECT COUNT(*) AS total', rows=[{'total': 2, 'last_modified': UPDATED}])
+    db.on('SELECT id, name, email, cash_balance FROM users', rows=[])
+    first = client.get('/api/users')
+
+    unchanged = client.get('/api/users', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    older = client.get('/api/users', headers={'If-Modified-Since': 'Sat, 17 Oct 2026 09:00:00 GMT'})
+
+    assert unchanged.status_code == 304
+    assert older.status_code == 200
+    assert older.headers['ETag'] == first.headers['ETag']
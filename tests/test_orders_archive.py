@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import mysql.connector
+import pytest
+
+from conftest import load_service
+
+T0 = datetime(2026, 10, 17, 12, 0, 0)
+
+
+@pytest.fixture
+def service():
+    return load_service('orders_service')
+
+
+@pytest.fixture
+def orders(service):
+    return service.app
+
+
+def archiver(service, db, batch_size=500):
+    return service.archive.OrderArchiver(db.connect, after_days=180, batch_size=batch_size)
+
+
+def header(id, minutes_ago, archived=0):
+    return {"id": id, "user_id": 1, "total_price": Decimal("10.00"), "status": "completed",
+            "archived": archived, "created_at": T0 - timedelta(minutes=minutes_ago)}
+
+
+def test_archiver_moves_only_the_selected_finished_orders(db, service):
+    db.on("SELECT id FROM orders", rows=[(3,), (5,)])
+
+    assert archiver(service, db).archive_once() == 2
+
+    (select, params), = db.executed("SELECT id FROM orders")
+    # Pending orders are excluded when picking the batch, and only the picked ids move
+    assert "status <> 'pending'" in select and "FOR UPDATE SKIP LOCKED" in select
+    assert params == (180, 500)
+    moves = [(sql.split(" SELECT")[0].split(" WHERE")[0], params) for sql, params in db.statements[1:-1]]
+    assert moves == [
+        ("INSERT INTO orders_archive", [3, 5]),
+        ("INSERT INTO order_items_archive", [3, 5]),
+        ("DELETE FROM orders", [3, 5]),
+    ]
+    assert db.log()[-1] == "COMMIT"
+    assert all(conn.closed for conn in db.connections)
+
+
+def test_archiver_with_nothing_to_move_writes_nothing(db, service):
+    assert archiver(service, db).archive_once() == 0
+    assert db.log()[-1] == "ROLLBACK"
+    assert db.executed("INSERT") == []
+
+
+def test_failed_move_rolls_back_the_whole_batch(db, service):
+    db.on("SELECT id FROM orders", rows=[(3,)])
+    db.on("INSERT INTO order_items_archive", error=mysql.connector.errors.OperationalError(msg="Lock wait timeout"))
+    mover = archiver(service, db)
+
+    with pytest.raises(mysql.connector.Error):
+        mover.archive_once()
+
+    assert db.log()[-1] == "ROLLBACK"
+    assert db.executed("DELETE FROM orders") == []
+    assert mover.stats()["archived"] == 0
+
+
+def test_archived_order_is_found_by_id(db, orders):
+    db.on("FROM orders_archive WHERE id", rows=[header(4, 60 * 24 * 200, archived=1)])
+    db.on("FROM order_items_archive WHERE order_id", rows=[
+        {"product_id": 3, "quantity": 2, "unit_price": Decimal("5.00"), "line_total": Decimal("10.00")}
+    ])
+
+    resp = orders.app.test_client().get("/api/orders/4")
+
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert (body["id"], body["archived"], len(body["items"])) == (4, 1, 1)
+    assert db.executed("FROM order_items WHERE") == []
+
+
+def test_live_order_is_read_from_the_hot_tables_only(db, orders):
+    db.on("FROM orders WHERE id", rows=[header(4, 5)])
+    cursor = db.connect().cursor(dictionary=True)
+
+    assert orders.get_order(cursor, 4)["archived"] == 0
+    assert db.executed("orders_archive") == []
+
+
+def test_locking_read_never_returns_archived_orders(db, orders):
+    db.on("FROM orders_archive WHERE id", rows=[header(4, 60 * 24 * 200, archived=1)])
+    cursor = db.connect().cursor(dictionary=True)
+
+    assert orders.get_order(cursor, 4, for_update=True) is None
+    assert db.executed("orders_archive") == []
+
+
+def test_recent_page_does_not_read_the_archive(db, orders):
+    db.on("FROM orders WHERE", rows=[header(9, 0), header(8, 1), header(7, 2)])
+    db.on("MAX(created_at) AS newest", rows=[{"newest": T0 - timedelta(days=200)}])
+
+    page, next_after = orders.fetch_orders_page(db.connect().cursor(dictionary=True), ["1=1"], [], 2)
+
+    assert [o["id"] for o in page] == [9, 8]
+    assert next_after is not None
+    assert db.executed("FROM orders_archive WHERE") == []
+
+
+def test_page_reaching_the_archive_merges_it_in_order(db, orders):
+    db.on("FROM orders WHERE", rows=[header(9, 0)])
+    db.on("MAX(created_at) AS newest", rows=[{"newest": T0 - timedelta(minutes=5)}])
+    db.on("FROM orders_archive WHERE", rows=[header(2, 5, archived=1), header(1, 6, archived=1)])
+
+    page, next_after = orders.fetch_orders_page(db.connect().cursor(dictionary=True), ["user_id = %s"], [1], 2)
+
+    assert [(o["id"], o["archived"]) for o in page] == [(9, 0), (2, 1)]
+    assert next_after == f"{(T0 - timedelta(minutes=5)).isoformat()},2"
+    (_, params), = db.executed("FROM orders_archive WHERE")
+    assert params == [1, 3]
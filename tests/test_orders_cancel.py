@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import load_service
+
+ORDER = {"id": 5, "user_id": 1, "total_price": Decimal("10.00"), "status": "completed", "archived": 0}
+LINES = [{"product_id": 3, "quantity": 2, "unit_price": Decimal("5.00"), "line_total": Decimal("10.00")}]
+
+
+@pytest.fixture
+def orders():
+    return load_service('orders_service').app
+
+
+@pytest.fixture
+def client(orders):
+    return orders.app.test_client()
+
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return session.get("_flashes", [])
+
+
+def test_deadline_during_side_effects_keeps_the_cancellation(db, orders, client, monkeypatch):
+    db.on("FROM orders WHERE id=%s FOR UPDATE", rows=[dict(ORDER)])
+    db.on("FROM order_items WHERE order_id", rows=LINES)
+    db.on("UPDATE orders SET status='cancelled'", rowcount=1)
+    log_at_fan_out = []
+
+    def fan_out(*calls, fail_fast=True):
+        log_at_fan_out.extend(db.log())
+        raise orders.DownstreamError("Request deadline exceeded")
+    monkeypatch.setattr(orders, "fan_out", fan_out)
+
+    resp = client.get("/orders/cancel/5")
+
+    assert resp.status_code == 302
+    assert log_at_fan_out[-1] == "COMMIT"
+    assert any("INSERT INTO order_events" in sql for sql in log_at_fan_out)
+    assert flashes(client) == [("warning", "Order #5 cancelled, but the refund and restock did not complete")]
+    assert all(conn.closed for conn in db.connections)
+
+
+def test_second_cancel_does_not_restock_again(db, orders, client, monkeypatch):
+    db.on("FROM orders WHERE id=%s FOR UPDATE", rows=[dict(ORDER, status="cancelled")])
+    db.on("FROM order_items WHERE order_id", rows=LINES)
+    restocks = []
+    monkeypatch.setattr(orders, "adjust_stock_batch", lambda deltas, key: restocks.append(deltas) or orders.APPLIED)
+
+    client.get("/orders/cancel/5")
+
+    assert restocks == []
+    assert flashes(client) == [("warning", "Already cancelled")]
+
+
+def test_failure_before_commit_rolls_back_and_closes(db, orders, client):
+    db.on("FROM orders WHERE id=%s FOR UPDATE", rows=[dict(ORDER)])
+    db.on("FROM order_items WHERE order_id", rows=LINES)
+    db.on("UPDATE orders SET status='cancelled'", rowcount=1)
+    db.fail_commit()
+
+    client.get("/orders/cancel/5")
+
+    assert db.log()[-1] == "ROLLBACK"
+    assert all(conn.closed for conn in db.connections)
+    assert flashes(client)[0][0] == "danger"
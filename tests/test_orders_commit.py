@@ -0,0 +1,218 @@
+import mysql.connector
+import pytest
+
+from conftest import load_service
+
+ITEMS = [{"product_id": 3, "product_name": "Lamp", "quantity": 2, "unit_price": 5.0, "line_total": 10.0}]
+
+
+@pytest.fixture
+def orders():
+    return load_service('orders_service').app
+
+
+@pytest.fixture
+def upstream(orders, monkeypatch):
+    """Records balance and stock calls; balance_results and stock_results script their outcomes"""
+    calls = {"balance": [], "stock": [], "stock_keys": [], "balance_results": [], "stock_results": []}
+
+    def adjust_user_balance(user_id, delta, key):
+        calls["balance"].append((user_id, delta, key))
+        return calls["balance_results"].pop(0) if calls["balance_results"] else orders.APPLIED
+
+    def adjust_stock_batch(deltas, key):
+        calls["stock"].append(deltas)
+        calls["stock_keys"].append(key)
+        return calls["stock_results"].pop(0) if calls["stock_results"] else orders.APPLIED
+
+    monkeypatch.setattr(orders, "adjust_user_balance", adjust_user_balance)
+    monkeypatch.setattr(orders, "adjust_stock_batch", adjust_stock_batch)
+    return calls
+
+
+def test_commit_failure_after_debit_refunds_and_releases_stock(db, orders, upstream):
+    db.on("INSERT INTO orders ", lastrowid=42)
+    db.fail_commit()
+
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    (_, debit, debit_key), (_, refund, refund_key) = upstream["balance"]
+    assert (debit, refund) == (-10.0, 10.0)
+    assert debit_key.startswith("order-new-") and debit_key.endswith("-debit")
+    assert refund_key == debit_key.replace("-debit", "-reversal")
+    assert upstream["stock"] == [{3: -2}, {3: 2}]
+    assert "ROLLBACK" in db.log()
+
+
+def test_no_transaction_is_open_during_downstream_calls(db, orders, upstream, monkeypatch):
+    db.on("INSERT INTO orders ", lastrowid=42)
+    statements_at_call = []
+    adjust = orders.adjust_user_balance
+
+    def adjust_user_balance(user_id, delta, key):
+        statements_at_call.append(len(db.log()))
+        return adjust(user_id, delta, key)
+    monkeypatch.setattr(orders, "adjust_user_balance", adjust_user_balance)
+
+    assert orders.commit_order(1, {3: 2}, ITEMS, 10.0) == 42
+    assert statements_at_call == [0]
+    assert db.log()[-1] == "COMMIT"
+
+
+def test_cancel_during_debit_refunds_and_releases(db, orders, upstream):
+    db.on("UPDATE orders SET total_price", rowcount=0)
+
+    with pytest.raises(orders.OrderError) as raised:
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0, order_id=42)
+
+    assert raised.value.status_code == 409
+    assert [delta for _, delta, _ in upstream["balance"]] == [-10.0, 10.0]
+    assert upstream["stock"] == [{3: -2}, {3: 2}]
+
+
+def test_debit_with_unknown_outcome_is_settled_before_refunding(db, orders, upstream):
+    db.on("INSERT INTO orders ", lastrowid=42)
+    # Timed out on our side; the re-sent debit replays as applied
+    upstream["balance_results"] = [orders.UNREACHABLE, orders.APPLIED, orders.APPLIED]
+
+    with pytest.raises(orders.OrderError):
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    keys = [key for _, _, key in upstream["balance"]]
+    assert keys[0] == keys[1]
+    assert [delta for _, delta, _ in upstream["balance"]] == [-10.0, -10.0, 10.0]
+
+
+def test_rejected_debit_is_not_refunded(db, orders, upstream):
+    db.on("INSERT INTO orders ", lastrowid=42)
+    upstream["balance_results"] = [orders.REJECTED]
+
+    with pytest.raises(orders.OrderError) as raised:
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    assert raised.value.status_code == 409
+    assert [delta for _, delta, _ in upstream["balance"]] == [-10.0]
+    assert upstream["stock"] == [{3: -2}, {3: 2}]
+
+
+def test_retry_after_refund_charges_under_a_new_key(db, orders, upstream):
+    db.on("UPDATE orders SET total_price", rowcount=1)
+    db.fail_commit()
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0, order_id=42)
+
+    orders.commit_order(1, {3: 2}, ITEMS, 10.0, order_id=42)
+
+    first_debit, _, second_debit = [key for _, _, key in upstream["balance"]]
+    assert first_debit != second_debit
+    assert db.log()[-1] == "COMMIT"
+
+
+def test_debit_still_unreachable_is_left_for_reconciliation(db, orders, upstream):
+    db.on("INSERT INTO orders ", lastrowid=42)
+    upstream["balance_results"] = [orders.UNREACHABLE, orders.UNREACHABLE]
+
+    with pytest.raises(orders.OrderError) as raised:
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    assert raised.value.status_code == 503
+    assert [delta for _, delta, _ in upstream["balance"]] == [-10.0, -10.0]
+
+
+def test_reservation_with_unknown_outcome_is_settled_and_released(db, orders, upstream):
+    # Timed out on our side; the re-sent reservation replays as applied
+    upstream["stock_results"] = [orders.UNREACHABLE, orders.APPLIED, orders.APPLIED]
+
+    with pytest.raises(orders.OrderError) as raised:
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    assert raised.value.status_code == 503
+    assert upstream["stock"] == [{3: -2}, {3: -2}, {3: 2}]
+    reserve, resent, release = upstream["stock_keys"]
+    assert reserve == resent and reserve.endswith("-reserve")
+    assert release == reserve.replace("-reserve", "-release")
+    assert upstream["balance"] == []
+
+
+def test_reservation_that_never_applied_is_not_released(db, orders, upstream):
+    upstream["stock_results"] = [orders.UNREACHABLE, orders.REJECTED]
+
+    with pytest.raises(orders.OrderError) as raised:
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    assert raised.value.status_code == 503
+    assert upstream["stock"] == [{3: -2}, {3: -2}]
+
+
+def test_unreachable_release_is_retried_then_logged(db, orders, upstream, caplog):
+    db.on("INSERT INTO orders ", lastrowid=42)
+    db.fail_commit()
+    upstream["stock_results"] = [orders.APPLIED, orders.UNREACHABLE, orders.UNREACHABLE]
+
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        orders.commit_order(1, {3: 2}, ITEMS, 10.0)
+
+    _, first_release, second_release = upstream["stock_keys"]
+    assert first_release == second_release
+    assert "reconcile manually" in caplog.text
+
+
+@pytest.mark.parametrize("outcome, permanent", [("rejected", True), ("unreachable", False)])
+def test_only_rejected_writes_fail_an_order_job(db, orders, upstream, monkeypatch, outcome, permanent):
+    db.on("SELECT status FROM orders", rows=[("pending",)])
+    monkeypatch.setattr(orders, "price_order", lambda user_id, quantities: (ITEMS, 10.0))
+    upstream["stock_results"] = [outcome]
+
+    with pytest.raises((orders.OrderError, orders.PermanentJobError)) as raised:
+        orders.process_order_job(42, {"user_id": 1, "items": [[3, 2]]})
+
+    assert isinstance(raised.value, orders.PermanentJobError) == permanent
+
+
+@pytest.mark.parametrize("user, products, status", [
+    ({"cash_balance": 50.0}, {3: {"name": "Lamp", "price": 5.0, "stock": 9}}, None),
+    ("missing", {3: {"name": "Lamp", "price": 5.0, "stock": 9}}, 404),
+    ({"cash_balance": 50.0}, {}, 404),
+    ("down", {3: {"name": "Lamp", "price": 5.0, "stock": 9}}, 503),
+    ({"cash_balance": 50.0}, None, 503),
+])
+def test_price_order_tells_missing_records_from_outages(orders, monkeypatch, user, products, status):
+    def fetch_user(user_id):
+        if user == "missing":
+            raise orders.NotFound("User 1 not found")
+        if user == "down":
+            raise orders.requests.exceptions.ConnectionError("refused")
+        return user
+    monkeypatch.setattr(orders, "fetch_user", fetch_user)
+    monkeypatch.setattr(orders, "get_products_by_ids", lambda ids: products)
+
+    if status is None:
+        assert orders.price_order(1, {3: 2}) == (ITEMS, 10.0)
+        return
+    with pytest.raises(orders.OrderError) as raised:
+        orders.price_order(1, {3: 2})
+    assert raised.value.status_code == status
+
+
+@pytest.mark.parametrize("status, permanent", [(404, True), (409, True), (503, False)])
+def test_order_job_retries_only_outages(db, orders, monkeypatch, status, permanent):
+    db.on("SELECT status FROM orders", rows=[("pending",)])
+
+    def price_order(user_id, quantities):
+        raise orders.OrderError("failed", status)
+    monkeypatch.setattr(orders, "price_order", price_order)
+
+    with pytest.raises((orders.OrderError, orders.PermanentJobError)) as raised:
+        orders.process_order_job(42, {"user_id": 1, "items": [[3, 2]]})
+
+    assert isinstance(raised.value, orders.PermanentJobError) == permanent
+
+
+@pytest.mark.parametrize("status, outcome", [
+    (200, "applied"), (409, "rejected"), (404, "rejected"), (429, "unreachable"), (503, "unreachable"),
+])
+def test_write_outcome(orders, status, outcome):
+    class Response:
+        status_code = status
+    assert orders.write_outcome(Response()) == outcome
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import load_service
+
+T0 = datetime(2026, 10, 17, 12, 0, 0)
+KEYSET = "(created_at < %s OR (created_at = %s AND id < %s))"
+
+
+@pytest.fixture
+def orders():
+    return load_service('orders_service').app
+
+
+def order(id, minutes_ago):
+    return {"id": id, "user_id": 1, "total_price": 10, "status": "completed", "archived": 0,
+            "created_at": T0 - timedelta(minutes=minutes_ago)}
+
+
+@pytest.mark.parametrize("args, where, params", [
+    ({}, ["1=1"], []),
+    ({"user_id": "7"}, ["user_id = %s"], [7]),
+    ({"status": "pending", "from": "2026-10-01"}, ["status = %s", "created_at >= %s"],
+     ["pending", datetime(2026, 10, 1)]),
+    # A bare date as the exclusive upper bound still covers that whole day
+    ({"user_id": "7", "to": "2026-10-16"}, ["user_id = %s", "created_at < %s"], [7, datetime(2026, 10, 17)]),
+    ({"to": "2026-10-16T08:30:00"}, ["created_at < %s"], [datetime(2026, 10, 16, 8, 30)]),
+    ({"status": "completed", "after": "2026-10-17T11:00:00,42"}, ["status = %s", KEYSET],
+     ["completed", datetime(2026, 10, 17, 11), datetime(2026, 10, 17, 11), 42]),
+])
+def test_filters_combine_into_indexed_predicates(orders, args, where, params):
+    assert orders.parse_order_filters(args) == (where, params, orders.DEFAULT_PAGE_SIZE)
+
+
+@pytest.mark.parametrize("args", [{"status": "shipped"}, {"limit": "0"}, {"after": "yesterday,1"},
+                                  {"user_id": "me"}, {"after": "2026-10-17T11:00:00,x"}])
+def test_invalid_filters_are_rejected(orders, args):
+    with pytest.raises(ValueError):
+        orders.parse_order_filters(args)
+
+
+def test_limit_is_capped(orders):
+    assert orders.parse_order_filters({"limit": str(orders.MAX_PAGE_SIZE + 1)})[2] == orders.MAX_PAGE_SIZE
+
+
+def test_full_page_hands_back_a_cursor_from_its_last_row(db, orders):
+    db.on("FROM orders WHERE", rows=[order(9, 0), order(8, 0), order(7, 5)])
+    db.on("MAX(created_at) AS newest", rows=[{"newest": None}])
+    cursor = db.connect().cursor(dictionary=True)
+
+    page, next_after = orders.fetch_orders_page(cursor, ["user_id = %s"], [1], 2)
+
+    assert [o["id"] for o in page] == [9, 8]
+    assert next_after == "2026-10-17T12:00:00,8"
+    (sql, params), = db.executed("FROM orders WHERE")
+    assert sql.endswith("WHERE user_id = %s ORDER BY created_at DESC, id DESC LIMIT %s")
+    assert params == [1, 3]
+
+    # The cursor resumes after (created_at, id), so ties on created_at are neither skipped nor repeated
+    where, params, _ = orders.parse_order_filters({"user_id": "1", "after": next_after})
+    assert where == ["user_id = %s", KEYSET]
+    assert params == [1, T0, T0, 8]
+
+
+def test_last_page_has_no_cursor(db, orders):
+    db.on("FROM orders WHERE", rows=[order(2, 0), order(1, 1)])
+    db.on("MAX(created_at) AS newest", rows=[{"newest": None}])
+
+    page, next_after = orders.fetch_orders_page(db.connect().cursor(dictionary=True), ["1=1"], [], 2)
+
+    assert [o["id"] for o in page] == [2, 1]
+    assert next_after is None
+
+
+def test_listing_route_pages_with_the_cursor(db, orders, monkeypatch):
+    db.on("FROM orders WHERE", rows=[order(9, 0), order(8, 1)])
+    db.on("MAX(created_at) AS newest", rows=[{"newest": None}])
+    monkeypatch.setattr(orders, "lookup_names", lambda user_ids, product_ids: [{}, {}])
+
+    resp = orders.app.test_client().get("/orders?status=completed&limit=1")
+
+    assert resp.status_code == 200
+    assert "/orders?after=2026-10-17T12:00:00,9&amp;status=completed" in resp.get_data(as_text=True)
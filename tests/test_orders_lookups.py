@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import load_service
+
+
+@pytest.fixture
+def orders():
+    return load_service('orders_service').app
+
+
+class Response:
+    def __init__(self, body, status_code=200, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+
+def test_get_products_follows_the_listing_cursor(orders, monkeypatch):
+    pages = {
+        None: Response([{"id": 1, "price": "2.50"}, {"id": 2, "price": "1"}], headers={"X-Next-After-Id": "2"}),
+        "2": Response([{"id": 3, "price": "4"}]),
+    }
+    requested = []
+
+    def get(path, params=None):
+        requested.append(params.get("after_id"))
+        return pages[params.get("after_id")]
+    monkeypatch.setattr(orders.products_client, "get", get)
+
+    products = orders.get_products()
+
+    assert [p["id"] for p in products] == [1, 2, 3]
+    assert products[0]["price"] == 2.5
+    assert requested == [None, "2"]
+
+
+def test_get_products_failing_midway_returns_nothing(orders, monkeypatch):
+    responses = [Response([{"id": 1, "price": "1"}], headers={"X-Next-After-Id": "1"}), Response({}, 503)]
+    monkeypatch.setattr(orders.products_client, "get", lambda path, params=None: responses.pop(0))
+
+    assert orders.get_products() == []
+
+
+def test_batched_lookups_respect_the_upstream_cap(orders):
+    requested = []
+
+    def loader(ids):
+        requested.append(ids)
+        return {i: {"id": i} for i in ids}
+
+    found = orders.batched(loader, 2)([1, 2, 3, 4, 5])
+
+    assert requested == [[1, 2], [3, 4], [5]]
+    assert sorted(found) == [1, 2, 3, 4, 5]
+
+
+def test_batched_lookup_fails_as_a_whole(orders):
+    chunks = [{1: {}}, None]
+
+    assert orders.batched(lambda ids: chunks.pop(0), 1)([1, 2]) is None
@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import load_service
+
+
+@pytest.fixture
+def orders():
+    return load_service('orders_service').app
+
+
+def test_legacy_lines_are_copied_then_columns_dropped(db, orders):
+    db.on("FROM information_schema.COLUMNS", rows=[(1,)])
+    db.on("FROM information_schema.KEY_COLUMN_USAGE", rows=[("orders_ibfk_2",)])
+
+    orders.migrate_single_line_orders(db.connect().cursor())
+
+    log = db.log()
+    assert [sql.split(" ")[0] for sql in log] == ["SELECT", "INSERT", "SELECT", "ALTER", "ALTER"]
+    # Only orders without a line yet are copied, so an interrupted run can be resumed
+    assert "LEFT JOIN order_items i ON i.order_id = o.id WHERE i.id IS NULL" in log[1]
+    assert log[3] == "ALTER TABLE orders DROP FOREIGN KEY orders_ibfk_2"
+    assert log[4] == "ALTER TABLE orders DROP COLUMN product_id, DROP COLUMN quantity"
+
+
+def test_rerun_after_migration_does_nothing(db, orders):
+    cursor = db.connect().cursor()
+    db.on("FROM information_schema.COLUMNS", rows=[(1,)], times=1)
+
+    orders.migrate_single_line_orders(cursor)
+    db.statements.clear()
+    orders.migrate_single_line_orders(cursor)
+
+    assert len(db.log()) == 1 and "information_schema.COLUMNS" in db.log()[0]
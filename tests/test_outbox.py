@@ -0,0 +1,56 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from conftest import load_service
+
+EVENT = {"id": 11, "order_id": 5, "event_type": "created", "user_id": 1, "total_price": 10,
+         "payload": json.dumps({"status": "completed", "items": []}), "created_at": datetime(2026, 10, 17)}
+
+
+@pytest.fixture
+def outbox():
+    return load_service('orders_service').outbox
+
+
+def make_relay(outbox, db, sink):
+    db.on("SELECT last_event_id FROM outbox_offsets", rows=[{"last_event_id": 10}])
+    db.on("FROM order_events", rows=[dict(EVENT)])
+    db.on("SELECT MIN(last_event_id)", rows=[(10,)])
+    return outbox.OutboxRelay(db.connect, sink)
+
+
+def test_in_process_sink_without_subscribers_keeps_the_offset(db, outbox):
+    relay = make_relay(outbox, db, outbox.InProcessSink())
+
+    assert relay.relay_once() == 0
+    assert not db.executed("UPDATE outbox_offsets")
+    assert relay.stats()["sink_ready"] is False
+
+
+def test_events_wait_for_the_first_subscriber(db, outbox):
+    sink = outbox.InProcessSink()
+    relay = make_relay(outbox, db, sink)
+    relay.relay_once()
+    received = []
+    sink.subscribe(received.extend)
+
+    assert relay.relay_once() == 1
+    assert [event["id"] for event in received] == [11]
+    assert db.executed("UPDATE outbox_offsets")[0][1] == (11, "in-process")
+
+
+def test_failed_publish_does_not_advance(db, outbox):
+    class BrokenSink:
+        name = "broken"
+        ready = True
+
+        def publish(self, events):
+            raise ConnectionError("sink down")
+    relay = make_relay(outbox, db, BrokenSink())
+
+    with pytest.raises(ConnectionError):
+        relay.relay_once()
+    assert not db.executed("UPDATE outbox_offsets")
+    assert db.log()[-1] == "ROLLBACK"
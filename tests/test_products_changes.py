@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import load_service
+
+SETTLED = datetime(2026, 10, 17, 12, 0, 0, 500000)
+
+
+@pytest.fixture
+def products(db, monkeypatch):
+    app = load_service('products_service').app
+    monkeypatch.setattr(app, 'db_pool', app.ConnectionPool(size=2, timeout=1))
+    return app
+
+
+@pytest.fixture
+def client(products):
+    return products.app.test_client()
+
+
+def script_feed(db, products=(), tombstones=()):
+    db.on('AS horizon', rows=[{'horizon': datetime(2026, 10, 10, 12, 0)}])
+    db.on('AS settled', rows=[{'settled': SETTLED}])
+    db.on('FROM products WHERE updated_at', rows=products)
+    db.on('FROM product_tombstones', rows=tombstones)
+
+
+def test_empty_page_advances_cursor_to_settle_horizon(db, client):
+    script_feed(db)
+
+    resp = client.get('/api/products/changes?since=2026-10-12T08:00:00,17')
+
+    assert resp.get_json() == {'changes': [], 'next_since': '2026-10-17T12:00:00.500000,0', 'has_more': False}
+
+
+def test_idle_client_polling_stays_inside_retention(db, client):
+    # Each empty poll hands back a cursor at the horizon, never an aging one
+    script_feed(db)
+    since = client.get('/api/products/changes').get_json()['next_since']
+
+    resp = client.get(f'/api/products/changes?since={since}')
+
+    assert resp.status_code == 200
+    assert resp.get_json()['next_since'] == since
+
+
+def test_cursor_ahead_of_settle_horizon_is_kept(db, client):
+    script_feed(db)
+
+    resp = client.get('/api/products/changes?since=2026-10-17T12:00:01,9')
+
+    assert resp.get_json()['next_since'] == '2026-10-17T12:00:01,9'
+
+
+def test_cursor_past_retention_is_gone(db, client):
+    script_feed(db)
+
+    resp = client.get('/api/products/changes?since=2026-10-01T00:00:00,3')
+
+    assert resp.status_code == 410
@@ -0,0 +1,66 @@
+import mysql.connector
+import pytest
+
+from conftest import load_service
+
+CSV = '''sku,name,description,price,stock,category,image_url
+A1,Desk,,10.00,1,office,
+B2,Lamp,,5.00,2,home,
+A1,Desk v2,,11.00,1,office,
+C3,Chair,,cheap,1,office,
+D4,Sofa,,20.00,1,home,
+'''
+
+
+@pytest.fixture
+def products(db, monkeypatch):
+    app = load_service('products_service').app
+    monkeypatch.setattr(app, 'db_pool', app.ConnectionPool(size=2, timeout=1))
+    return app
+
+
+def script_writes(db, *outcomes):
+    """Answer successive import statements in order; False fails one with a data error"""
+    for ok in outcomes:
+        error = None if ok else mysql.connector.errors.DataError(errno=1406, msg="Data too long for column 'name'")
+        db.on('INSERT INTO products (sku', error=error, times=1)
+
+
+def test_duplicate_sku_splits_the_batch_and_bad_rows_are_reported(db, products):
+    # First batch, then the second batch fails and is retried row by row
+    script_writes(db, True, False, True, False)
+
+    resp = products.app.test_client().post('/api/products/import', data=CSV, content_type='text/csv')
+
+    writes = db.executed('INSERT INTO products (sku')
+    batches = [[row[0] for row in params] for _, params in writes[:2]]
+    assert batches == [['A1', 'B2'], ['A1', 'D4']]
+    assert [params[0] for _, params in writes[2:]] == ['A1', 'D4']
+    assert resp.get_json() == {
+        'upserted': 3,
+        'rejected': 2,
+        'errors': [
+            {'line': 5, 'sku': 'C3', 'error': 'price must be a number'},
+            {'line': 6, 'sku': 'D4', 'error': "Data too long for column 'name'"},
+        ],
+        'errors_truncated': False,
+    }
+
+
+def test_each_batch_commits_on_its_own(db, products):
+    script_writes(db, True, False, True, False)
+
+    products.app.test_client().post('/api/products/import', data=CSV, content_type='text/csv')
+
+    log = [sql.split(' (')[0] for sql in db.log() if sql.startswith('INSERT') or sql in ('COMMIT', 'ROLLBACK')]
+    assert log == ['INSERT INTO products', 'COMMIT', 'INSERT INTO products', 'ROLLBACK',
+                   'INSERT INTO products', 'INSERT INTO products', 'COMMIT']
+
+
+def test_batch_size_splits_without_duplicates(db, products):
+    csv = 'sku,name,price\n' + ''.join(f'S{i},Item {i},1\n' for i in range(5))
+
+    resp = products.app.test_client().post('/api/products/import?batch_size=2', data=csv, content_type='text/csv')
+
+    assert [len(params) for _, params in db.executed('INSERT INTO products (sku')] == [2, 2, 1]
+    assert resp.get_json()['upserted'] == 5
@@ -0,0 +1,90 @@
+import mysql.connector
+import pytest
+
+from conftest import load_service
+
+BATCH = {'adjustments': [{'product_id': 7, 'delta': -2}, {'product_id': 3, 'delta': -1}]}
+
+
+@pytest.fixture
+def products(db, monkeypatch):
+    app = load_service('products_service').app
+    monkeypatch.setattr(app, 'db_pool', app.ConnectionPool(size=2, timeout=1))
+    return app
+
+
+@pytest.fixture
+def client(products):
+    return products.app.test_client()
+
+
+def test_keyed_batch_records_its_result(db, client):
+    db.on('UPDATE products SET stock', lastrowid=4)
+
+    resp = client.post('/api/products/stock/adjust', json=BATCH, headers={'Idempotency-Key': 'order-1-reserve'})
+
+    assert resp.get_json()['replayed'] is False
+    (_, (key, recorded)), = db.executed('INSERT INTO stock_adjustments')
+    assert (key, recorded) == ('order-1-reserve', '[[3, -1], [7, -2]]')
+    (_, (stock_after, _key)), = db.executed('UPDATE stock_adjustments SET stock_after')
+    assert stock_after == '[[3, 4], [7, 4]]'
+
+
+def test_repeated_key_replays_without_adjusting(db, client):
+    db.on('INSERT INTO stock_adjustments', error=mysql.connector.errors.IntegrityError(errno=1062))
+    db.on('FROM stock_adjustments WHERE idempotency_key', rows=[('[[3, -1], [7, -2]]', '[[3, 4], [7, 9]]')])
+
+    resp = client.post('/api/products/stock/adjust', json=BATCH, headers={'Idempotency-Key': 'order-1-reserve'})
+
+    assert resp.get_json() == {'products': [{'id': 3, 'stock': 4}, {'id': 7, 'stock': 9}], 'replayed': True}
+    assert db.executed('UPDATE products') == []
+
+
+def test_key_reused_for_other_adjustments_is_refused(db, client):
+    db.on('INSERT INTO stock_adjustments', error=mysql.connector.errors.IntegrityError(errno=1062))
+    db.on('FROM stock_adjustments WHERE idempotency_key', rows=[('[[3, -5]]', '[[3, 0]]')])
+
+    resp = client.post('/api/products/stock/adjust', json=BATCH, headers={'Idempotency-Key': 'order-1-reserve'})
+
+    assert resp.status_code == 422
+    assert db.executed('UPDATE products') == []
+
+
+def test_batch_is_applied_in_id_order_in_one_transaction(db, products):
+    db.on('UPDATE products SET stock', lastrowid=5, times=1)
+    db.on('UPDATE products SET stock', lastrowid=0)
+    conn = db.connect()
+
+    new_stock, replayed = products.apply_stock_adjustments(conn, [(7, -2), (3, -1)])
+
+    updates = db.executed('UPDATE products SET stock = LAST_INSERT_ID(stock + %s)')
+    assert [params for _, params in updates] == [(-1, 3, -1), (-2, 7, -2)]
+    # A row left at 0 stock is still a success, read back through LAST_INSERT_ID
+    assert (new_stock, replayed) == ({3: 5, 7: 0}, False)
+    assert db.log()[-1] == 'COMMIT'
+
+
+def test_one_short_row_rolls_back_the_whole_batch(db, products):
+    db.on('UPDATE products SET stock', lastrowid=5, times=1)
+    db.on('UPDATE products SET stock', rowcount=0)
+    db.on('SELECT stock FROM products', rows=[(1,)])
+    conn = db.connect()
+
+    with pytest.raises(products.StockConflict) as raised:
+        products.apply_stock_adjustments(conn, [(3, -1), (7, -2)])
+
+    assert (raised.value.product_id, raised.value.delta, raised.value.stock) == (7, -2, 1)
+    assert db.log()[-1] == 'ROLLBACK'
+    assert 'COMMIT' not in db.log()
+
+
+def test_short_batch_answers_409_and_missing_product_404(db, client):
+    db.on('UPDATE products SET stock', rowcount=0)
+    db.on('SELECT stock FROM products WHERE id', rows=[(1,)], times=1)
+
+    short = client.post('/api/products/stock/adjust', json=BATCH)
+    missing = client.post('/api/products/stock/adjust', json=BATCH)
+
+    assert short.status_code == 409
+    assert short.get_json() == {'error': 'Insufficient stock', 'product_id': 3, 'delta': -1, 'stock': 1}
+    assert missing.status_code == 404
@@ -0,0 +1,59 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from conftest import load_service
+
+WATERMARK = datetime(2026, 10, 1, 9, 0)
+
+
+def order(order_id, updated_at, status="completed", total="10.00"):
+    return {"id": order_id, "total_price": Decimal(total), "status": status,
+            "created_at": datetime(2026, 4, 1, 8, 0), "updated_at": updated_at}
+
+
+@pytest.fixture
+def rollups():
+    return load_service('metrics_service').rollups
+
+
+def script_ingest(db, hot=(), archived=()):
+    db.on("SELECT updated_at, last_id FROM metrics_rollup_watermarks",
+          rows=[{"updated_at": WATERMARK, "last_id": 4}])
+    db.on("AS settled", rows=[{"settled": datetime(2026, 10, 17, 12, 0)}])
+    db.on("FROM orders WHERE", rows=hot)
+    db.on("FROM orders_archive WHERE", rows=archived)
+
+
+def test_orders_archived_ahead_of_the_watermark_are_still_counted(db, rollups):
+    # Order 3 was archived after any one-off backfill but before the watermark reached it
+    script_ingest(db, hot=[order(9, datetime(2026, 10, 2, 10, 0))],
+                  archived=[order(3, datetime(2026, 10, 1, 12, 0), total="25.00")])
+
+    assert rollups.RollupIngester(db.connect).ingest_once() == 2
+
+    (_, counted), = db.executed("INSERT INTO metrics_daily_orders")
+    assert counted == [(datetime(2026, 4, 1).date(), "completed", 2, Decimal("35.00"))]
+    (_, watermark), = db.executed("UPDATE metrics_rollup_watermarks")
+    assert watermark == (datetime(2026, 10, 2, 10, 0), 9)
+
+
+def test_both_tables_are_read_after_the_same_watermark(db, rollups):
+    script_ingest(db)
+
+    assert rollups.RollupIngester(db.connect).ingest_once() == 0
+
+    reads = db.executed("ORDER BY updated_at, id")
+    assert ["FROM orders_archive" in sql for sql, _ in reads] == [False, True]
+    assert all(params[1:4] == [WATERMARK, WATERMARK, 4] for _, params in reads)
+
+
+def test_merged_batch_is_cut_at_batch_size_in_watermark_order(db, rollups):
+    script_ingest(db, hot=[order(7, datetime(2026, 10, 3)), order(8, datetime(2026, 10, 5))],
+                  archived=[order(2, datetime(2026, 10, 4)), order(1, datetime(2026, 10, 6))])
+
+    assert rollups.RollupIngester(db.connect, batch_size=2).ingest_once() == 2
+
+    (_, watermark), = db.executed("UPDATE metrics_rollup_watermarks")
+    assert watermark == (datetime(2026, 10, 4), 2)
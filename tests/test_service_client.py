@@ -0,0 +1,124 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import load_service
+
+
+@pytest.fixture
+def service_client():
+    return load_service('orders_service').service_client
+
+
+@pytest.fixture
+def clock(service_client, monkeypatch):
+    """A settable monotonic clock, seen only by the service_client module"""
+    now = [1000.0]
+    monkeypatch.setattr(service_client, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_breaker_opens_on_failure_ratio_and_rejects(service_client, clock):
+    breaker = service_client.CircuitBreaker(failure_ratio=0.5, window=4, min_calls=4, reset_timeout=10)
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.snapshot()['state'] == 'closed'
+
+    breaker.record(False)
+
+    assert breaker.snapshot()['state'] == 'open'
+    assert not breaker.allow()
+    assert breaker.snapshot()['rejected'] == 1
+
+
+def test_half_open_lets_a_single_trial_through(service_client, clock):
+    breaker = service_client.CircuitBreaker(window=2, min_calls=2, reset_timeout=10)
+    breaker.record(False)
+    breaker.record(False)
+
+    clock[0] += 9.9
+    assert not breaker.allow()
+    clock[0] += 0.1
+    assert breaker.allow()
+    assert breaker.snapshot()['state'] == 'half_open'
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize('trial_succeeds, state', [(True, 'closed'), (False, 'open')])
+def test_trial_outcome_closes_or_reopens(service_client, clock, trial_succeeds, state):
+    breaker = service_client.CircuitBreaker(window=2, min_calls=2, reset_timeout=10)
+    breaker.record(False)
+    breaker.record(False)
+    clock[0] += 10
+    assert breaker.allow()
+
+    breaker.record(trial_succeeds)
+
+    assert breaker.snapshot()['state'] == state
+    assert breaker.allow() == trial_succeeds
+
+
+def test_open_circuit_fails_fast_without_calling(service_client, clock):
+    breaker = service_client.CircuitBreaker(window=1, min_calls=1)
+    breaker.record(False)
+    client = service_client.ServiceClient('breaker-test', 'http://upstream', breaker=breaker)
+    client.session = SimpleNamespace(request=pytest.fail)
+
+    with pytest.raises(service_client.CircuitOpenError):
+        client.get('/x')
+
+
+class SlowThenFastSession:
+    """The first request blocks until released; every later one answers at once"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            self.release.wait(5)
+            return SimpleNamespace(status_code=200, text='slow')
+        return SimpleNamespace(status_code=200, text='fast')
+
+
+def hedging_client(service_client, samples_ms):
+    client = service_client.ServiceClient('hedge-test', 'http://upstream', hedge_min_samples=len(samples_ms))
+    for elapsed_ms in samples_ms:
+        client.latency.record(elapsed_ms)
+    client.session = SlowThenFastSession()
+    return client
+
+
+def test_attempt_outliving_p95_is_hedged(service_client):
+    client = hedging_client(service_client, [5] * 20)
+    try:
+        assert client._send('GET', 'http://upstream/x', True, timeout=1).text == 'fast'
+    finally:
+        client.session.release.set()
+    assert client.session.calls == 2
+    assert client.latency.hedges == 1
+
+
+def test_no_hedge_without_enough_samples(service_client):
+    client = hedging_client(service_client, [5] * 20)
+    client.hedge_min_samples = 21
+    client.session.release.set()
+
+    assert client._send('GET', 'http://upstream/x', True, timeout=1).text == 'slow'
+    assert client.session.calls == 1
+
+
+def test_writes_are_never_hedged(service_client):
+    client = hedging_client(service_client, [5] * 20)
+    # Released well after the 5ms p95, so a hedge would have answered first
+    threading.Timer(0.1, client.session.release.set).start()
+
+    assert client.request('POST', '/x', hedge=True).text == 'slow'
+    assert client.session.calls == 1
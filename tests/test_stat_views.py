@@ -0,0 +1,76 @@
+import re
+
+import mysql.connector
+import pytest
+
+from conftest import ROOT, load_service
+
+INIT_SQL = (ROOT / "mysql" / "init.sql").read_text()
+
+
+def table_definition(table):
+    return re.search(rf"CREATE TABLE IF NOT EXISTS {table} \((.*?)\n\);", INIT_SQL, re.S).group(1)
+
+
+def plain_table_views():
+    metrics = load_service('metrics_service').app
+    for name, (query, ordering) in metrics.STAT_VIEWS.items():
+        match = re.fullmatch(r"SELECT [\w, ]+ FROM (\w+)", query.strip())
+        if match:
+            yield name, match.group(1), ordering
+
+
+@pytest.mark.parametrize("name, table, ordering", list(plain_table_views()))
+def test_plain_table_keysets_are_indexed_and_not_null(name, table, ordering):
+    definition = table_definition(table)
+    columns = ", ".join(column for column, _ in ordering)
+
+    assert re.search(rf"INDEX \w+ \({columns}\)", definition), f"{name}: no ({columns}) index on {table}"
+    first = ordering[0][0]
+    assert re.search(rf"^\s+{first} .*NOT NULL", definition, re.M), f"{name}: {table}.{first} is nullable"
+
+
+@pytest.mark.parametrize("service", ["users_service", "products_service"])
+def test_nullable_keyset_columns_are_migrated(db, service):
+    app = load_service(service).app
+    db.on("SELECT IS_NULLABLE", rows=[("YES",)], times=1)
+    db.on("SELECT IS_NULLABLE", rows=[("NO",)])
+    conn = db.connect()
+
+    app.ensure_not_null(conn.cursor(), "t", "c", "INT NOT NULL DEFAULT 0", "0")
+    app.ensure_not_null(conn.cursor(), "t", "c", "INT NOT NULL DEFAULT 0", "0")
+
+    assert db.log()[1:3] == ["UPDATE t SET c = 0 WHERE c IS NULL", "ALTER TABLE t MODIFY c INT NOT NULL DEFAULT 0"]
+    assert len(db.log()) == 4
+
+
+@pytest.fixture
+def metrics():
+    return load_service('metrics_service').app
+
+
+def test_export_failing_to_connect_closes_opened_connections(db, metrics, monkeypatch):
+    attempts = []
+
+    def get_db_connection():
+        attempts.append(1)
+        if len(attempts) > 1:
+            raise mysql.connector.errors.InterfaceError(msg="Can't connect")
+        return db.connect()
+    monkeypatch.setattr(metrics, "get_db_connection", get_db_connection)
+
+    resp = metrics.app.test_client().get(f"/stat/{next(iter(metrics.ORDER_VIEWS))}?format=csv")
+
+    assert resp.status_code == 503
+    assert "unavailable" in resp.get_json()["error"]
+    assert [conn.closed for conn in db.connections] == [True]
+
+
+def test_export_timing_out_returns_json_and_closes(db, metrics):
+    db.on("SELECT", error=mysql.connector.errors.DatabaseError(errno=3024))
+
+    resp = metrics.app.test_client().get(f"/stat/{next(iter(metrics.ORDER_VIEWS))}?format=ndjson")
+
+    assert resp.status_code == 503
+    assert resp.get_json() == {"error": "The query took too long and was stopped."}
+    assert len(db.connections) == 2 and all(conn.closed for conn in db.connections)
@@ -0,0 +1,68 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from conftest import load_service
+
+
+def order(order_id, day, status="completed"):
+    return {"id": order_id, "user_id": 1, "total_price": 10, "status": status,
+            "created_at": datetime(2026, 10, day), "archived": 0}
+
+
+@pytest.fixture
+def orders():
+    return load_service('orders_service').app
+
+
+@pytest.fixture
+def metrics():
+    return load_service('metrics_service').app
+
+
+def test_order_stream_merges_hot_and_archive_without_a_union(db, orders):
+    # A pending order older than the newest archived one still sorts into place
+    db.on("FROM orders WHERE", rows=[order(9, 5), order(3, 1, "pending")])
+    db.on("FROM orders_archive WHERE", rows=[dict(order(5, 3), archived=1), dict(order(4, 2), archived=1)])
+
+    resp = orders.app.test_client().get("/api/orders?stream=1")
+
+    assert [json.loads(line)["id"] for line in resp.data.decode().splitlines()] == [9, 5, 4, 3]
+    assert not [sql for sql in db.log() if "UNION" in sql]
+    assert all("ORDER BY created_at DESC, id DESC" in sql for sql in db.log())
+    assert len(db.connections) == 2 and all(conn.closed for conn in db.connections)
+
+
+def test_order_export_is_merged_and_capped(db, metrics, monkeypatch):
+    monkeypatch.setattr(metrics, "STAT_EXPORT_MAX_ROWS", 3)
+    columns = ("id", "user", "products", "quantity", "total_price", "status", "created_at")
+    db.on("FROM orders WHERE", rows=[dict(zip(columns, (8, "Ann", "Lamp", 1, 10, "completed", datetime(2026, 10, 9)))),
+                                    dict(zip(columns, (7, "Ann", "Lamp", 1, 10, "completed", datetime(2026, 10, 4))))])
+    db.on("FROM orders_archive WHERE",
+          rows=[dict(zip(columns, (2, "Bob", "Desk", 2, 30, "completed", datetime(2026, 10, 6)))),
+                dict(zip(columns, (1, "Bob", "Desk", 2, 30, "completed", datetime(2026, 10, 1))))])
+
+    resp = metrics.app.test_client().get("/stat/completed-orders?format=csv")
+
+    lines = resp.data.decode().splitlines()
+    assert lines[0] == ",".join(columns)
+    assert [line.split(",")[0] for line in lines[1:]] == ["8", "2", "7"]
+    exports = [sql for sql in db.log() if "SELECT o.id" in sql]
+    assert len(exports) == 2 and not any("GROUP BY" in sql or "UNION" in sql for sql in exports)
+
+
+def test_abandoned_stream_discards_the_connection(db, orders):
+    streaming = load_service('orders_service').streaming
+    db.on("SELECT id FROM t", rows=[{"id": i} for i in range(10)])
+    conn = db.connect()
+    discarded = []
+    conn.discard = lambda: discarded.append(True)
+
+    with orders.app.test_request_context():
+        response = streaming.stream_query(conn, "SELECT id FROM t", chunk_size=2)
+        body = iter(response.response)
+        next(body)
+        response.close()
+
+    assert discarded == [True]
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import load_service
+
+DAY1, DAY2, DAY3, DAY4 = (datetime(2026, 9, day) for day in (1, 2, 3, 4))
+
+
+@pytest.fixture
+def cache(db):
+    timeseries = load_service('metrics_service').timeseries
+    return timeseries.TimeseriesCache(db.connect)
+
+
+def test_hot_and_archive_buckets_are_added_up(db, cache):
+    db.on("FROM orders WHERE", rows=[("2026-09-01", 2), ("2026-09-02", 1)])
+    db.on("FROM orders_archive WHERE", rows=[("2026-09-01", 5)])
+
+    assert cache.series("orders", "day", DAY1, DAY4) == [(DAY1, 7), (DAY2, 1), (DAY3, 0)]
+    assert db.executed("all_orders") == []
+    assert all(conn.closed for conn in db.connections)
+
+
+def test_only_contiguous_runs_of_missing_buckets_are_queried(db, cache):
+    cache.series("orders", "day", DAY2, DAY3)
+    db.statements.clear()
+
+    cache.series("orders", "day", DAY1, DAY4)
+
+    ranges = {tuple(params[1:3]) for _, params in db.executed("FROM orders WHERE")}
+    assert ranges == {(DAY1, DAY2), (DAY3, DAY4)}
+    assert len(db.executed("FROM orders_archive WHERE")) == 2
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+import mysql.connector
+import pytest
+
+from conftest import load_service
+
+
+@pytest.fixture
+def client():
+    return load_service('users_service').app.app.test_client()
+
+
+def script_adjustment(db):
+    db.on('UPDATE users SET cash_balance', rowcount=1)
+    db.on('SELECT cash_balance FROM users', rows=[{'cash_balance': Decimal('40.00')}])
+
+
+def test_keyed_adjustment_prunes_expired_idempotency_records(db, client):
+    script_adjustment(db)
+
+    resp = client.post('/api/users/1/balance/adjust', json={'delta': -10},
+                       headers={'Idempotency-Key': 'order-7-debit'})
+
+    assert resp.status_code == 200
+    log = db.log()
+    prune = log.index(db.executed('DELETE FROM balance_adjustments')[0][0])
+    assert log[prune - 1] == 'COMMIT'
+    assert db.executed('DELETE FROM balance_adjustments')[0][1] == (7,)
+
+
+def test_failed_prune_does_not_fail_the_adjustment(db, client):
+    script_adjustment(db)
+    db.on('DELETE FROM balance_adjustments', error=mysql.connector.errors.OperationalError(msg='Lock wait timeout'))
+
+    resp = client.post('/api/users/1/balance/adjust', json={'delta': -10, 'idempotency_key': 'order-8-debit'})
+
+    assert resp.status_code == 200
+    assert resp.get_json()['replayed'] is False
+    assert db.log().count('COMMIT') == 1
+
+
+def test_unkeyed_adjustment_skips_pruning(db, client):
+    script_adjustment(db)
+
+    client.post('/api/users/1/balance/adjust', json={'delta': 5})
+
+    assert not db.executed('DELETE FROM balance_adjustments')
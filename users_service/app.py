@@ -1,7 +1,11 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
 import mysql.connector
+import hashlib
 import os
 import time
+from decimal import Decimal, InvalidOperation
+
+from streaming import wants_stream, stream_query
 
 app = Flask(__name__)
 app.secret_key = 'users-service-secret-key'
@@ -14,6 +18,12 @@ db_config = {
     'database': os.getenv('MYSQL_DB', 'microservices')
 }
 
+MAX_BATCH_SIZE = int(os.getenv('USERS_MAX_BATCH_SIZE', 500))
+
+# Idempotency records only need to outlive the callers' retry window (minutes);
+# a key replayed after its record was pruned would be applied again
+BALANCE_ADJUSTMENT_RETENTION_DAYS = int(os.getenv('BALANCE_ADJUSTMENT_RETENTION_DAYS', 7))
+
 def get_db_connection():
     """Create and return a database connection with retry logic"""
     max_retries = 5
@@ -31,6 +41,62 @@ def get_db_connection():
             else:
                 raise
 
+def ensure_index(cursor, table, name, columns):
+    """Create an index unless it already exists"""
+    try:
+        cursor.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+    except mysql.connector.Error as err:
+        if err.errno != 1061:  # ER_DUP_KEYNAME
+            raise
+
+def ensure_version_column(cursor, table):
+    """Make sure updated_at exists and is microsecond-precise so it can back strong ETags"""
+    cursor.execute(
+        '''SELECT DATETIME_PRECISION FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s''',
+        (table, 'updated_at')
+    )
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute(f'''ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP(6)
+                           DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)''')
+    elif row[0] != 6:
+        cursor.execute(f'''ALTER TABLE {table} MODIFY updated_at TIMESTAMP(6)
+                           DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)''')
+
+def ensure_not_null(cursor, table, column, definition, fill):
+    """Backfill NULLs with fill and redefine the column NOT NULL; keyset cursors skip NULL rows"""
+    cursor.execute(
+        '''SELECT IS_NULLABLE FROM information_schema.COLUMNS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s''',
+        (table, column)
+    )
+    row = cursor.fetchone()
+    if row is not None and row[0] == 'YES':
+        cursor.execute(f'UPDATE {table} SET {column} = {fill} WHERE {column} IS NULL')
+        cursor.execute(f'ALTER TABLE {table} MODIFY {column} {definition}')
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+def is_not_modified(etag, last_modified):
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against a version"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        since = request.if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+def not_modified_response(etag, last_modified):
+    return with_validators(app.response_class(status=304), etag, last_modified)
+
 def init_db():
     """Initialize database tables"""
     try:
@@ -42,10 +108,31 @@ def init_db():
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 name VARCHAR(100) NOT NULL,
                 email VARCHAR(100) UNIQUE NOT NULL,
-                cash_balance DECIMAL(10,2) DEFAULT 0.00,
+                cash_balance DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+            )
+        ''')
+        
+        ensure_version_column(cursor, 'users')
+        ensure_index(cursor, 'users', 'idx_users_updated_at', 'updated_at')
+        # Keyset orderings of the metrics detail views
+        ensure_not_null(cursor, 'users', 'cash_balance', 'DECIMAL(10,2) NOT NULL DEFAULT 0.00', '0.00')
+        ensure_not_null(cursor, 'users', 'created_at', 'TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP',
+                        'CURRENT_TIMESTAMP')
+        ensure_index(cursor, 'users', 'idx_users_created_id', 'created_at, id')
+        ensure_index(cursor, 'users', 'idx_users_balance_id', 'cash_balance, id')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS balance_adjustments (
+                idempotency_key VARCHAR(100) PRIMARY KEY,
+                user_id INT NOT NULL,
+                delta DECIMAL(10,2) NOT NULL,
+                balance_after DECIMAL(10,2),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        ensure_index(cursor, 'balance_adjustments', 'idx_balance_adjustments_created', 'created_at')
         
         conn.commit()
         cursor.close()
@@ -54,6 +141,18 @@ def init_db():
     except Exception as e:
         print(f"Error initializing database: {e}")
 
+def prune_balance_adjustments(conn, cursor):
+    """Opportunistic, bounded pruning of idempotency records past the retention window"""
+    try:
+        cursor.execute(
+            'DELETE FROM balance_adjustments WHERE created_at < NOW() - INTERVAL %s DAY LIMIT 1000',
+            (BALANCE_ADJUSTMENT_RETENTION_DAYS,)
+        )
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Pruning balance adjustments failed: {err}")
+
 @app.route('/')
 def index():
     return redirect(url_for('list_users'))
@@ -171,14 +270,59 @@ def delete_user(user_id):
 # API Endpoints
 @app.route('/api/users', methods=['GET'])
 def api_get_users():
+    if wants_stream():
+        try:
+            return stream_query(get_db_connection(), 'SELECT id, name, email, cash_balance FROM users ORDER BY id')
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
+
+        # Collection version: any insert, update or delete changes the count or the newest updated_at
+        cursor.execute('SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM users')
+        version = cursor.fetchone()
+        etag = make_etag('users', version['total'], version['last_modified'])
+        if is_not_modified(etag, version['last_modified']):
+            cursor.close()
+            conn.close()
+            return not_modified_response(etag, version['last_modified'])
+
         cursor.execute('SELECT id, name, email, cash_balance FROM users')
         users = cursor.fetchall()
         cursor.close()
         conn.close()
-        return jsonify(users)
+        return with_validators(jsonify(users), etag, version['last_modified'])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/users/batch', methods=['GET'])
+def api_get_users_batch():
+    """Fetch many users in one query: ?ids=1,2,3"""
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+    if not ids:
+        return jsonify({'error': 'No ids provided'}), 400
+    if len(ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} ids per request'}), 400
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f'SELECT id, name, email, cash_balance FROM users WHERE id IN ({placeholders})', ids)
+        users = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+        found = {u['id'] for u in users}
+        return jsonify({
+            'users': users,
+            'not_found': [i for i in ids if i not in found]
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -187,13 +331,25 @@ def api_get_user(user_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT id, name, email, cash_balance FROM users WHERE id = %s', (user_id,))
+        if request.if_none_match or request.if_modified_since:
+            cursor.execute('SELECT updated_at FROM users WHERE id = %s', (user_id,))
+            version = cursor.fetchone()
+            if version:
+                etag = make_etag('user', user_id, version['updated_at'].isoformat())
+                if is_not_modified(etag, version['updated_at']):
+                    cursor.close()
+                    conn.close()
+                    return not_modified_response(etag, version['updated_at'])
+
+        cursor.execute('SELECT id, name, email, cash_balance, updated_at FROM users WHERE id = %s', (user_id,))
         user = cursor.fetchone()
         cursor.close()
         conn.close()
         
         if user:
-            return jsonify(user)
+            last_modified = user.pop('updated_at')
+            etag = make_etag('user', user_id, last_modified.isoformat())
+            return with_validators(jsonify(user), etag, last_modified)
         return jsonify({'error': 'User not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -288,6 +444,87 @@ def api_delete_user(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/users/<int:user_id>/balance/adjust', methods=['POST'])
+def api_adjust_balance(user_id):
+    """Atomically add `delta` (negative to debit) to a user's balance
+
+    Retries carrying the same Idempotency-Key header (or `idempotency_key`
+    field) replay the original result instead of applying the delta again.
+    """
+    try:
+        data = request.get_json()
+        if not data or 'delta' not in data:
+            return jsonify({'error': 'Missing required field: delta'}), 400
+        delta = Decimal(str(data['delta'])).quantize(Decimal('0.01'))
+        # A zero delta leaves the row unchanged, which MySQL reports as 0 affected rows
+        if delta == 0:
+            return jsonify({'error': 'delta must be non-zero'}), 400
+        key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    except (InvalidOperation, ValueError, TypeError):
+        return jsonify({'error': 'Invalid delta format'}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        conn.start_transaction()
+
+        if key:
+            try:
+                cursor.execute(
+                    'INSERT INTO balance_adjustments (idempotency_key, user_id, delta) VALUES (%s, %s, %s)',
+                    (key, user_id, delta)
+                )
+            except mysql.connector.Error as err:
+                if err.errno != 1062:
+                    raise
+                conn.rollback()
+                cursor.execute(
+                    'SELECT user_id, delta, balance_after FROM balance_adjustments WHERE idempotency_key = %s',
+                    (key,)
+                )
+                previous = cursor.fetchone()
+                cursor.close()
+                conn.close()
+                if previous['user_id'] != user_id or previous['delta'] != delta:
+                    return jsonify({'error': 'Idempotency key reused with different parameters'}), 422
+                return jsonify({'id': user_id, 'cash_balance': previous['balance_after'], 'replayed': True})
+
+        cursor.execute(
+            'UPDATE users SET cash_balance = cash_balance + %s WHERE id = %s AND cash_balance + %s >= 0',
+            (delta, user_id, delta)
+        )
+        if cursor.rowcount != 1:
+            cursor.execute('SELECT cash_balance FROM users WHERE id = %s', (user_id,))
+            row = cursor.fetchone()
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            if not row:
+                return jsonify({'error': 'User not found'}), 404
+            return jsonify({'error': 'Insufficient balance', 'cash_balance': row['cash_balance']}), 409
+
+        cursor.execute('SELECT cash_balance FROM users WHERE id = %s', (user_id,))
+        balance = cursor.fetchone()['cash_balance']
+        if key:
+            cursor.execute(
+                'UPDATE balance_adjustments SET balance_after = %s WHERE idempotency_key = %s',
+                (balance, key)
+            )
+        conn.commit()
+        if key:
+            prune_balance_adjustments(conn, cursor)
+        cursor.close()
+        conn.close()
+
+        return jsonify({'id': user_id, 'cash_balance': balance, 'replayed': False})
+
+    except Exception as e:
+        if conn is not None and conn.is_connected():
+            conn.rollback()
+            conn.close()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health')
 def health_check():
     try:
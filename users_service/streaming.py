@@ -0,0 +1,116 @@
+"""Streaming NDJSON/CSV responses for large listings.
+
+Rows are read from an unbuffered cursor in chunks and written out as they
+arrive, so memory stays flat whatever the size of the result. Keep the
+copies of this file in each service identical.
+"""
+import csv
+import heapq
+import io
+import itertools
+import os
+from operator import itemgetter
+
+import mysql.connector
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CSV_MIMETYPE = 'text/csv'
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 1000))
+
+
+def wants_stream():
+    """True for ?stream=1 or an Accept header that explicitly names NDJSON"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return any(value == NDJSON_MIMETYPE for value, _ in request.accept_mimetypes)
+
+
+def _csv_chunk(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def stream_query(conn, sql, params=(), chunk_size=STREAM_CHUNK_SIZE, fmt='ndjson'):
+    """NDJSON (or, with fmt='csv', CSV with a header row) response for a query
+
+    Takes ownership of conn and closes it when done. The query is executed
+    before the response starts, so SQL errors still surface to the caller
+    as an ordinary error response.
+    """
+    return stream_merged([(conn, sql, params)], chunk_size=chunk_size, fmt=fmt)
+
+
+def _drop(conn):
+    try:
+        getattr(conn, 'discard', conn.close)()
+    except mysql.connector.Error:
+        pass
+
+
+def stream_merged(queries, order=(), descending=False, chunk_size=STREAM_CHUNK_SIZE, fmt='ndjson',
+                  max_rows=None):
+    """Like stream_query for [(conn, sql, params), ...], merged into one response on `order`
+
+    Each query runs on its own connection and must return the same columns
+    sorted by the `order` columns (descending if so flagged), e.g. a hot table
+    and its archive each read along an index. Rows are interleaved as they
+    arrive, so the server never sorts the combined result. With max_rows the
+    response stops after that many rows.
+    """
+    cursors = []
+    try:
+        for conn, sql, params in queries:
+            cursors.append(conn.cursor(dictionary=(fmt != 'csv'), buffered=False))
+            cursors[-1].execute(sql, params)
+    except Exception:
+        for conn, _, _ in queries:
+            _drop(conn)
+        raise
+    dumps = current_app.json.dumps
+    exhausted = set()
+
+    def read(index):
+        while True:
+            rows = cursors[index].fetchmany(chunk_size)
+            if not rows:
+                exhausted.add(index)
+                return
+            yield from rows
+
+    if len(cursors) == 1:
+        rows = read(0)
+    else:
+        columns = order if fmt != 'csv' else [cursors[0].column_names.index(column) for column in order]
+        rows = heapq.merge(*(read(i) for i in range(len(cursors))), key=itemgetter(*columns), reverse=descending)
+    if max_rows is not None:
+        rows = itertools.islice(rows, max_rows)
+
+    def generate():
+        try:
+            if fmt == 'csv':
+                yield _csv_chunk([], header=cursors[0].column_names)
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                if fmt == 'csv':
+                    yield _csv_chunk(chunk)
+                else:
+                    yield ''.join(dumps(row) + '\n' for row in chunk)
+        finally:
+            for index, (conn, _, _) in enumerate(queries):
+                if index in exhausted:
+                    cursors[index].close()
+                    conn.close()
+                else:
+                    # The client went away mid-stream (or max_rows cut it short); the unread
+                    # remainder of the result set leaves the connection unusable, so drop it
+                    _drop(conn)
+
+    mimetype = CSV_MIMETYPE if fmt == 'csv' else NDJSON_MIMETYPE
+    return Response(stream_with_context(generate()), mimetype=mimetype)